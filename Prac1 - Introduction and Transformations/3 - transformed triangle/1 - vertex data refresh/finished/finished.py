@@ -91,8 +91,7 @@ class App:
             )
             
             self.triangle_mesh.build_vertices(model_transform)
-            glBindVertexArray(self.triangle_mesh.vao)
-            glDrawArrays(GL_TRIANGLES, 0, self.triangle_mesh.vertex_count)
+            self.triangle_mesh.draw()
 
             pg.display.flip()
 
@@ -124,9 +123,10 @@ class TriangleMesh:
         self.vertex_count = 3
 
         self.vao = glGenVertexArrays(1)
-        self.vbo = glGenBuffers(1)
-
-        self.build_vertices(pyrr.matrix44.create_identity(dtype=np.float32))
+        glBindVertexArray(self.vao)
+        #rewritten every frame, (x y z r g b) per vertex
+        self.vertex_buffer = DynamicBuffer(
+            GL_ARRAY_BUFFER, 24 * self.vertex_count, alignment = 24)
 
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(0))
@@ -137,29 +137,137 @@ class TriangleMesh:
     def build_vertices(self, transform: np.ndarray) -> None:
         """
             Builds the mesh's vertices by applying the given transform
-            to its original data, then uploads the transformed mesh
-            data to its buffer.
+            to its original data, writing the transformed mesh data
+            straight into its buffer.
         """
 
-        self.vertices = np.array([],dtype=np.float32)
+        self.vertices = np.reshape(
+            self.vertex_buffer.map(), (self.vertex_count, 6))
 
-        for i in range(self.vertex_count):
+        self.vertices[:, 0:3] = pyrr.matrix44.multiply(
+            m1 = np.array(self.originalPositions),
+            m2 = transform
+        )[:, 0:3]
+        self.vertices[:, 3:6] = self.originalColors
 
-            transformed_position = pyrr.matrix44.multiply(
-                m1 = self.originalPositions[i],
-                m2 = transform
-            )
-            self.vertices = np.append(self.vertices, transformed_position[0:3])
-            self.vertices = np.append(self.vertices, self.originalColors[i])
+        self.vertex_buffer.flush()
+    
+    def draw(self) -> None:
+        """
+            Draws the vertices last built, then moves on to a fresh copy
+            of the buffer for the next frame's.
+        """
 
         glBindVertexArray(self.vao)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
+        glDrawArrays(
+            GL_TRIANGLES, self.vertex_buffer.offset() // 24, self.vertex_count)
+        self.vertex_buffer.fence()
 
     def destroy(self) -> None:
         
         glDeleteVertexArrays(1, (self.vao,))
-        glDeleteBuffers(1,(self.vbo,))
+        self.vertex_buffer.destroy()
+
+class DynamicBuffer:
+    """
+        A buffer the CPU rewrites every frame, without waiting on the
+        GPU to finish with what it held the frame before.
+
+        The buffer is split into segments which are written in turn. The
+        CPU writes straight into a numpy view of the current segment
+        while the GPU may still be reading the others. A fence placed
+        after the segment's last use is waited on before it's written again.
+
+        Where the context has buffer storage (OpenGL 4.4), the buffer is
+        mapped once, persistently and coherently, and the view is of the
+        mapping itself. Otherwise the view is of a copy, uploaded by flush.
+    """
+
+
+    def __init__(
+        self, target: int, size: int, segments: int = 3, alignment: int = 1):
+
+        self.target = target
+        self.size = size
+        self.segments = segments
+        #segments start on a multiple of alignment bytes, eg. a vertex's size
+        self.segment_size = -(-size // alignment) * alignment
+        total_size = self.segments * self.segment_size
+
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(target, self.vbo)
+        self.persistent = bool(glBufferStorage)
+        if self.persistent:
+            flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+            glBufferStorage(target, total_size, None, flags)
+            address = glMapBufferRange(target, 0, total_size, flags)
+            self.memory = np.ctypeslib.as_array(
+                ctypes.cast(address, ctypes.POINTER(ctypes.c_ubyte)),
+                shape = (total_size,))
+        else:
+            glBufferData(target, total_size, None, GL_STREAM_DRAW)
+            self.memory = np.zeros(total_size, dtype=np.uint8)
+
+        self.fences = [None] * segments
+        self.segment = 0
+    
+    def offset(self) -> int:
+        """ Returns the offset in bytes of the current segment. """
+
+        return self.segment * self.segment_size
+    
+    def map(self, dtype = np.float32) -> np.ndarray:
+        """
+            Waits until the GPU has finished with the current segment,
+            then returns a view of it to write this frame's data into.
+        """
+
+        fence = self.fences[self.segment]
+        if fence is not None:
+            #flush the fence itself, so it can't wait on commands still held back
+            while glClientWaitSync(
+                fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000) == GL_TIMEOUT_EXPIRED:
+                pass
+            glDeleteSync(fence)
+            self.fences[self.segment] = None
+
+        offset = self.offset()
+        return self.memory[offset : offset + self.size].view(dtype)
+    
+    def flush(self) -> None:
+        """
+            Makes this frame's writes visible to the GPU. A coherent
+            mapping needs nothing, otherwise the segment is uploaded.
+        """
+
+        if self.persistent:
+            return
+
+        offset = self.offset()
+        glBindBuffer(self.target, self.vbo)
+        glBufferSubData(
+            self.target, offset, self.size, self.memory[offset : offset + self.size])
+    
+    def fence(self) -> None:
+        """
+            Marks the end of the commands reading the current segment,
+            and moves on to the next.
+        """
+
+        self.fences[self.segment] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.segment = (self.segment + 1) % self.segments
+    
+    def destroy(self) -> None:
+
+        for fence in self.fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        #views of the mapping must not outlive it
+        self.memory = None
+        if self.persistent:
+            glBindBuffer(self.target, self.vbo)
+            glUnmapBuffer(self.target)
+        glDeleteBuffers(1, (self.vbo,))
 
 if __name__ == "__main__":
 
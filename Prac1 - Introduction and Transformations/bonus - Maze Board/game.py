@@ -4,6 +4,27 @@ from OpenGL.GL.shaders import compileProgram,compileShader
 import numpy as np
 import pyrr
 import math
+import os
+import tempfile
+import warnings
+import glob
+
+MESH_CACHE_EXTENSION = ".mesh"
+MESH_CACHE_MAGIC = b"MESH"
+MESH_CACHE_VERSION = 1
+MESH_CACHE_MAX_ATTRIBUTES = 8
+
+#fixed size header at the front of every cache file,
+#the float32 vertex data follows straight after it
+MESH_CACHE_HEADER = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u4"),
+    ("source_size", "<u8"),
+    ("source_mtime", "<i8"),
+    ("vertex_count", "<u8"),
+    ("attribute_count", "<u4"),
+    ("layout", "<u4", (MESH_CACHE_MAX_ATTRIBUTES,)),
+])
 
 def createShader(vertexFilepath, fragmentFilepath):
     """
@@ -31,6 +52,256 @@ def createShader(vertexFilepath, fragmentFilepath):
     
     return shader
 
+def load_cached_mesh(filename: str, layout: tuple[int], loader) -> np.ndarray:
+    """
+        Return the flat float32 vertex buffer for the given obj file,
+        reading it from the cache where possible.
+
+        The first load parses the file with the given loader and writes
+        the result next to it. Later loads memory map the cache file, so
+        the array can be handed straight to glBufferData. The cache is
+        rebuilt whenever the size or modification time of the obj file
+        no longer matches the one it was built from.
+
+        Parameters:
+
+            filename: filepath to the obj file
+
+            layout: the number of floats in each vertex attribute,
+                eg. (3, 2, 3) for position, texcoord, normal
+
+            loader: function taking the filename and returning the
+                flat vertex buffer, only called on a cache miss
+
+        Returns:
+
+            A read only float32 array of the vertex data.
+    """
+
+    vertices = read_mesh_cache(filename, layout)
+    if vertices is None:
+        vertices = np.ascontiguousarray(loader(filename), dtype=np.float32)
+        write_mesh_cache(filename, layout, vertices)
+    return vertices
+
+def get_mesh_cache_path(filename: str, layout: tuple[int]) -> str:
+    """
+        Each layout gets its own cache file, so different loaders
+        can share an obj file without rebuilding each other's caches.
+    """
+
+    layout_name = "_".join(str(size) for size in layout)
+    return f"{filename}.{layout_name}{MESH_CACHE_EXTENSION}"
+
+def make_mesh_cache_header(
+    filename: str, layout: tuple[int], vertex_count: int) -> np.ndarray:
+    """ Describe the given obj file and layout as a cache header. """
+
+    source = os.stat(filename)
+    header = np.zeros(1, dtype=MESH_CACHE_HEADER)
+    header["magic"] = MESH_CACHE_MAGIC
+    header["version"] = MESH_CACHE_VERSION
+    header["source_size"] = source.st_size
+    header["source_mtime"] = source.st_mtime_ns
+    header["vertex_count"] = vertex_count
+    header["attribute_count"] = len(layout)
+    header["layout"][0, :len(layout)] = layout
+    return header
+
+def read_mesh_cache(filename: str, layout: tuple[int]) -> np.ndarray | None:
+    """
+        Memory map the cached vertex data for the given obj file,
+        returns None if there's no cache or it's out of date.
+    """
+
+    cache_path = get_mesh_cache_path(filename, layout)
+    if not os.path.exists(cache_path) \
+        or os.path.getsize(cache_path) < MESH_CACHE_HEADER.itemsize:
+        return None
+
+    header = np.fromfile(cache_path, dtype=MESH_CACHE_HEADER, count=1)
+    expected = make_mesh_cache_header(filename, layout, header["vertex_count"][0])
+    if header.tobytes() != expected.tobytes():
+        return None
+
+    float_count = int(header["vertex_count"][0]) * sum(layout)
+    if os.path.getsize(cache_path) != MESH_CACHE_HEADER.itemsize + 4 * float_count:
+        return None
+    if float_count == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    return np.memmap(
+        cache_path, dtype=np.float32, mode="r",
+        offset=MESH_CACHE_HEADER.itemsize, shape=(float_count,))
+
+def write_mesh_cache(
+    filename: str, layout: tuple[int], vertices: np.ndarray) -> None:
+    """
+        Write the given vertex data to the obj file's cache, going
+        through a temporary file so a half written cache is never read.
+        If the cache can't be written, it's skipped with a warning.
+    """
+
+    cache_path = get_mesh_cache_path(filename, layout)
+    header = make_mesh_cache_header(filename, layout, len(vertices) // sum(layout))
+
+    temp_path = None
+    try:
+        #a uniquely named temporary file, so loaders writing the
+        #same cache at once don't clobber each other's
+        with tempfile.NamedTemporaryFile(
+            dir = os.path.dirname(cache_path) or ".", 
+            prefix = os.path.basename(cache_path), suffix = ".tmp",
+            delete = False) as f:
+            temp_path = f.name
+            f.write(header.tobytes())
+            f.write(vertices.tobytes())
+        os.replace(temp_path, cache_path)
+    except OSError as error:
+        #the data in hand is still good, it just won't be cached
+        warnings.warn(f"Couldn't write cache {cache_path}: {error}")
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def prewarm_mesh_cache(folderpath: str, layout: tuple[int], loader) -> int:
+    """
+        Make sure every obj file in the given folder has an up to date
+        cache, returns how many had to be rebuilt.
+    """
+
+    rebuilt = 0
+    for filename in sorted(glob.glob(f"{folderpath}/*.obj")):
+        if read_mesh_cache(filename, layout) is None:
+            load_cached_mesh(filename, layout, loader)
+            rebuilt += 1
+    return rebuilt
+
+def make_model_transforms(
+    positions: np.ndarray, eulers: np.ndarray, 
+    scales: np.ndarray | float = 1.0) -> np.ndarray:
+    """
+        Build the model transforms of many objects at once.
+
+        Each is the matrix pyrr gives for a scale, then rotations about
+        x, y and z, then a translation, multiplied in that order. Written
+        out in closed form, a whole batch takes a handful of array
+        operations rather than several matrices per object.
+
+        Parameters:
+
+            positions: (N,3) positions
+
+            eulers: (N,3) angles in degrees about the x, y and z axes
+
+            scales: scale along each axis, shared or (N,3)
+        
+        Returns:
+
+            (N,4,4) float32 transforms, ready to upload.
+    """
+
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+    angles = np.radians(np.asarray(eulers, dtype=np.float32).reshape(-1, 3))
+    (sx, sy, sz) = np.sin(angles).T
+    (cx, cy, cz) = np.cos(angles).T
+
+    transforms = np.empty((len(positions), 4, 4), dtype=np.float32)
+    transforms[:, 0, 0] = cy * cz
+    transforms[:, 0, 1] = -cy * sz
+    transforms[:, 0, 2] = sy
+    transforms[:, 1, 0] = sx * sy * cz + cx * sz
+    transforms[:, 1, 1] = cx * cz - sx * sy * sz
+    transforms[:, 1, 2] = -sx * cy
+    transforms[:, 2, 0] = sx * sz - cx * sy * cz
+    transforms[:, 2, 1] = cx * sy * sz + sx * cz
+    transforms[:, 2, 2] = cx * cy
+    #scaling first scales the rows of the rotation
+    transforms[:, 0:3, 0:3] *= np.broadcast_to(scales, positions.shape)[:, :, np.newaxis]
+    transforms[:, 0:3, 3] = 0
+    transforms[:, 3, 0:3] = positions
+    transforms[:, 3, 3] = 1
+    return transforms
+
+class TransformCounter:
+    """
+        Counts the matrices built, and the rebuilds skipped because
+        nothing they depend on had changed, over each frame.
+    """
+
+
+    def __init__(self):
+
+        self.built = 0
+        self.skipped = 0
+
+        #the counts of the last finished frame
+        self.built_last_frame = 0
+        self.skipped_last_frame = 0
+    
+    def end_frame(self) -> None:
+
+        self.built_last_frame = self.built
+        self.skipped_last_frame = self.skipped
+        self.built = 0
+        self.skipped = 0
+
+transform_counter = TransformCounter()
+
+class CachedTransforms:
+    """
+        Model transforms kept between frames, along with the positions
+        and eulers they were built from. Each frame only the transforms
+        whose state has changed are rebuilt, or all of them if the
+        parent transform carrying them has been rebuilt.
+    """
+
+
+    def __init__(self):
+
+        self.states = None
+        self.transforms = None
+        #bumped on every rebuild, so that children know to follow
+        self.version = 0
+        self.parent_version = None
+    
+    def get(
+        self, positions: np.ndarray, eulers: np.ndarray, 
+        parent: "CachedTransforms" = None) -> np.ndarray:
+        """
+            Return the (N,4,4) transforms of objects with the given
+            (N,3) positions and eulers, carried by the parent's first
+            transform if one is given.
+        """
+
+        states = np.hstack((
+            np.reshape(positions, (-1, 3)), np.reshape(eulers, (-1, 3))
+        )).astype(np.float32)
+        parent_version = None if parent is None else parent.version
+
+        if self.states is None or len(states) != len(self.states) \
+            or parent_version != self.parent_version:
+            dirty = np.ones(len(states), dtype=bool)
+        else:
+            dirty = np.any(states != self.states, axis = 1)
+        
+        built = int(np.count_nonzero(dirty))
+        transform_counter.built += built
+        transform_counter.skipped += len(states) - built
+        if built == 0:
+            return self.transforms
+
+        transforms = make_model_transforms(states[dirty, 0:3], states[dirty, 3:6])
+        if parent is not None:
+            transforms = transforms @ parent.transforms[0]
+        if built == len(states):
+            self.transforms = transforms
+        else:
+            self.transforms[dirty] = transforms
+        self.states = states
+        self.parent_version = parent_version
+        self.version += 1
+        return self.transforms
+
 class Entity:
     """ A basic entity in the game, anything with position and rotation """
 
@@ -39,41 +310,15 @@ class Entity:
 
         self.position = np.array(position, dtype=np.float32)
         self.eulers = np.array(eulers, dtype=np.float32)
+        self.transform = CachedTransforms()
     
-    def make_transform(self, parent_transform: np.ndarray) -> np.ndarray:
-        
-        model_transform = pyrr.matrix44.create_identity(np.float32)
-
-        model_transform = pyrr.matrix44.multiply(
-            m1 = model_transform,
-            m2 = pyrr.matrix44.create_from_x_rotation(
-                theta = np.radians(self.eulers[0]),
-                dtype = np.float32
-            )
-        )
-
-        model_transform = pyrr.matrix44.multiply(
-            m1 = model_transform,
-            m2 = pyrr.matrix44.create_from_y_rotation(
-                theta = np.radians(self.eulers[1]),
-                dtype = np.float32
-            )
-        )
-
-        model_transform = pyrr.matrix44.multiply(
-            m1 = model_transform,
-            m2 = pyrr.matrix44.create_from_translation(
-                vec = self.position,
-                dtype = np.float32
-            )
-        )
-
-        model_transform = pyrr.matrix44.multiply(
-            m1 = model_transform,
-            m2 = parent_transform
-        )
+    def make_transform(self, parent: CachedTransforms = None) -> np.ndarray:
+        """
+            Return the entity's transform, carried by its parent's. It's
+            only rebuilt when the entity or its parent has moved.
+        """
 
-        return model_transform
+        return self.transform.get(self.position, self.eulers, parent)[0]
 
 class Board(Entity):
 
@@ -97,6 +342,8 @@ class Board(Entity):
         ]
 
         self.pieces: list[Entity] = []
+        #the pieces' transforms, rebuilt together when the board tilts
+        self.piece_transforms = CachedTransforms()
         self.ball: Ball = None
         for row, row_contents in enumerate(self.layout):
             for col, flag in enumerate(row_contents):
@@ -196,6 +443,7 @@ class App:
                                     pg.GL_CONTEXT_PROFILE_CORE)
         pg.display.set_mode((640,480), pg.OPENGL|pg.DOUBLEBUF)
         self.clock = pg.time.Clock()
+        self.skipped_shown = None
 
     def make_assets(self) -> None:
         """ Create any assets which will be used by the game. """
@@ -303,16 +551,17 @@ class App:
             glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
             glUseProgram(self.shaders["textured"])
-            board_transform = self.draw_board()
-            self.draw_pieces(board_transform)
+            self.draw_board()
+            self.draw_pieces()
             
             glUseProgram(self.shaders["colored"])
-            self.draw_ball(board_transform)
+            self.draw_ball()
 
             pg.display.flip()
 
             #timing
             self.clock.tick(60)
+            self.show_transform_count()
         self.quit()
     
     def handle_keys(self) -> None:
@@ -329,38 +578,50 @@ class App:
         if keys[pg.K_DOWN]:
             tiltAmount[0] = -0.4
         self.board.tilt(tiltAmount)
+    
+    def show_transform_count(self) -> None:
+        """ Finish the frame's transform count, and show it in the title. """
+
+        skipped = transform_counter.skipped
+        transform_counter.end_frame()
+        if skipped != self.skipped_shown:
+            pg.display.set_caption(f"{skipped} transform builds skipped")
+            self.skipped_shown = skipped
 
-    def draw_board(self) -> np.ndarray:
+    def draw_board(self) -> None:
         """ 
-            Draw the board and return its transform so that objects further down in the
-            hierarchy can use it.
+            Draw the board. Its transform is kept for objects further
+            down in the hierarchy to use.
         """
 
-        board_transform = self.board.make_transform(
-            parent_transform = pyrr.matrix44.create_identity(dtype = np.float32)
-        )
+        board_transform = self.board.make_transform()
         glUniformMatrix4fv(self.modelLocations["textured"],1,GL_FALSE,board_transform)
         self.board_texture.use()
         glBindVertexArray(self.board_mesh.vao)
         glDrawArrays(GL_TRIANGLES, 0, self.board_mesh.vertex_count)
 
-        return board_transform
-
-    def draw_pieces(self, board_transform: np.ndarray) -> None:
+    def draw_pieces(self) -> None:
         """
             Draw the pieces on the board
         """
 
+        #every piece is carried by the board
+        transforms = self.board.piece_transforms.get(
+            [piece.position for piece in self.board.pieces],
+            [piece.eulers for piece in self.board.pieces],
+            parent = self.board.transform
+        )
+
         self.piece_texture.use()
         glBindVertexArray(self.piece_mesh.vao)
-        for piece in self.board.pieces:
+        for transform in transforms:
             glUniformMatrix4fv(
                 self.modelLocations["textured"],1,GL_FALSE,
-                piece.make_transform(parent_transform = board_transform)
+                transform
             )
             glDrawArrays(GL_TRIANGLES, 0, self.piece_mesh.vertex_count)
 
-    def draw_ball(self, board_transform: np.ndarray) -> None:
+    def draw_ball(self) -> None:
         """
             Draw the ball on the board.
         """
@@ -368,7 +629,7 @@ class App:
         glBindVertexArray(self.ball_mesh.vao)
         glUniformMatrix4fv(
             self.modelLocations["colored"], 1, GL_FALSE,
-            self.board.ball.make_transform(parent_transform = board_transform)
+            self.board.ball.make_transform(parent = self.board.transform)
         )
         glUniform3fv(self.colorLocation, 1, self.board.ball.color)
         glDrawArrays(GL_TRIANGLES, 0, self.ball_mesh.vertex_count)
@@ -393,13 +654,8 @@ class Mesh:
         """ Load the given file, create a buffer and upload to it. """
 
         # x, y, z, s, t, nx, ny, nz
-        self.v = []
-        self.vt = []
-        self.vn = []
-        self.vertices = []
-        self.loadMesh(filename)
+        self.vertices = load_cached_mesh(filename, (3, 2, 3), self.read_obj)
         self.vertex_count = len(self.vertices)//8
-        self.vertices = np.array(self.vertices, dtype=np.float32)
 
         self.vao = glGenVertexArrays(1)
         glBindVertexArray(self.vao)
@@ -418,6 +674,16 @@ class Mesh:
         glEnableVertexAttribArray(2)
         glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
     
+    def read_obj(self, filename) -> list[float]:
+        """ Parse the given obj file, only needed when its mesh cache is stale. """
+
+        self.v = []
+        self.vt = []
+        self.vn = []
+        self.vertices = []
+        self.loadMesh(filename)
+        return self.vertices
+
     def loadMesh(self, filename):
 
         #open the obj file and read the data
@@ -3,6 +3,31 @@ from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram,compileShader
 import numpy as np
 import pyrr
+import collections
+import concurrent.futures
+import os
+import sys
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+
+#shared memory blocks a loading worker has created. Windows frees a block
+#as soon as its last handle closes, so workers hold theirs until they exit
+worker_blocks = []
+
+#bytes of GPU memory that assets nobody is using may keep holding,
+#in case they're asked for again
+UNUSED_ASSET_BUDGET = 64 * 1024 * 1024
+
+#bytes of GPU memory the program should stay within, a summary of
+#what's using it is printed if it goes over
+GPU_MEMORY_BUDGET = 256 * 1024 * 1024
+
+#print what the assets hold in GPU memory once they're made
+REPORT_ASSET_MEMORY = False
+
+#lookup table for the obj parser, indexed by byte value
+IS_WHITESPACE = np.zeros(256, dtype=bool)
+IS_WHITESPACE[[ord(c) for c in " \t\r\n"]] = True
 
 ################################## Model ######################################
 
@@ -226,6 +251,46 @@ class GameBoard:
 
 ################################## View #######################################
 
+def make_model_transforms(positions, eulers, scales = 1.0):
+    """
+        Build the model transforms of many objects at once.
+
+        Each is the matrix pyrr gives for a scale, then rotations about
+        x, y and z, then a translation, multiplied in that order. Written
+        out in closed form, a whole batch takes a handful of array
+        operations rather than several matrices per object.
+
+            Parameters:
+                positions (array): (N,3) positions
+                eulers (array): (N,3) angles in degrees about the x, y and z axes
+                scales (array or float): scale along each axis, shared or (N,3)
+
+            Returns:
+                (N,4,4) float32 transforms, ready to upload.
+    """
+
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+    angles = np.radians(np.asarray(eulers, dtype=np.float32).reshape(-1, 3))
+    (sx, sy, sz) = np.sin(angles).T
+    (cx, cy, cz) = np.cos(angles).T
+
+    transforms = np.empty((len(positions), 4, 4), dtype=np.float32)
+    transforms[:, 0, 0] = cy * cz
+    transforms[:, 0, 1] = -cy * sz
+    transforms[:, 0, 2] = sy
+    transforms[:, 1, 0] = sx * sy * cz + cx * sz
+    transforms[:, 1, 1] = cx * cz - sx * sy * sz
+    transforms[:, 1, 2] = -sx * cy
+    transforms[:, 2, 0] = sx * sz - cx * sy * cz
+    transforms[:, 2, 1] = cx * sy * sz + sx * cz
+    transforms[:, 2, 2] = cx * cy
+    #scaling first scales the rows of the rotation
+    transforms[:, 0:3, 0:3] *= np.broadcast_to(scales, positions.shape)[:, :, np.newaxis]
+    transforms[:, 0:3, 3] = 0
+    transforms[:, 3, 0:3] = positions
+    transforms[:, 3, 3] = 1
+    return transforms
+
 def groundZ(i,j,size):
 
     return 0
@@ -244,101 +309,551 @@ def mountainZ(i,j, size):
 
     return np.sqrt(z_i * z_j)
 
+def load_models_in_parallel(filepaths, loader, make_model):
+    """
+        Parse the given obj files at once in a process pool, then build
+        a model from each here on the thread which owns the GL context.
+
+            Parameters:
+                filepaths (list): obj files to read
+                loader (function): module level function taking a filepath
+                    and returning its vertex data as an array
+                make_model (function): takes the index of a file and its
+                    vertex data and returns the model, the data is only
+                    valid for the duration of the call
+            
+            Returns:
+                The models, in the same order as filepaths
+    """
+
+    #share the parent's resource tracker, otherwise each worker would
+    #clean up its shared memory blocks when it exits
+    if os.name == "posix":
+        resource_tracker.ensure_running()
+
+    #a file asked for more than once is only parsed once
+    models = [None] * len(filepaths)
+    with concurrent.futures.ProcessPoolExecutor() as pool:
+        futures = {
+            filepath: pool.submit(parse_into_shared_memory, loader, filepath)
+            for filepath in dict.fromkeys(filepaths)
+        }
+        for filepath, future in futures.items():
+            name, shape, dtype = future.result()
+            block = shared_memory.SharedMemory(name = name)
+            try:
+                vertices = np.ndarray(shape, dtype = dtype, buffer = block.buf)
+                for i in range(len(filepaths)):
+                    if filepaths[i] == filepath:
+                        models[i] = make_model(i, vertices)
+                del vertices
+            finally:
+                block.close()
+                block.unlink()
+    return models
+
+def parse_into_shared_memory(loader, filepath):
+    """
+        Runs in a loading worker, parses the file and copies the result
+        into a new shared memory block for load_models_in_parallel.
+
+            Returns:
+                (name, shape, dtype) describing the block
+    """
+
+    vertices = np.ascontiguousarray(loader(filepath))
+
+    #shared memory blocks can't be empty
+    block = shared_memory.SharedMemory(create = True, size = max(1, vertices.nbytes))
+    np.ndarray(vertices.shape, dtype = vertices.dtype, buffer = block.buf)[...] = vertices
+    worker_blocks.append(block)
+
+    return (block.name, vertices.shape, vertices.dtype.str)
+
+def read_obj_positions(filepath):
+    """
+        Read the given obj file and return the position of every
+        triangle corner, as an (n,3) array.
+
+        The whole file is treated as one byte array rather than read
+        line by line: the v and f blocks are each handed to numpy's
+        parser in a single call, and polygons are fanned into triangles
+        with index arithmetic.
+    """
+
+    text = ObjText(np.fromfile(filepath, dtype=np.uint8))
+    v = read_vertex_data(text, "v", 3)
+    v_vt_vn = read_face_data(text)
+    return v[v_vt_vn[:, 0]]
+
+class ObjText:
+    """
+        An obj file as a byte array, along with the per line
+        bookkeeping needed to pull out whole blocks at once.
+    """
+
+
+    def __init__(self, data):
+        """
+            Index the lines and tokens of the given file contents.
+
+            Parameters:
+
+                data: the raw bytes of the file, as a uint8 array
+        """
+
+        # terminate the last line, so every line ends in a newline
+        self.data = np.append(data, np.uint8(ord("\n")))
+
+        newline = self.data == ord("\n")
+        line_ends = np.flatnonzero(newline)
+        self.line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+        self.line_lengths = line_ends + 1 - self.line_starts
+
+        self.blank_comments(newline)
+
+        is_space = IS_WHITESPACE[self.data]
+        token_starts = ~is_space
+        token_starts[1:] &= is_space[:-1]
+        self.tokens_in_line = np.add.reduceat(
+            token_starts, self.line_starts, dtype=np.int64)
+
+    def blank_comments(self, newline):
+        """
+            Blank out everything from a # to the end of its line, so
+            that trailing comments don't reach numpy's parser.
+        """
+
+        is_hash = self.data == ord("#")
+        if not is_hash.any():
+            return
+
+        # a byte is commented out if a # comes before it on its line
+        hashes = np.cumsum(is_hash)
+        hashes_before_line = (hashes - is_hash)[self.line_starts]
+        line = np.cumsum(newline) - newline
+        in_comment = (hashes > hashes_before_line[line]) & ~newline
+        self.data[in_comment] = ord(" ")
+
+    def find_lines(self, flag):
+        """ Return a mask of which lines begin with the given flag. """
+
+        is_flagged = np.ones(len(self.line_starts), dtype=bool)
+        for i, character in enumerate(flag):
+            is_flagged &= self.read_column(i) == ord(character)
+        return is_flagged & IS_WHITESPACE[self.read_column(len(flag))]
+
+    def read_column(self, i):
+        """
+            Return the i'th byte of every line, short lines
+            just read their own newline.
+        """
+
+        return np.take(
+            self.data, self.line_starts + np.minimum(i, self.line_lengths - 1))
+
+    def read_block(self, lines, flag):
+        """
+            Return the text of the given lines with their flags
+            blanked out, so that only the numbers remain.
+        """
+
+        block = self.data[np.repeat(lines, self.line_lengths)]
+        line_lengths = self.line_lengths[lines]
+        flag_offsets = np.cumsum(line_lengths) - line_lengths
+        for i in range(len(flag)):
+            block[flag_offsets + i] = ord(" ")
+        return block
+
+def read_vertex_data(text, flag, size):
+    """
+        Read every line starting with the given flag, and return
+        the first size numbers of each as an (n,size) array.
+    """
+
+    lines = text.find_lines(flag)
+    if not lines.any():
+        return np.zeros((0, size), dtype=np.float32)
+
+    values = np.fromstring(
+        text.read_block(lines, flag).tobytes(), dtype=np.float32, sep=" ")
+
+    # exporters are free to add optional components (eg. vt u v w),
+    # so take the first size numbers from each line
+    numbers_in_line = text.tokens_in_line[lines] - 1
+    if (numbers_in_line == size).all():
+        return values.reshape(-1, size)
+    line_offsets = np.cumsum(numbers_in_line) - numbers_in_line
+    return values[line_offsets[:, None] + np.arange(size)]
+
+def read_face_data(text):
+    """
+        Read every face in the file and return the (v, vt, vn) index
+        triple for every corner of every triangle.
+
+        Supports the v, v/vt, v//vn and v/vt/vn corner forms, polygons
+        are unpacked as triangle fans.
+    """
+
+    lines = text.find_lines("f")
+    if not lines.any():
+        return np.zeros((0, 3), dtype=np.int64)
+
+    block = text.read_block(lines, "f")
+    columns = get_face_columns(block)
+    block[block == ord("/")] = ord(" ")
+
+    indices = np.fromstring(block.tobytes(), dtype=np.int64, sep=" ")
+    v_vt_vn = np.full((len(indices) // len(columns), 3), -1, dtype=np.int64)
+    v_vt_vn[:, columns] = indices.reshape(-1, len(columns)) - 1
+
+    corners_in_face = text.tokens_in_line[lines] - 1
+    return v_vt_vn[fan_triangles(corners_in_face)]
+
+def get_face_columns(block):
+    """
+        Work out which of v, vt, vn each corner gives, judging by the
+        first corner of the block.
+    """
+
+    is_space = IS_WHITESPACE[block[:256]]
+    first = np.argmin(is_space)
+    length = np.argmax(is_space[first:])
+    corner = block[first : first + length].tobytes().decode()
+
+    if "//" in corner:
+        return [0, 2]
+    return [0, 1, 2][: corner.count("/") + 1]
+
+def fan_triangles(corners_in_face):
+    """
+        obj file uses triangle fan format for each face individually.
+        Given the corner count of every face, return the corner order
+        which unpacks every face into triangles.
+    """
+
+    triangles_in_face = corners_in_face - 2
+    first_corner = np.cumsum(corners_in_face) - corners_in_face
+
+    first_triangle = np.cumsum(triangles_in_face) - triangles_in_face
+    owner = np.repeat(np.arange(len(corners_in_face)), triangles_in_face)
+    i = np.arange(triangles_in_face.sum()) - first_triangle[owner]
+
+    fan_center = first_corner[owner]
+    return np.stack(
+        (fan_center, fan_center + i + 1, fan_center + i + 2), axis=1
+    ).ravel()
+
+class RegisteredAsset:
+
+
+    def __init__(self, asset, category, destroy):
+
+        self.asset = asset
+        self.category = category
+        self.destroy = destroy
+        #assets report their GPU memory through an nbytes attribute
+        self.size = getattr(asset, "nbytes", 0)
+        self.references = 0
+
+class AssetRegistry:
+    """
+        Shares models and shaders between everything which asks for
+        them, so that each is only made once.
+
+        Assets are keyed by category, the canonical paths of their files
+        and any other parameters they were made with. Each acquire must
+        be matched by a release. Once nothing holds an asset it's kept
+        around in case it's needed again, and the least recently used
+        are destroyed when they hold more than the budget.
+    """
+
+    def __init__(self, unused_budget = UNUSED_ASSET_BUDGET):
+
+        self.unused_budget = unused_budget
+        self.entries = {}
+        self.keys = {}
+        #keys of assets nobody holds, least recently released first
+        self.unused = collections.OrderedDict()
+
+    def acquire(self, category, paths, params, make, destroy = None):
+        """
+            Return the asset with the given key, making it if need be.
+
+                Parameters:
+                    category (str): eg. "mesh" or "shader"
+                    paths (tuple): the files the asset is made from
+                    params (tuple): anything else which changes the asset
+                    make (function): takes no arguments and returns a new asset
+                    destroy (function): frees the asset, by default
+                        its destroy method
+        """
+
+        key = (
+            category,
+            tuple(os.path.realpath(path) for path in paths),
+            params
+        )
+
+        entry = self.entries.get(key)
+        if entry is None:
+            asset = make()
+            entry = RegisteredAsset(
+                asset, category,
+                destroy or (lambda asset: asset.destroy())
+            )
+            self.entries[key] = entry
+            self.keys[asset] = key
+        else:
+            self.unused.pop(key, None)
+
+        entry.references += 1
+        return entry.asset
+
+    def release(self, asset):
+        """
+            Give up a reference to an asset returned by acquire.
+        """
+
+        key = self.keys[asset]
+        entry = self.entries[key]
+        entry.references -= 1
+        if entry.references == 0:
+            self.unused[key] = None
+            self.evict(self.unused_budget)
+
+    def evict(self, budget):
+        """
+            Destroy unused assets, least recently used first,
+            until they hold at most the given number of bytes.
+        """
+
+        unused_bytes = sum(self.entries[key].size for key in self.unused)
+        while self.unused and unused_bytes > budget:
+            key, _ = self.unused.popitem(last = False)
+            entry = self.entries.pop(key)
+            del self.keys[entry.asset]
+            entry.destroy(entry.asset)
+            unused_bytes -= entry.size
+
+    def get_memory_report(self):
+        """
+            Returns the (asset count, bytes of GPU memory) held by
+            each category, including unused assets.
+        """
+
+        report = {}
+        for entry in self.entries.values():
+            count, size = report.get(entry.category, (0, 0))
+            report[entry.category] = (count + 1, size + entry.size)
+        return report
+
+    def print_memory_report(self):
+
+        for category, (count, size) in sorted(self.get_memory_report().items()):
+            print(f"{category}: {count} assets, {size / 1024:.1f} KB")
+
+    def destroy(self):
+        """
+            Free every asset, whether or not it's still held.
+        """
+
+        for entry in self.entries.values():
+            entry.destroy(entry.asset)
+        self.entries.clear()
+        self.keys.clear()
+        self.unused.clear()
+
+#the one registry shared by the whole program
+asset_registry = AssetRegistry()
+
+class TrackedResource:
+
+
+    def __init__(self, kind, name, owner, site):
+
+        self.kind = kind
+        self.name = name
+        #resources are summed up by the class of their owner
+        self.category = type(owner).__name__
+        self.owner = f"{self.category} at {id(owner):#x}"
+        self.site = site
+        self.nbytes = 0
+
+class GPUResourceTracker:
+    """
+        Records every GL object made through track, along with the
+        bytes of GPU memory it holds, the object which owns it and the
+        line which made it, until it's deleted through untrack.
+
+        Anything still recorded once the program has freed everything
+        was leaked, report_leaks lists it. A summary is printed the
+        first time the objects together go over the budget.
+    """
+
+
+    def __init__(self, budget = GPU_MEMORY_BUDGET):
+
+        self.budget = budget
+        self.resources = {}
+        self.total_bytes = 0
+        self.over_budget = False
+    
+    def track(self, kind, name, owner, nbytes = 0):
+        """
+            Record a GL object which has just been made and return its
+            name, so the call making it can be wrapped in place, eg.
+
+                self.vbo = gpu_resources.track("buffer", glGenBuffers(1), self)
+
+                Parameters:
+                    kind (str): eg. "buffer" or "vertex array",
+                        GL names are only unique within a kind
+                    name (int): the name glGen* returned
+                    owner (object): the object responsible for deleting it
+                    nbytes (int): the GPU memory it holds, if already known
+        """
+
+        #the first caller outside the owner's base classes, eg. the
+        #subclass __init__ rather than the base __init__ it called
+        base_code = {
+            getattr(member, "__code__", None)
+            for base in type(owner).__mro__[1:]
+            for member in vars(base).values()
+        }
+        code, lineno = next(
+            (frame.f_code, lineno)
+            for (frame, lineno) in traceback.walk_stack(sys._getframe(1))
+            if frame.f_code not in base_code)
+        previous = self.resources.pop((kind, name), None)
+        if previous is not None:
+            #deleted without untrack, and its name has been reused
+            self.total_bytes -= previous.nbytes
+        self.resources[(kind, name)] = TrackedResource(
+            kind, name, owner,
+            f"{os.path.basename(code.co_filename)}:{lineno} in {code.co_name}")
+        self.resize(kind, name, nbytes)
+        return name
+    
+    def resize(self, kind, name, nbytes):
+        """
+            Record how much GPU memory an object holds, once it's allocated.
+        """
+
+        resource = self.resources[(kind, name)]
+        self.total_bytes += nbytes - resource.nbytes
+        resource.nbytes = nbytes
+
+        if self.total_bytes > self.budget and not self.over_budget:
+            print(
+                f"GPU memory over budget, {self.total_bytes / 2**20:.1f} MB "
+                f"of {self.budget / 2**20:.1f} MB")
+            self.print_summary()
+        self.over_budget = self.total_bytes > self.budget
+    
+    def untrack(self, kind, name):
+        """
+            Forget a GL object which has just been deleted.
+        """
+
+        resource = self.resources.pop((kind, name), None)
+        if resource is not None:
+            self.total_bytes -= resource.nbytes
+    
+    def get_summary(self):
+        """
+            Returns the (object count, bytes of GPU memory) of each category.
+        """
+
+        summary = {}
+        for resource in self.resources.values():
+            count, size = summary.get(resource.category, (0, 0))
+            summary[resource.category] = (count + 1, size + resource.nbytes)
+        return summary
+    
+    def get_top_consumers(self, count = 5):
+        """
+            Returns the objects holding the most GPU memory, largest first.
+        """
+
+        return sorted(
+            self.resources.values(), 
+            key = lambda resource: resource.nbytes, reverse = True)[:count]
+    
+    def print_summary(self):
+
+        print(f"GPU memory: {self.total_bytes / 1024:.1f} KB in {len(self.resources)} objects")
+        for (category, (count, size)) in sorted(self.get_summary().items()):
+            print(f"{category}: {count} objects, {size / 1024:.1f} KB")
+        for resource in self.get_top_consumers():
+            print(
+                f"    {resource.nbytes / 1024:.1f} KB {resource.kind} {resource.name}, "
+                f"{resource.owner}, made at {resource.site}")
+    
+    def report_leaks(self):
+        """
+            Print and return every object which hasn't been deleted,
+            call once everything should have been freed.
+        """
+
+        leaks = list(self.resources.values())
+        for resource in leaks:
+            print(
+                f"Leaked {resource.kind} {resource.name} ({resource.nbytes / 1024:.1f} KB), "
+                f"{resource.owner}, made at {resource.site}")
+        return leaks
+
+#every GL object the program makes
+gpu_resources = GPUResourceTracker()
+
 class ObjModel:
 
 
-    def __init__(self, folderpath, filename, color):
-        v = []
-        vt = []
-        vn = []
-        self.vertices = []
+    def __init__(self, folderpath, filename, positions = None):
+        """
+            Build the model from the given obj file.
+            The positions can be passed in if the file has already been read.
+
+            Only positions are stored, so one model can be drawn in any
+            color: the color attribute is left disabled, and whatever
+            glVertexAttrib3f last set it to is used for every vertex.
+        """
 
-        #open the obj file and read the data
-        with open(f"{folderpath}/{filename}",'r') as f:
-            line = f.readline()
-            while line:
-                firstSpace = line.find(" ")
-                flag = line[0:firstSpace]
-                if flag=="mtllib":
-                    #declaration of material file
-                    pass
-                elif flag=="v":
-                    #vertex
-                    line = line.replace("v ","")
-                    line = line.split(" ")
-                    l = [float(x) for x in line]
-                    v.append(l)
-                    #print(v)
-                elif flag=="vt":
-                    #texture coordinate
-                    line = line.replace("vt ","")
-                    line = line.split(" ")
-                    l = [float(x) for x in line]
-                    vt.append(l)
-                elif flag=="vn":
-                    #normal
-                    line = line.replace("vn ","")
-                    line = line.split(" ")
-                    l = [float(x) for x in line]
-                    vn.append(l)
-                elif flag=="f":
-                    #face, four vertices in v/vt/vn form
-                    line = line.replace("f ","")
-                    line = line.replace("\n","")
-                    line = line.split(" ")
-                    theseVertices = []
-                    theseTextures = []
-                    theseNormals = []
-                    for vertex in line:
-                        l = vertex.split("/")
-                        position = int(l[0]) - 1
-                        theseVertices.append(v[position])
-                        texture = int(l[1]) - 1
-                        theseTextures.append(vt[texture])
-                        normal = int(l[2]) - 1
-                        theseNormals.append(vn[normal])
-                    # obj file uses triangle fan format for each face individually.
-                    # unpack each face
-                    triangles_in_face = len(line) - 2
-
-                    vertex_order = []
-                    for i in range(triangles_in_face):
-                        vertex_order.append(0)
-                        vertex_order.append(i+1)
-                        vertex_order.append(i+2)
-                    for i in vertex_order:
-                        for x in theseVertices[i]:
-                            self.vertices.append(x)
-                        """
-                        for x in theseTextures[i]:
-                            self.vertices.append(x)
-                        for x in theseNormals[i]:
-                            self.vertices.append(x)
-                        """
-                        self.vertices.append(color[0])
-                        self.vertices.append(color[1])
-                        self.vertices.append(color[2])
-                    
-                line = f.readline()
-        self.vertices = np.array(self.vertices,dtype=np.float32)
+        if positions is None:
+            positions = read_obj_positions(f"{folderpath}/{filename}")
+        
+        #x, y, z
+        self.vertices = np.ascontiguousarray(positions, dtype=np.float32).ravel()
 
         #vertex array object, all that stuff
-        self.vao = glGenVertexArrays(1)
+        self.vao = gpu_resources.track("vertex array", glGenVertexArrays(1), self)
         glBindVertexArray(self.vao)
 
-        self.vbo = glGenBuffers(1)
+        self.vbo = gpu_resources.track(
+            "buffer", glGenBuffers(1), self, self.vertices.nbytes)
         glBindBuffer(GL_ARRAY_BUFFER,self.vbo)
         glBufferData(GL_ARRAY_BUFFER,self.vertices.nbytes,self.vertices,GL_STATIC_DRAW)
-        self.vertex_count = int(len(self.vertices)/6)
+        self.vertex_count = int(len(self.vertices)/3)
+        self.nbytes = self.vertices.nbytes
 
         glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(0))
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(12))
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 12, ctypes.c_void_p(0))
+        glDisableVertexAttribArray(1)
+    
+    def draw(self, color):
+        """
+            Draw the model in the given color.
+        """
+
+        glBindVertexArray(self.vao)
+        glVertexAttrib3f(1, *color)
+        glDrawArrays(GL_TRIANGLES, 0, self.vertex_count)
     
     def destroy(self):
         glDeleteVertexArrays(1, (self.vao,))
         glDeleteBuffers(1, (self.vbo,))
+        gpu_resources.untrack("vertex array", self.vao)
+        gpu_resources.untrack("buffer", self.vbo)
 
 class GroundGrid:
 
@@ -375,10 +890,11 @@ class GroundGrid:
         self.vertices = np.array(self.vertices, dtype=np.float32)
         self.vertex_count = int(self.vertices.size / 6)
 
-        self.vao = glGenVertexArrays(1)
+        self.vao = gpu_resources.track("vertex array", glGenVertexArrays(1), self)
         glBindVertexArray(self.vao)
 
-        self.vbo = glGenBuffers(1)
+        self.vbo = gpu_resources.track(
+            "buffer", glGenBuffers(1), self, self.vertices.nbytes)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
         glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
         
@@ -390,6 +906,8 @@ class GroundGrid:
     def destroy(self):
         glDeleteVertexArrays(1, (self.vao,))
         glDeleteBuffers(1, (self.vbo,))
+        gpu_resources.untrack("vertex array", self.vao)
+        gpu_resources.untrack("buffer", self.vbo)
 
 class Engine:
     """
@@ -421,11 +939,25 @@ class Engine:
         glClearColor(self.palette["blue"][0], self.palette["blue"][1], self.palette["blue"][2], 1)
 
         self.ground = GroundGrid(24, self.palette["light-pink"])
-        self.playerModel = ObjModel("models", "rocket.obj", self.palette["orange"])
-        self.ufoBase = ObjModel("models", "ufo_base.obj", self.palette["dark-violet"])
-        self.ufoTop = ObjModel("models", "ufo_top.obj", self.palette["orange"])
-        self.bullet = ObjModel("models", "basic_sphere.obj", self.palette["orange"])
-        self.powerUp = ObjModel("models", "basic_sphere.obj", self.palette["blue"])
+        models = (
+            ("rocket.obj", self.palette["orange"]),
+            ("ufo_base.obj", self.palette["dark-violet"]),
+            ("ufo_top.obj", self.palette["orange"]),
+            ("basic_sphere.obj", self.palette["orange"]),
+            ("basic_sphere.obj", self.palette["blue"])
+        )
+        #models are shared between colors, so basic_sphere is only made once
+        self.playerModel, self.ufoBase, self.ufoTop, self.bullet, self.powerUp = \
+            load_models_in_parallel(
+                [f"models/{filename}" for (filename, _) in models],
+                read_obj_positions,
+                lambda i, positions: asset_registry.acquire(
+                    "mesh", (f"models/{models[i][0]}",), (),
+                    lambda: ObjModel("models", models[i][0], positions)
+                )
+            )
+        self.playerColor, self.ufoBaseColor, self.ufoTopColor, \
+            self.bulletColor, self.powerUpColor = (color for (_, color) in models)
 
         #top
         start_corner = (0,0)
@@ -502,9 +1034,10 @@ class Engine:
 
         self.vertex_count = int(self.vertices.size / 6)
 
-        self.vao = glGenVertexArrays(1)
+        self.vao = gpu_resources.track("vertex array", glGenVertexArrays(1), self)
         glBindVertexArray(self.vao)
-        self.vbo = glGenBuffers(1)
+        self.vbo = gpu_resources.track(
+            "buffer", glGenBuffers(1), self, self.vertices.nbytes)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
         glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, 
                         self.vertices, GL_STATIC_DRAW)
@@ -514,8 +1047,14 @@ class Engine:
         glEnableVertexAttribArray(1)
         glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(12))
 
-        self.shader = self.createShader("shaders/vertex.txt",
-                                        "shaders/fragment.txt")
+        self.shader = asset_registry.acquire(
+            "shader", ("shaders/vertex.txt", "shaders/fragment.txt"), (),
+            lambda: self.createShader("shaders/vertex.txt", "shaders/fragment.txt"),
+            glDeleteProgram
+        )
+        if REPORT_ASSET_MEMORY:
+            asset_registry.print_memory_report()
+            gpu_resources.print_summary()
         
         glUseProgram(self.shader)
         glEnable(GL_DEPTH_TEST)
@@ -676,34 +1215,32 @@ class Engine:
             )
         )
 
-        modelMatrix = pyrr.matrix44.create_identity(dtype=np.float32)
-        modelMatrix = pyrr.matrix44.multiply(modelMatrix,pyrr.matrix44.create_from_scale(scale = np.array([0.02, 0.02, 0.02]),dtype=np.float32))
-        modelMatrix = pyrr.matrix44.multiply(modelMatrix,pyrr.matrix44.create_from_x_rotation(theta=np.radians(270),dtype=np.float32))
-        modelMatrix = pyrr.matrix44.multiply(modelMatrix,pyrr.matrix44.create_from_z_rotation(theta=np.radians(gameBoard.player.rollAmount),dtype=np.float32))
-        modelMatrix = pyrr.matrix44.multiply(modelMatrix,pyrr.matrix44.create_from_translation(vec = np.array([gameBoard.player.x, gameBoard.player.y, -0.4]),dtype=np.float32))
+        modelMatrix = make_model_transforms(
+            (gameBoard.player.x, gameBoard.player.y, -0.4),
+            (270, 0, gameBoard.player.rollAmount), 0.02
+        )[0]
         glUniformMatrix4fv(self.modelLocation, 1, False, modelMatrix)
         glUniformMatrix4fv(self.viewProjLocation, 1, False, viewProjectionMatrix)
-        glBindVertexArray(self.playerModel.vao)
-        glDrawArrays(GL_TRIANGLES, 0, self.playerModel.vertex_count)
+        self.playerModel.draw(self.playerColor)
+
+        #every bullet's and every UFO's transform, in one go each
+        bulletMatrices = make_model_transforms(
+            [(bullet.x, bullet.y, bullet.z) for bullet in gameBoard.bullets],
+            np.zeros((len(gameBoard.bullets), 3)), 0.02
+        )
+        ufoMatrices = make_model_transforms(
+            [(ufo.x, -0.1, -2) for ufo in gameBoard.UFOs],
+            np.tile((270, 0, 0), (len(gameBoard.UFOs), 1)), 0.02
+        )
 
-        for bullet in gameBoard.bullets:
-            modelMatrix = pyrr.matrix44.create_identity(dtype=np.float32)
-            modelMatrix = pyrr.matrix44.multiply(modelMatrix,pyrr.matrix44.create_from_scale(scale = np.array([0.02, 0.02, 0.02]),dtype=np.float32))
-            modelMatrix = pyrr.matrix44.multiply(modelMatrix,pyrr.matrix44.create_from_translation(vec = np.array([bullet.x, bullet.y, bullet.z]),dtype=np.float32))
+        for modelMatrix in bulletMatrices:
             glUniformMatrix4fv(self.modelLocation, 1, False, modelMatrix)
-            glBindVertexArray(self.bullet.vao)
-            glDrawArrays(GL_TRIANGLES, 0, self.bullet.vertex_count)
+            self.bullet.draw(self.bulletColor)
         
-        for ufo in gameBoard.UFOs:
-            modelMatrix = pyrr.matrix44.create_identity(dtype=np.float32)
-            modelMatrix = pyrr.matrix44.multiply(modelMatrix,pyrr.matrix44.create_from_scale(scale = np.array([0.02, 0.02, 0.02]),dtype=np.float32))
-            modelMatrix = pyrr.matrix44.multiply(modelMatrix,pyrr.matrix44.create_from_x_rotation(theta=np.radians(270),dtype=np.float32))
-            modelMatrix = pyrr.matrix44.multiply(modelMatrix,pyrr.matrix44.create_from_translation(vec = np.array([ufo.x, -0.1, -2]),dtype=np.float32))
+        for modelMatrix in ufoMatrices:
             glUniformMatrix4fv(self.modelLocation, 1, False, modelMatrix)
-            glBindVertexArray(self.ufoBase.vao)
-            glDrawArrays(GL_TRIANGLES, 0, self.ufoBase.vertex_count)
-            glBindVertexArray(self.ufoTop.vao)
-            glDrawArrays(GL_TRIANGLES, 0, self.ufoTop.vertex_count)
+            self.ufoBase.draw(self.ufoBaseColor)
+            self.ufoTop.draw(self.ufoTopColor)
 
 
         pg.display.flip()
@@ -714,10 +1251,16 @@ class Engine:
         """
 
         self.ground.destroy()
+        for model in (
+            self.playerModel, self.ufoBase, self.ufoTop, 
+            self.bullet, self.powerUp):
+            asset_registry.release(model)
 
         glDeleteVertexArrays(1,(self.vao,))
         glDeleteBuffers(1,(self.vbo,))
-        glDeleteProgram(self.shader)
+        gpu_resources.untrack("vertex array", self.vao)
+        gpu_resources.untrack("buffer", self.vbo)
+        asset_registry.release(self.shader)
 
 ################################## Control ####################################
 
@@ -782,6 +1325,10 @@ class App:
     
     def quit(self):
         self.graphicsEngine.destroy()
+        asset_registry.destroy()
+        gpu_resources.report_leaks()
         pg.quit()
 
-myApp = App()
\ No newline at end of file
+if __name__ == "__main__":
+    #the loading workers import this file, they mustn't start an App
+    myApp = App()
\ No newline at end of file
@@ -0,0 +1,151 @@
+import glob
+import os
+import tempfile
+import time
+import numpy as np
+import obj_loader
+
+################### Reference Loader ##########################################
+
+# The corner by corner loader used throughout the pracs, kept here
+# as the baseline which the vectorized loader is measured against.
+
+def legacy_load_model_from_file(filename: str) -> list[float]:
+    """
+        Read the given obj file and return a list of all the
+        vertex data.
+    """
+
+    v = []
+    vt = []
+    vn = []
+    vertices = []
+
+    with open(filename,'r') as f:
+        line = f.readline()
+        while line:
+            words = line.split(" ")
+            if words[0] == "v":
+                v.append(read_vertex_data(words))
+            elif words[0] == "vt":
+                vt.append(read_texcoord_data(words))
+            elif words[0] == "vn":
+                vn.append(read_normal_data(words))
+            elif words[0] == "f":
+                read_face_data(words, v, vt, vn, vertices)
+            line = f.readline()
+
+    return vertices
+
+def read_vertex_data(words: list[str]) -> list[float]:
+
+    return [float(words[1]), float(words[2]), float(words[3])]
+
+def read_texcoord_data(words: list[str]) -> list[float]:
+
+    return [float(words[1]), float(words[2])]
+
+def read_normal_data(words: list[str]) -> list[float]:
+
+    return [float(words[1]), float(words[2]), float(words[3])]
+
+def read_face_data(
+    words: list[str],
+    v: list[float], vt: list[float], vn: list[float],
+    vertices: list[float]) -> None:
+
+    triangles_in_face = len(words) - 3
+
+    for i in range(triangles_in_face):
+        read_corner(words[1], v, vt, vn, vertices)
+        read_corner(words[i + 2], v, vt, vn, vertices)
+        read_corner(words[i + 3], v, vt, vn, vertices)
+
+def read_corner(
+    description: str,
+    v: list[float], vt: list[float], vn: list[float],
+    vertices: list[float]) -> None:
+
+    v_vt_vn = description.split("/")
+
+    for x in v[int(v_vt_vn[0]) - 1]:
+        vertices.append(x)
+    for x in vt[int(v_vt_vn[1]) - 1]:
+        vertices.append(x)
+    for x in vn[int(v_vt_vn[2]) - 1]:
+        vertices.append(x)
+
+################### Regression Checks #########################################
+
+COMMENTED_OBJ = """# a square, with comments where exporters put them
+v 0 0 0 # first corner
+v 1 0 0
+v 1 1 0#no space before this one
+v 0 1 0
+vt 0 0 # texcoords
+vt 1 0
+vt 1 1
+vt 0 1
+vn 0 0 1 # facing up
+f 1/1/1 2/2/1 3/3/1 4/4/1 # a quad, fanned into two triangles
+#f 1/1/1 2/2/1 3/3/1
+"""
+
+def check_comments() -> None:
+    """
+        Trailing comments must be ignored, as the legacy loader
+        ignored trailing text, rather than reaching numpy's parser.
+    """
+
+    plain = "\n".join(
+        line.split("#")[0] for line in COMMENTED_OBJ.splitlines())
+
+    loaded = []
+    for contents in (COMMENTED_OBJ, plain):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix = ".obj", delete = False) as f:
+            f.write(contents)
+        try:
+            loaded.append(obj_loader.load_model_from_file(f.name))
+        finally:
+            os.remove(f.name)
+
+    assert len(loaded[0]) == 6 * 8, "comments changed the corner count"
+    assert np.array_equal(loaded[0], loaded[1]), "comments changed the vertex data"
+
+################### Benchmark #################################################
+
+def best_time(function, filename: str, repeats: int) -> float:
+    """ Return the fastest of several runs, in milliseconds. """
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(filename)
+        best = min(best, time.perf_counter() - start)
+    return 1000 * best
+
+def main():
+
+    check_comments()
+
+    print(f"{'model':<16}{'corners':>10}{'legacy (ms)':>14}{'numpy (ms)':>14}{'speedup':>10}")
+
+    for filename in sorted(glob.glob("models/*.obj")):
+
+        expected = np.array(legacy_load_model_from_file(filename), dtype=np.float32)
+        result = obj_loader.load_model_from_file(filename)
+        assert np.array_equal(expected, result), f"{filename}: loaders disagree"
+
+        legacy_time = best_time(legacy_load_model_from_file, filename, 5)
+        numpy_time = best_time(obj_loader.load_model_from_file, filename, 5)
+
+        print(
+            f"{filename[7:]:<16}{len(result) // 8:>10}"
+            f"{legacy_time:>14.1f}{numpy_time:>14.1f}"
+            f"{legacy_time / numpy_time:>9.1f}x"
+        )
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,160 @@
+import glob
+import os
+import tempfile
+import warnings
+import sys
+import numpy as np
+import vertex_cache
+
+################### Constants        ########################################
+
+CACHE_EXTENSION = ".mesh"
+CACHE_MAGIC = b"MESH"
+#bumped whenever the cached data changes, eg. 2: optimised triangle order
+CACHE_VERSION = 2
+MAX_ATTRIBUTES = 8
+
+#fixed size header at the front of every cache file,
+#the float32 vertex data follows straight after it
+CACHE_HEADER = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u4"),
+    ("source_size", "<u8"),
+    ("source_mtime", "<i8"),
+    ("vertex_count", "<u8"),
+    ("attribute_count", "<u4"),
+    ("layout", "<u4", (MAX_ATTRIBUTES,)),
+])
+
+################### Mesh Cache ################################################
+
+def load_mesh(filename: str, layout: tuple[int], loader) -> np.ndarray:
+    """
+        Return the flat float32 vertex buffer for the given obj file,
+        reading it from the cache where possible.
+
+        The first load parses the file with the given loader and writes
+        the result next to it. Later loads memory map the cache file, so
+        the array can be handed straight to glBufferData. The cache is
+        rebuilt whenever the size or modification time of the obj file
+        no longer matches the one it was built from.
+
+        Parameters:
+
+            filename: filepath to the obj file
+
+            layout: the number of floats in each vertex attribute,
+                eg. (3, 2, 3) for position, texcoord, normal
+
+            loader: function taking the filename and returning the
+                flat vertex buffer, only called on a cache miss
+
+        Returns:
+
+            A read only float32 array of the vertex data.
+    """
+
+    vertices = read_cache(filename, layout)
+    if vertices is None:
+        vertices = np.ascontiguousarray(loader(filename), dtype=np.float32)
+        write_cache(filename, layout, vertices)
+    return vertices
+
+def get_cache_path(filename: str, layout: tuple[int]) -> str:
+    """
+        Each layout gets its own cache file, so different loaders
+        can share an obj file without rebuilding each other's caches.
+    """
+
+    layout_name = "_".join(str(size) for size in layout)
+    return f"{filename}.{layout_name}{CACHE_EXTENSION}"
+
+def make_header(
+    filename: str, layout: tuple[int], vertex_count: int) -> np.ndarray:
+    """ Describe the given obj file and layout as a cache header. """
+
+    source = os.stat(filename)
+    header = np.zeros(1, dtype=CACHE_HEADER)
+    header["magic"] = CACHE_MAGIC
+    header["version"] = CACHE_VERSION
+    header["source_size"] = source.st_size
+    header["source_mtime"] = source.st_mtime_ns
+    header["vertex_count"] = vertex_count
+    header["attribute_count"] = len(layout)
+    header["layout"][0, :len(layout)] = layout
+    return header
+
+def read_cache(filename: str, layout: tuple[int]) -> np.ndarray | None:
+    """
+        Memory map the cached vertex data for the given obj file,
+        returns None if there's no cache or it's out of date.
+    """
+
+    cache_path = get_cache_path(filename, layout)
+    if not os.path.exists(cache_path) \
+        or os.path.getsize(cache_path) < CACHE_HEADER.itemsize:
+        return None
+
+    header = np.fromfile(cache_path, dtype=CACHE_HEADER, count=1)
+    expected = make_header(filename, layout, header["vertex_count"][0])
+    if header.tobytes() != expected.tobytes():
+        return None
+
+    float_count = int(header["vertex_count"][0]) * sum(layout)
+    if os.path.getsize(cache_path) != CACHE_HEADER.itemsize + 4 * float_count:
+        return None
+    if float_count == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    return np.memmap(
+        cache_path, dtype=np.float32, mode="r",
+        offset=CACHE_HEADER.itemsize, shape=(float_count,))
+
+def write_cache(
+    filename: str, layout: tuple[int], vertices: np.ndarray) -> None:
+    """
+        Write the given vertex data to the obj file's cache, going
+        through a temporary file so a half written cache is never read.
+        If the cache can't be written, it's skipped with a warning.
+    """
+
+    cache_path = get_cache_path(filename, layout)
+    header = make_header(filename, layout, len(vertices) // sum(layout))
+
+    temp_path = None
+    try:
+        #a uniquely named temporary file, so loaders writing the
+        #same cache at once don't clobber each other's
+        with tempfile.NamedTemporaryFile(
+            dir = os.path.dirname(cache_path) or ".", 
+            prefix = os.path.basename(cache_path), suffix = ".tmp",
+            delete = False) as f:
+            temp_path = f.name
+            f.write(header.tobytes())
+            f.write(vertices.tobytes())
+        os.replace(temp_path, cache_path)
+    except OSError as error:
+        #the data in hand is still good, it just won't be cached
+        warnings.warn(f"Couldn't write cache {cache_path}: {error}")
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def prewarm(folderpath: str, layout: tuple[int], loader) -> int:
+    """
+        Make sure every obj file in the given folder has an up to date
+        cache, returns how many had to be rebuilt.
+    """
+
+    rebuilt = 0
+    for filename in sorted(glob.glob(f"{folderpath}/*.obj")):
+        if read_cache(filename, layout) is None:
+            load_mesh(filename, layout, loader)
+            rebuilt += 1
+    return rebuilt
+
+if __name__ == "__main__":
+
+    #usage: python mesh_cache.py [folder]
+    folderpath = sys.argv[1] if len(sys.argv) > 1 else "models"
+    rebuilt = prewarm(folderpath, (3,), vertex_cache.load_optimized_positions)
+    print(f"{folderpath}: rebuilt {rebuilt} mesh caches")
@@ -0,0 +1,282 @@
+import numpy as np
+
+################### Constants        ########################################
+
+#lookup table, indexed by byte value
+IS_WHITESPACE = np.zeros(256, dtype=bool)
+IS_WHITESPACE[[ord(c) for c in " \t\r\n"]] = True
+
+################### Obj Loading ###############################################
+
+def load_model_from_file(filename: str) -> np.ndarray:
+    """
+        Read the given obj file and return a flat array of all the
+        vertex data, laid out as x, y, z, s, t, nx, ny, nz per corner.
+
+        Parameters:
+
+            filename: filepath to the obj file (relative to the working directory)
+
+        Returns:
+
+            A float32 array holding 8 floats for every triangle corner.
+    """
+
+    v, vt, vn, v_vt_vn = read_obj(filename)
+
+    return build_vertices(v, vt, vn, v_vt_vn).ravel()
+
+def load_positions_from_file(filename: str) -> np.ndarray:
+    """
+        Read the given obj file and return a flat array holding
+        the position of every corner.
+    """
+
+    v, _, _, v_vt_vn = read_obj(filename)
+
+    return v[v_vt_vn[:, 0]].ravel()
+
+def read_obj(filename: str) -> tuple[np.ndarray]:
+    """
+        Read the given obj file and return its attribute blocks along
+        with the triangulated corner indices.
+
+        Rather than walking the file line by line, the whole file is
+        treated as one byte array. Each line is classified by its flag,
+        every v, vt, vn and f block is then handed to numpy's parser in
+        a single call and polygons are fanned into triangles with
+        index arithmetic.
+
+        Parameters:
+
+            filename: filepath to the obj file
+
+        Returns:
+
+            (v, vt, vn, v_vt_vn): positions (n,3), texcoords (n,2),
+            normals (n,3) and a (corners,3) int array of zero based
+            indices into them, -1 marks an index the face didn't give.
+    """
+
+    text = ObjText(np.fromfile(filename, dtype=np.uint8))
+
+    v = read_vertex_data(text, "v", 3)
+    vt = read_vertex_data(text, "vt", 2)
+    vn = read_vertex_data(text, "vn", 3)
+    v_vt_vn = read_face_data(text)
+
+    return (v, vt, vn, v_vt_vn)
+
+class ObjText:
+    """
+        An obj file as a byte array, along with the per line
+        bookkeeping needed to pull out whole blocks at once.
+    """
+
+
+    def __init__(self, data: np.ndarray):
+        """
+            Index the lines and tokens of the given file contents.
+
+            Parameters:
+
+                data: the raw bytes of the file, as a uint8 array
+        """
+
+        # terminate the last line, so every line ends in a newline
+        self.data = np.append(data, np.uint8(ord("\n")))
+
+        newline = self.data == ord("\n")
+        line_ends = np.flatnonzero(newline)
+        self.line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+        self.line_lengths = line_ends + 1 - self.line_starts
+
+        self.blank_comments(newline)
+
+        is_space = IS_WHITESPACE[self.data]
+        token_starts = ~is_space
+        token_starts[1:] &= is_space[:-1]
+        self.tokens_in_line = np.add.reduceat(
+            token_starts, self.line_starts, dtype=np.int64)
+
+    def blank_comments(self, newline: np.ndarray) -> None:
+        """
+            Blank out everything from a # to the end of its line, so
+            that trailing comments don't reach numpy's parser.
+        """
+
+        is_hash = self.data == ord("#")
+        if not is_hash.any():
+            return
+
+        # a byte is commented out if a # comes before it on its line
+        hashes = np.cumsum(is_hash)
+        hashes_before_line = (hashes - is_hash)[self.line_starts]
+        line = np.cumsum(newline) - newline
+        in_comment = (hashes > hashes_before_line[line]) & ~newline
+        self.data[in_comment] = ord(" ")
+
+    def find_lines(self, flag: str) -> np.ndarray:
+        """ Return a mask of which lines begin with the given flag. """
+
+        is_flagged = np.ones(len(self.line_starts), dtype=bool)
+        for i, character in enumerate(flag):
+            is_flagged &= self.read_column(i) == ord(character)
+        return is_flagged & IS_WHITESPACE[self.read_column(len(flag))]
+
+    def read_column(self, i: int) -> np.ndarray:
+        """
+            Return the i'th byte of every line, short lines
+            just read their own newline.
+        """
+
+        return np.take(
+            self.data, self.line_starts + np.minimum(i, self.line_lengths - 1))
+
+    def read_block(self, lines: np.ndarray, flag: str) -> np.ndarray:
+        """
+            Return the text of the given lines with their flags
+            blanked out, so that only the numbers remain.
+        """
+
+        block = self.data[np.repeat(lines, self.line_lengths)]
+        line_lengths = self.line_lengths[lines]
+        flag_offsets = np.cumsum(line_lengths) - line_lengths
+        for i in range(len(flag)):
+            block[flag_offsets + i] = ord(" ")
+        return block
+
+def read_vertex_data(
+    text: ObjText, flag: str, size: int) -> np.ndarray:
+    """
+        Read every line starting with the given flag, and return
+        the first size numbers of each as an (n,size) array.
+    """
+
+    lines = text.find_lines(flag)
+    if not lines.any():
+        return np.zeros((0, size), dtype=np.float32)
+
+    values = np.fromstring(
+        text.read_block(lines, flag).tobytes(), dtype=np.float32, sep=" ")
+
+    # exporters are free to add optional components (eg. vt u v w),
+    # so take the first size numbers from each line
+    numbers_in_line = text.tokens_in_line[lines] - 1
+    if (numbers_in_line == size).all():
+        return values.reshape(-1, size)
+    line_offsets = np.cumsum(numbers_in_line) - numbers_in_line
+    return values[line_offsets[:, None] + np.arange(size)]
+
+def read_face_data(text: ObjText) -> np.ndarray:
+    """
+        Read every face in the file and return the (v, vt, vn) index
+        triple for every corner of every triangle.
+
+        Supports the v, v/vt, v//vn and v/vt/vn corner forms, polygons
+        are unpacked as triangle fans.
+    """
+
+    lines = text.find_lines("f")
+    if not lines.any():
+        return np.zeros((0, 3), dtype=np.int64)
+
+    block = text.read_block(lines, "f")
+    columns = get_face_columns(block)
+    block[block == ord("/")] = ord(" ")
+
+    indices = np.fromstring(block.tobytes(), dtype=np.int64, sep=" ")
+    v_vt_vn = np.full((len(indices) // len(columns), 3), -1, dtype=np.int64)
+    v_vt_vn[:, columns] = indices.reshape(-1, len(columns)) - 1
+
+    corners_in_face = text.tokens_in_line[lines] - 1
+    return v_vt_vn[fan_triangles(corners_in_face)]
+
+def get_face_columns(block: np.ndarray) -> list[int]:
+    """
+        Work out which of v, vt, vn each corner gives, judging by the
+        first corner of the block.
+    """
+
+    is_space = IS_WHITESPACE[block[:256]]
+    first = np.argmin(is_space)
+    length = np.argmax(is_space[first:])
+    corner = block[first : first + length].tobytes().decode()
+
+    if "//" in corner:
+        return [0, 2]
+    return [0, 1, 2][: corner.count("/") + 1]
+
+def fan_triangles(corners_in_face: np.ndarray) -> np.ndarray:
+    """
+        obj file uses triangle fan format for each face individually.
+        Given the corner count of every face, return the corner order
+        which unpacks every face into triangles.
+    """
+
+    triangles_in_face = corners_in_face - 2
+    first_corner = np.cumsum(corners_in_face) - corners_in_face
+
+    first_triangle = np.cumsum(triangles_in_face) - triangles_in_face
+    owner = np.repeat(np.arange(len(corners_in_face)), triangles_in_face)
+    i = np.arange(triangles_in_face.sum()) - first_triangle[owner]
+
+    fan_center = first_corner[owner]
+    return np.stack(
+        (fan_center, fan_center + i + 1, fan_center + i + 2), axis=1
+    ).ravel()
+
+def build_vertices(
+    v: np.ndarray, vt: np.ndarray, vn: np.ndarray,
+    v_vt_vn: np.ndarray) -> np.ndarray:
+    """
+        Gather the interleaved (corners, 8) vertex array,
+        corners without a texcoord or normal are left as zero.
+    """
+
+    vertices = np.zeros((len(v_vt_vn), 8), dtype=np.float32)
+    vertices[:, 0:3] = v[v_vt_vn[:, 0]]
+
+    for (column, data, first) in ((1, vt, 3), (2, vn, 5)):
+        last = first + data.shape[1]
+        has_data = v_vt_vn[:, column] >= 0
+        if has_data.all():
+            vertices[:, first:last] = data[v_vt_vn[:, column]]
+        elif has_data.any():
+            vertices[has_data, first:last] = data[v_vt_vn[has_data, column]]
+
+    return vertices
+
+def index_vertices(
+    vertices: np.ndarray, stride: int) -> tuple[np.ndarray]:
+    """
+        Merge the repeated vertices of an expanded vertex buffer.
+
+        Parameters:
+
+            vertices: flat float32 array, one vertex per stride floats
+
+            stride: the number of floats in each vertex
+
+        Returns:
+
+            (vertices, indices): the unique vertices, in the order they
+            first appear, and the index of each original corner into
+            them. The indices are uint16 when they fit, uint32 otherwise.
+    """
+
+    vertices = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, stride)
+
+    # view each vertex as a single opaque value so np.unique can key on it
+    keys = vertices.view(np.dtype((np.void, 4 * stride))).ravel()
+    _, first_corner, unique_id = np.unique(
+        keys, return_index=True, return_inverse=True)
+
+    # np.unique sorts its output, restore the first appearance order
+    order = np.argsort(first_corner)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    index_type = np.uint16 if len(order) <= 65536 else np.uint32
+    indices = rank[unique_id.ravel()].astype(index_type)
+    return (vertices[first_corner[order]].ravel(), indices)
@@ -0,0 +1,143 @@
+import os
+import numpy as np
+import obj_loader
+
+################### Constants        ########################################
+
+#bytes of text parsed per step
+STREAM_CHUNK_SIZE = 1 << 20
+
+ATTRIBUTE_SIZES = {"v": 3, "vt": 2, "vn": 3}
+
+################### Obj Streaming #############################################
+
+class ObjStream:
+    """
+        Reads an obj file in fixed size chunks, so that only one chunk
+        of text and one chunk of triangle corners are held at a time.
+
+        The file is read twice. The first pass only counts, so that the
+        attribute pools (and the caller's GPU buffer) can be allocated
+        at their final size up front. The second pass fills the pools
+        and hands back the triangle corners of each chunk as it goes.
+    """
+
+
+    def __init__(
+        self, filename: str,
+        attributes: tuple[str] = ("v", "vt", "vn"),
+        chunk_size: int = STREAM_CHUNK_SIZE):
+        """
+            Prepare to stream the given file.
+
+            Parameters:
+
+                filename: filepath to the obj file
+
+                attributes: which of v, vt and vn to keep, any others
+                    are skipped over rather than stored
+
+                chunk_size: roughly how many bytes to parse per step
+        """
+
+        self.filename = filename
+        self.attributes = attributes
+        self.chunk_size = chunk_size
+
+        self.file_size = os.path.getsize(filename)
+        self.bytes_read = 0
+
+        #only known once the counting pass has finished
+        self.counted = False
+        self.corner_count = 0
+        self.pools: dict[str, np.ndarray] = {}
+        self.pool_sizes: dict[str, int] = {}
+
+    def get_progress(self) -> float:
+        """ Return how far through both passes the stream is, from 0 to 1. """
+
+        if self.file_size == 0:
+            return 1.0
+        return self.bytes_read / (2 * self.file_size)
+
+    def read(self):
+        """
+            Generator which streams the file, one chunk per step.
+
+            Yields:
+
+                (first_corner, v_vt_vn): the position of the chunk's first
+                triangle corner within the whole mesh, and the (corners,3)
+                zero based attribute indices of every corner in the chunk.
+                Steps made during the counting pass yield no corners.
+        """
+
+        counts = dict.fromkeys(ATTRIBUTE_SIZES, 0)
+        for text in self.read_chunks():
+            for flag in ATTRIBUTE_SIZES:
+                counts[flag] += np.count_nonzero(text.find_lines(flag))
+            faces = text.find_lines("f")
+            self.corner_count += 3 * int((text.tokens_in_line[faces] - 3).sum())
+            yield (0, np.zeros((0, 3), dtype=np.int64))
+
+        for flag in self.attributes:
+            self.pools[flag] = np.zeros(
+                (counts[flag], ATTRIBUTE_SIZES[flag]), dtype=np.float32)
+            self.pool_sizes[flag] = 0
+        self.counted = True
+
+        first_corner = 0
+        for text in self.read_chunks():
+            for flag in self.attributes:
+                self.append_to_pool(flag, text)
+            if text.find_lines("f").any():
+                v_vt_vn = obj_loader.read_face_data(text)
+            else:
+                v_vt_vn = np.zeros((0, 3), dtype=np.int64)
+            yield (first_corner, v_vt_vn)
+            first_corner += len(v_vt_vn)
+
+    def read_chunks(self):
+        """
+            Generator which yields the file as a series of ObjText
+            blocks, each split on a line boundary.
+        """
+
+        leftover = b""
+        with open(self.filename, "rb") as f:
+            while True:
+                data = f.read(self.chunk_size)
+                self.bytes_read += len(data)
+                if not data:
+                    break
+
+                data = leftover + data
+                cut = data.rfind(b"\n") + 1
+                if cut == 0:
+                    #a single line longer than the chunk, keep reading
+                    leftover = data
+                    continue
+                leftover = data[cut:]
+                yield obj_loader.ObjText(np.frombuffer(data[:cut], dtype=np.uint8))
+
+        if leftover:
+            yield obj_loader.ObjText(np.frombuffer(leftover, dtype=np.uint8))
+
+    def append_to_pool(self, flag: str, text: obj_loader.ObjText) -> None:
+        """ Copy the chunk's lines of the given attribute into its pool. """
+
+        data = obj_loader.read_vertex_data(text, flag, ATTRIBUTE_SIZES[flag])
+        start = self.pool_sizes[flag]
+        self.pools[flag][start : start + len(data)] = data
+        self.pool_sizes[flag] += len(data)
+
+    def build_positions(self, v_vt_vn: np.ndarray) -> np.ndarray:
+        """ Gather the flat position data for a chunk's corners. """
+
+        return self.pools["v"][v_vt_vn[:, 0]].ravel()
+
+    def build_vertices(self, v_vt_vn: np.ndarray) -> np.ndarray:
+        """ Gather the flat x,y,z,s,t,nx,ny,nz data for a chunk's corners. """
+
+        return obj_loader.build_vertices(
+            self.pools["v"], self.pools["vt"], self.pools["vn"], v_vt_vn).ravel()
@@ -0,0 +1,104 @@
+import concurrent.futures
+import os
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+################### Constants        ########################################
+
+#blocks a worker has created. Windows frees a block as soon as its last
+#handle closes, so workers hold theirs until the pool shuts down
+worker_blocks: list[shared_memory.SharedMemory] = []
+
+################### Parallel Loading ##########################################
+
+def load_meshes(
+    filenames: list[str], loader, make_mesh, read_cached = None) -> list:
+    """
+        Parse many obj files at once in a process pool, then build a
+        mesh from each on the calling thread.
+
+        Parsing is plain numpy work, so it runs in worker processes.
+        Each worker hands back its vertex data through shared memory
+        rather than pickling it. Only make_mesh, which does the GL upload,
+        runs here on the thread which owns the context.
+
+        Files whose data is already at hand skip the pool altogether,
+        and it's only started when more than one file is left to parse:
+        for fewer, starting the workers costs more than it saves.
+
+        Parameters:
+
+            filenames: filepaths to the obj files
+
+            loader: function taking a filename and returning its vertex
+                data as an array. It must be picklable (defined at module
+                level) so that the workers can call it.
+
+            make_mesh: function taking the index of a file in filenames
+                and its vertex data, and returning the finished mesh. The
+                data is only valid for the duration of the call.
+
+            read_cached: optional function taking a filename and returning
+                its vertex data if it can be had without parsing, eg. from
+                an up to date cache, or None if it can't.
+
+        Returns:
+
+            The meshes, in the same order as filenames.
+    """
+
+    meshes = [None] * len(filenames)
+    misses = []
+    for (i, filename) in enumerate(filenames):
+        vertices = None if read_cached is None else read_cached(filename)
+        if vertices is None:
+            misses.append(i)
+        else:
+            meshes[i] = make_mesh(i, vertices)
+
+    if len(misses) == 1:
+        meshes[misses[0]] = make_mesh(misses[0], loader(filenames[misses[0]]))
+    if len(misses) <= 1:
+        return meshes
+
+    #start the tracker before the workers, so that they share it with us.
+    #Otherwise each worker would clean up its blocks when it exits
+    if os.name == "posix":
+        resource_tracker.ensure_running()
+
+    with concurrent.futures.ProcessPoolExecutor() as pool:
+        futures = [
+            pool.submit(parse_into_shared_memory, loader, filenames[i])
+            for i in misses
+        ]
+        for (i, future) in zip(misses, futures):
+            name, shape, dtype = future.result()
+            block = shared_memory.SharedMemory(name = name)
+            try:
+                vertices = np.ndarray(shape, dtype = dtype, buffer = block.buf)
+                meshes[i] = make_mesh(i, vertices)
+                #release our view so the block can be closed
+                del vertices
+            finally:
+                block.close()
+                block.unlink()
+    return meshes
+
+def parse_into_shared_memory(loader, filename: str) -> tuple:
+    """
+        Worker side of load_meshes: parse the file and copy the result
+        into a new shared memory block, which the caller then unlinks.
+
+        Returns:
+
+            (name, shape, dtype) describing the block.
+    """
+
+    vertices = np.ascontiguousarray(loader(filename))
+
+    #shared memory blocks can't be empty
+    block = shared_memory.SharedMemory(create = True, size = max(1, vertices.nbytes))
+    np.ndarray(vertices.shape, dtype = vertices.dtype, buffer = block.buf)[...] = vertices
+    worker_blocks.append(block)
+
+    return (block.name, vertices.shape, vertices.dtype.str)
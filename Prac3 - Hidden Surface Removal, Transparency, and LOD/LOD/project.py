@@ -3,12 +3,39 @@ from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram,compileShader
 import numpy as np
 import pyrr
+import os
+import time
+import obj_loader
+import obj_stream
+import mesh_cache
+import parallel_loader
+import simplify
+import vertex_cache
 
 ################### Constants        ########################################
 
 OBJECT_MONKEY = 0
 OBJECT_CAMERA = 1
 
+#hand made models, most to least detailed, the most detailed one
+#found is simplified into the levels which are drawn
+LEVELS = ["a","b","c","d","e","f","g","h","i","j","k"]
+
+#fraction of the triangles kept at each generated level
+LOD_RATIOS = tuple(0.5 ** i for i in range(1, 8))
+#generated levels are kept here, and rebuilt when their model changes
+LOD_FOLDER = "models/lod"
+#how many pixels a level's error may cover before a finer one is drawn
+LOD_PIXEL_ERROR = 1.0
+
+#obj files bigger than this (in bytes) are streamed in over several frames
+STREAMING_THRESHOLD = 4 << 20
+#seconds per frame spent streaming
+STREAMING_BUDGET = 0.008
+
+#print the memory each indexed mesh saves as it's made
+REPORT_MESH_MEMORY = False
+
 ################### Helper Functions ########################################
 
 def createShader(vertexFilepath: str, fragmentFilepath: str) -> int:
@@ -37,6 +64,49 @@ def createShader(vertexFilepath: str, fragmentFilepath: str) -> int:
     
     return shader
 
+def load_positions(filename: str) -> np.ndarray:
+    """
+        Return the position of every corner of the given obj file,
+        memory mapped from the mesh cache. Triangles are stored in
+        vertex cache friendly order, so that is only worked out once.
+    """
+
+    return mesh_cache.load_mesh(
+        filename, (3,), vertex_cache.load_optimized_positions)
+
+def read_cached_positions(filename: str) -> np.ndarray | None:
+    """
+        Return the positions load_positions would, if the mesh cache
+        already holds them, or None if the file has to be parsed.
+    """
+
+    return mesh_cache.read_cache(filename, (3,))
+
+class TransformCounter:
+    """
+        Counts the matrices built, and the rebuilds skipped because
+        nothing they depend on had changed, over each frame.
+    """
+
+
+    def __init__(self):
+
+        self.built = 0
+        self.skipped = 0
+
+        #the counts of the last finished frame
+        self.built_last_frame = 0
+        self.skipped_last_frame = 0
+    
+    def end_frame(self) -> None:
+
+        self.built_last_frame = self.built
+        self.skipped_last_frame = self.skipped
+        self.built = 0
+        self.skipped = 0
+
+transform_counter = TransformCounter()
+
 ################### Model ###################################################
 
 class Entity:
@@ -69,13 +139,22 @@ class Entity:
         self.color = None
         if color is not None:
             self.color = np.array(color, dtype = np.float32)
+
+        #the position and rotation the model transform was built from
+        self.model_state = None
+        self.model_transform = None
     
     def get_model_transform(self) -> np.ndarray:
         """
-            Calculates and returns the entity's transform matrix,
-            based on its position and rotation.
+            Returns the entity's transform matrix, based on its position
+            and rotation. It's only recalculated when either has changed.
         """
 
+        state = np.concatenate((self.position, self.eulers))
+        if np.array_equal(state, self.model_state):
+            transform_counter.skipped += 1
+            return self.model_transform
+
         model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
         
         model_transform = pyrr.matrix44.multiply(
@@ -94,6 +173,9 @@ class Entity:
             )
         )
 
+        self.model_state = state
+        self.model_transform = model_transform
+        transform_counter.built += 1
         return model_transform
 
     def get_color(self) -> np.ndarray:
@@ -135,6 +217,11 @@ class Camera(Entity):
         self.up = np.array([0,0,1], dtype=np.float32)
         self.right = np.array([0,1,0], dtype=np.float32)
         self.forwards = np.array([1,0,0], dtype=np.float32)
+
+        #the state the vectors and view transform were last calculated from
+        self.vector_eulers = None
+        self.view_state = None
+        self.view_transform = None
     
     def calculate_vectors(self) -> None:
         """ 
@@ -158,19 +245,29 @@ class Camera(Entity):
         self.up = pyrr.vector.normalise(np.cross(self.right, self.forwards))
         
     def update(self) -> None:
-        """ Updates the camera """
+        """ Updates the camera, if it's turned since the last update """
 
-        self.calculate_vectors()
+        if not np.array_equal(self.eulers, self.vector_eulers):
+            self.calculate_vectors()
+            self.vector_eulers = np.copy(self.eulers)
     
     def get_view_transform(self) -> np.ndarray:
         """ Return's the camera's view transform. """
 
-        return pyrr.matrix44.create_look_at(
+        state = np.concatenate((self.position, self.forwards, self.up))
+        if np.array_equal(state, self.view_state):
+            transform_counter.skipped += 1
+            return self.view_transform
+
+        self.view_transform = pyrr.matrix44.create_look_at(
             eye = self.position,
             target = self.position + self.forwards,
             up = self.up,
             dtype = np.float32
         )
+        self.view_state = state
+        transform_counter.built += 1
+        return self.view_transform
         
 class Scene:
     """ 
@@ -240,6 +337,11 @@ class Mesh:
         self.vao = glGenVertexArrays(1)
         self.vbo = glGenBuffers(1)
     
+    def draw(self, mode: int) -> None:
+        """ Draw the mesh, its vertex array must already be bound. """
+
+        glDrawArrays(mode, 0, self.vertex_count)
+    
     def destroy(self):
         
         glDeleteVertexArrays(1, (self.vao,))
@@ -255,7 +357,6 @@ class ObjMesh(Mesh):
         super().__init__()
         vertices = self.loadMesh(filename)
         self.vertex_count = len(vertices)//3
-        vertices = np.array(vertices, dtype=np.float32)
 
         glBindVertexArray(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
@@ -264,48 +365,117 @@ class ObjMesh(Mesh):
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 12, ctypes.c_void_p(0))
     
-    def loadMesh(self, filename) -> list[float]:
+    def loadMesh(self, filename) -> np.ndarray:
+        """
+            Return the position of every corner, memory mapped
+            from the mesh cache so it can be uploaded without a copy.
+        """
 
-        v: list[list[float]] = []
-        vertices: list[float] = []
+        return load_positions(filename)
 
-        #open the obj file and read the data
-        with open(filename,'r') as f:
-            line = f.readline()
-            while line:
-                
-                words = line.split(" ")
-                if words[0]=="v":
-                    v.append(self.read_vertex_data(words))
-                elif words[0]=="f":
-                    self.read_face_data(words, v, vertices)
-                line = f.readline()
+class IndexedObjMesh(ObjMesh):
+    """
+        An obj mesh which stores each unique vertex once,
+        and draws through an element buffer.
+    """
+
+
+    def __init__(self, filename, positions: np.ndarray = None):
+        """
+            Merge the repeated vertices of the given file and upload,
+            positions can be passed in if the file's already been read.
+        """
+
+        Mesh.__init__(self)
+        if positions is None:
+            positions = self.loadMesh(filename)
+        vertices, indices = obj_loader.index_vertices(positions, 3)
+        self.vertex_count = len(indices)
+        self.index_type = GL_UNSIGNED_SHORT \
+            if indices.dtype == np.uint16 else GL_UNSIGNED_INT
+
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+
+        self.ebo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
         
-        return vertices
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 12, ctypes.c_void_p(0))
+
+        if REPORT_MESH_MEMORY:
+            expanded_size = 12 * self.vertex_count
+            indexed_size = vertices.nbytes + indices.nbytes
+            print(
+                f"{filename}: {self.vertex_count} corners -> {len(vertices) // 3} vertices, "
+                f"{expanded_size / 1024:.1f} KB -> {indexed_size / 1024:.1f} KB "
+                f"({(expanded_size - indexed_size) / 1024:.1f} KB saved)"
+            )
     
-    def read_vertex_data(self, words: list[str]) -> list[float]:
-        """ Append the given vertex description to the vertex set."""
+    def draw(self, mode: int) -> None:
+
+        glDrawElements(mode, self.vertex_count, self.index_type, ctypes.c_void_p(0))
+    
+    def destroy(self):
+
+        super().destroy()
+        glDeleteBuffers(1, (self.ebo,))
+
+class StreamedObjMesh(Mesh):
+    """
+        An obj mesh which is read and uploaded a chunk at a time,
+        drawing whatever has arrived so far.
+    """
+
+
+    def __init__(self, filename):
+        """ Open the given file, the data arrives through load_step. """
+
+        super().__init__()
+        self.filename = filename
+        self.stream = obj_stream.ObjStream(filename, attributes = ("v",))
+        self.chunks = self.stream.read()
+        self.allocated = False
+        self.loaded = False
+
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
         
-        return [float(words[1]), float(words[2]), float(words[3])]
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 12, ctypes.c_void_p(0))
     
-    def read_face_data(
-        self, words: list[str], 
-        v: list[list[float]], vertices: list[float]) -> None:
+    def load_step(self) -> None:
+        """ Read the next chunk of the file and upload its corners. """
+
+        first_corner, v_vt_vn = next(self.chunks, (None, None))
+        if first_corner is None:
+            self.loaded = True
+            self.stream = None
+            return
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+
+        if not self.allocated and self.stream.counted:
+            glBufferData(
+                GL_ARRAY_BUFFER, 12 * self.stream.corner_count, 
+                None, GL_STATIC_DRAW)
+            self.allocated = True
         
-        # obj file uses triangle fan format for each face individually.
-        triangleCount = len(words) - 3
-        for i in range(triangleCount):
-            self.read_corner(words[1], v, vertices)
-            self.read_corner(words[i+2], v, vertices)
-            self.read_corner(words[i+3], v, vertices)
+        if len(v_vt_vn) == 0:
+            return
+        
+        positions = self.stream.build_positions(v_vt_vn)
+        glBufferSubData(
+            GL_ARRAY_BUFFER, 12 * first_corner, positions.nbytes, positions)
+        self.vertex_count = first_corner + len(v_vt_vn)
     
-    def read_corner(
-        self, description: str,
-        v: list[list[float]], vertices: list[float]) -> None:
+    def get_progress(self) -> float:
 
-        v_vt_vn = description.split("/")
-        for element in v[int(v_vt_vn[0]) - 1]:
-            vertices.append(element)
+        if self.loaded:
+            return 1.0
+        return self.stream.get_progress()
 
 class Renderer:
 
@@ -341,11 +511,43 @@ class Renderer:
             Load/Create assets (eg. meshes and materials) that the renderer will use.
         """
 
+        self.streaming: list[StreamedObjMesh] = []
+
+        sources = [
+            filename for filename in (f"models/monkey_{level}.obj" for level in LEVELS)
+            if os.path.exists(filename)
+        ]
+        if not sources:
+            raise FileNotFoundError(
+                f"No monkey models found, expected models/monkey_{LEVELS[0]}.obj "
+                f"to models/monkey_{LEVELS[-1]}.obj")
+
+        #the full detail model, then the levels simplified from it
+        levels = [sources[0]] + simplify.ensure_lod_chain(
+            sources[0], LOD_FOLDER, LOD_RATIOS)
+        self.level_errors = [simplify.read_level_error(filename) for filename in levels]
+
+        #read every level which fits in memory at once
+        filenames = [
+            filename for filename in levels
+            if os.path.getsize(filename) <= STREAMING_THRESHOLD
+        ]
+        loaded_meshes = dict(zip(filenames, parallel_loader.load_meshes(
+            filenames, load_positions,
+            lambda i, positions: IndexedObjMesh(filenames[i], positions),
+            read_cached_positions
+        )))
+
+        monkeys: list[Mesh] = []
+        for filename in levels:
+            if filename in loaded_meshes:
+                monkeys.append(loaded_meshes[filename])
+            else:
+                monkeys.append(StreamedObjMesh(filename))
+                self.streaming.append(monkeys[-1])
+
         self.meshes: dict[int, list[Mesh]] = {
-            OBJECT_MONKEY: [
-                ObjMesh(f"models/monkey_{level}.obj") 
-                for level in ["a","b","c","d","e","f","g","h","i","j","k"]
-            ],
+            OBJECT_MONKEY: monkeys,
         }
 
         self.shader = createShader("shaders/vertex.txt", "shaders/fragment.txt")
@@ -354,10 +556,13 @@ class Renderer:
         """ Set any uniforms which can simply get set once and forgotten """
         
         glUseProgram(self.shader)
+        fovy = 45
         projection_transform = pyrr.matrix44.create_perspective_projection(
-            fovy = 45, aspect = self.screenWidth / self.screenHeight, 
+            fovy = fovy, aspect = self.screenWidth / self.screenHeight, 
             near = 0.5, far = 100, dtype = np.float32
         )
+        #the angle LOD_PIXEL_ERROR pixels cover, for picking levels
+        self.lod_tolerance = LOD_PIXEL_ERROR * np.radians(fovy) / self.screenHeight
         glUniformMatrix4fv(
             glGetUniformLocation(self.shader, "projection"), 
             1, GL_FALSE, projection_transform
@@ -373,37 +578,11 @@ class Renderer:
 
     def get_level(self, dist: float) -> int:
         """
-        a:  0+ :  0
-        b: 10+ :  1
-        c: 20+ :  2
-        d: 30+ :  3
-        e: 40+ :  4
-        f: 50+ :  5
-        h: 60+ :  6
-        i: 70+ :  7
-        j: 80+ :  8
-        k: 90+ :  9
+            Return the coarsest level whose geometric error, seen from
+            the given distance, covers at most LOD_PIXEL_ERROR pixels.
         """
 
-        if dist > 90:
-            return 9
-        if dist > 80:
-            return 8
-        if dist > 70:
-            return 7
-        if dist > 60:
-            return 6
-        if dist > 50:
-            return 5
-        if dist > 40:
-            return 4
-        if dist > 30:
-            return 3
-        if dist > 20:
-            return 2
-        if dist > 10:
-            return 1
-        return 0
+        return simplify.select_level(self.level_errors, dist, self.lod_tolerance)
     
     def render(
         self, camera: Camera, 
@@ -445,10 +624,33 @@ class Renderer:
                     self.objectColorLocation,
                     1, object.get_color()
                 )
-                glDrawArrays(GL_LINES, 0, mesh.vertex_count)
+                mesh.draw(GL_LINES)
 
         pg.display.flip()
     
+    def stream_meshes(self, time_budget: float) -> str:
+        """
+            Keep loading any streamed meshes for roughly the given
+            number of seconds.
+
+            Returns:
+
+                A progress message, or an empty string
+                once every mesh has finished loading.
+        """
+
+        deadline = time.perf_counter() + time_budget
+        while self.streaming and time.perf_counter() < deadline:
+            mesh = self.streaming[0]
+            mesh.load_step()
+            if mesh.loaded:
+                self.streaming.pop(0)
+        
+        if not self.streaming:
+            return ""
+        mesh = self.streaming[0]
+        return f"Loading {mesh.filename}: {100 * mesh.get_progress():.0f}%"
+    
     def destroy(self):
         for (_,meshGroup) in self.meshes.items():
             for mesh in meshGroup:
@@ -522,6 +724,8 @@ class App:
         """ Run the App """
 
         running = True
+        window_caption = pg.display.get_caption()[0]
+        caption = window_caption
         while (running):
             #check events
             for event in pg.event.get():
@@ -532,6 +736,9 @@ class App:
             
             self.handleKeys()
             self.handleMouse()
+
+            #stream in big models without stalling the window
+            message = self.renderer.stream_meshes(STREAMING_BUDGET)
             
             #update scene
             self.scene.update()
@@ -545,6 +752,15 @@ class App:
             #timing
             self.clock.tick(60)
 
+            #show loading progress, or else the transform builds skipped
+            skipped = transform_counter.skipped
+            transform_counter.end_frame()
+            if not message:
+                message = f"{window_caption}: {skipped} transform builds skipped"
+            if message != caption:
+                caption = message
+                pg.display.set_caption(caption)
+
         self.quit()
     
     def handleKeys(self) -> None:
@@ -596,4 +812,6 @@ class App:
     def quit(self):
         self.renderer.destroy()
 
-myApp = App()
\ No newline at end of file
+if __name__ == "__main__":
+    #the loading pool's workers import this file, they mustn't start an App
+    myApp = App()
\ No newline at end of file
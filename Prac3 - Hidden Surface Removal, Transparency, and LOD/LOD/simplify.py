@@ -0,0 +1,809 @@
+import argparse
+import os
+import shutil
+import tempfile
+import warnings
+import numpy as np
+import obj_loader
+
+################### Constants        ########################################
+
+#how strongly open edges (eg. the monkey's eye sockets) and seams hold their shape
+BOUNDARY_WEIGHT = 10.0
+
+#collapses which turn a triangle more than this far over are refused
+MIN_NORMAL_DOT = 0.2
+
+#how far from its edge a solved position may drift, as a multiple of
+#the edge's length, before the midpoint is used instead
+MAX_TARGET_DRIFT = 2.0
+
+#share of the cheapest edges considered for each batch of collapses
+BATCH_FRACTION = 0.25
+
+#fraction of the original triangles kept at each generated level
+DEFAULT_RATIOS = (0.5, 0.25, 0.125, 0.0625)
+
+#written at the top of every generated obj file
+ERROR_COMMENT = "# geometric error"
+
+################### Simplification ############################################
+
+class Simplifier:
+    """
+        Simplifies a triangle mesh by quadric error edge collapses.
+
+        Every vertex carries a quadric, the summed squared distance to
+        the planes of the triangles around it, weighted by their area.
+        Collapsing an edge adds the quadrics of its ends, and the error
+        of a collapse is the root mean square distance that quadric
+        gives at the best new position, so the error of earlier
+        collapses carries through to later ones.
+
+        Rather than collapsing edges one at a time through a priority
+        queue, each pass scores every edge at once and collapses a batch
+        of cheap edges which are far enough apart not to affect each
+        other.
+
+        Corner attributes (eg. texcoords and normals) are kept per wedge,
+        the corners of a vertex which share their values, so a vertex on
+        a seam has a wedge for each side. Seams hold their shape like
+        open edges do, and collapses carry the wedges along with them.
+    """
+
+
+    def __init__(
+        self, positions: np.ndarray, triangles: np.ndarray,
+        attributes: np.ndarray = None):
+        """
+            Parameters:
+
+                positions: (n,3) vertex positions
+
+                triangles: (m,3) vertex indices
+
+                attributes: optional (m,3,k) values at every corner
+                    of every triangle
+        """
+
+        self.positions = np.array(positions, dtype=np.float64).reshape(-1, 3)
+        self.triangles = np.array(triangles, dtype=np.int64).reshape(-1, 3)
+        self.wedges, self.wedge_values = get_wedges(self.triangles, attributes)
+        self.quadrics, self.weights = self.get_vertex_quadrics()
+        self.error = 0.0
+        #fixed seed so that the same mesh always simplifies the same way
+        self.random = np.random.default_rng(0)
+
+    def get_vertex_quadrics(self) -> tuple[np.ndarray]:
+        """
+            Sum the quadric of every triangle, weighted by its area,
+            into its corners. Open edges, and seams where the corner
+            attributes change, also get a plane at right angles to their
+            triangle, so that they resist moving inwards.
+
+            Returns:
+
+                (quadrics, weights): the (n,4,4) quadric of every vertex
+                and the total weight of the planes in it.
+        """
+
+        normals, areas = get_triangle_normals(self.positions, self.triangles)
+        planes = np.concatenate(
+            (normals, -(normals * self.positions[self.triangles[:, 0]]).sum(axis=1, keepdims=True)),
+            axis=1)
+        quadrics = get_plane_quadrics(planes, areas)
+
+        vertex_count = len(self.positions)
+        result = scatter_quadrics(vertex_count, self.triangles, quadrics)
+        weights = scatter_weights(vertex_count, self.triangles, areas)
+
+        edges, owners, counts = get_edges(self.triangles)
+        is_boundary = (counts == 1) | get_seams(self.triangles, self.wedges, edges)
+        if is_boundary.any():
+            boundary = edges[is_boundary]
+            along = self.positions[boundary[:, 1]] - self.positions[boundary[:, 0]]
+            across = np.cross(along, normals[owners[is_boundary]])
+            lengths = np.linalg.norm(across, axis=1, keepdims=True)
+            across = np.divide(across, lengths, out=np.zeros_like(across), where=lengths > 0)
+            planes = np.concatenate(
+                (across, -(across * self.positions[boundary[:, 0]]).sum(axis=1, keepdims=True)),
+                axis=1)
+            boundary_weights = BOUNDARY_WEIGHT * (along * along).sum(axis=1)
+            result += scatter_quadrics(
+                vertex_count, boundary, get_plane_quadrics(planes, boundary_weights))
+            weights += scatter_weights(vertex_count, boundary, boundary_weights)
+
+        return (result, weights)
+
+    def reduce(self, target_triangles: int, max_error: float = np.inf) -> None:
+        """
+            Collapse edges until the mesh has at most the given number of
+            triangles, or the next collapse would exceed the given error.
+        """
+
+        while len(self.triangles) > target_triangles:
+
+            edges, _, counts = get_edges(self.triangles)
+            targets, errors = self.get_collapse_targets(edges)
+            candidates = (errors <= max_error) & self.keeps_manifold(edges, counts)
+
+            #each collapse removes about two triangles
+            wanted = max(1, (len(self.triangles) - target_triangles) // 2)
+
+            #refused edges would otherwise keep blocking their neighbours,
+            #so pick again without them until something gets through
+            selected = np.zeros(len(edges), dtype=bool)
+            while candidates.any() and not selected.any():
+                picked = self.select_collapses(edges, errors, candidates, wanted)
+                selected = self.refuse_flips(edges, targets, picked)
+                candidates &= ~picked
+            if not selected.any():
+                break
+
+            self.collapse(edges[selected], targets[selected])
+            self.error = max(self.error, float(errors[selected].max()))
+
+    def get_collapse_targets(self, edges: np.ndarray) -> tuple[np.ndarray]:
+        """
+            Find where each edge should collapse to, and the error
+            that would introduce.
+
+            The quadric's minimum is used where it's well defined and
+            close to the edge, otherwise the cheapest of the two ends
+            and the midpoint.
+        """
+
+        quadrics = self.quadrics[edges[:, 0]] + self.quadrics[edges[:, 1]]
+        a = self.positions[edges[:, 0]]
+        b = self.positions[edges[:, 1]]
+        candidates = [a, b, (a + b) / 2]
+
+        matrices = quadrics[:, :3, :3]
+        solvable = np.abs(np.linalg.det(matrices)) > 1e-12
+        if solvable.any():
+            solved = (a + b) / 2
+            solved[solvable] = np.linalg.solve(
+                matrices[solvable], -quadrics[solvable, :3, 3:4])[:, :, 0]
+            drift = np.linalg.norm(solved - (a + b) / 2, axis=1)
+            too_far = drift > MAX_TARGET_DRIFT * np.linalg.norm(b - a, axis=1)
+            solved[too_far] = ((a + b) / 2)[too_far]
+            candidates.append(solved)
+
+        costs = np.stack([evaluate_quadrics(quadrics, p) for p in candidates])
+        best = np.argmin(costs, axis=0)
+        rows = np.arange(len(edges))
+        targets = np.stack(candidates)[best, rows]
+
+        weights = self.weights[edges[:, 0]] + self.weights[edges[:, 1]]
+        errors = np.sqrt(np.maximum(costs[best, rows], 0) / np.maximum(weights, 1e-30))
+        return (targets, errors)
+
+    def select_collapses(
+        self, edges: np.ndarray, errors: np.ndarray,
+        candidates: np.ndarray, wanted: int) -> np.ndarray:
+        """
+            Pick a batch of cheap edges, no two of which touch the same
+            vertex or are joined by an edge, so that each collapse
+            can be worked out independently.
+
+            Ranking strictly by error only lets a handful through, as
+            cheap edges tend to sit next to each other. Instead the
+            cheapest fraction of the candidates are ranked at random.
+        """
+
+        order = np.flatnonzero(candidates)
+        order = order[np.argsort(errors[order], kind="stable")]
+        pool = order[: max(wanted, int(len(order) * BATCH_FRACTION))]
+
+        rank = np.full(len(edges), np.inf)
+        rank[pool] = self.random.permutation(len(pool))
+
+        a, b = edges[:, 0], edges[:, 1]
+        vertex_best = np.full(len(self.positions), np.inf)
+        np.minimum.at(vertex_best, a, rank)
+        np.minimum.at(vertex_best, b, rank)
+        neighbour_best = vertex_best.copy()
+        np.minimum.at(neighbour_best, a, vertex_best[b])
+        np.minimum.at(neighbour_best, b, vertex_best[a])
+
+        selected = np.isfinite(rank) & (neighbour_best[a] == rank) & (neighbour_best[b] == rank)
+
+        #don't overshoot the target
+        if np.count_nonzero(selected) > wanted:
+            cheapest = np.flatnonzero(selected)
+            cheapest = cheapest[np.argsort(errors[cheapest], kind="stable")]
+            selected[cheapest[wanted:]] = False
+        return selected
+
+    def refuse_flips(
+        self, edges: np.ndarray, targets: np.ndarray,
+        selected: np.ndarray) -> np.ndarray:
+        """ Drop collapses which would turn a triangle over. """
+
+        for _ in range(4):
+            if not selected.any():
+                break
+            remap, positions = self.apply_collapses(edges[selected], targets[selected])
+            triangles = remap[self.triangles]
+            degenerate = (triangles[:, 0] == triangles[:, 1]) \
+                | (triangles[:, 1] == triangles[:, 2]) \
+                | (triangles[:, 0] == triangles[:, 2])
+            moved = np.isin(self.triangles, edges[selected]).any(axis=1) & ~degenerate
+            if not moved.any():
+                break
+
+            before, _ = get_triangle_normals(self.positions, self.triangles[moved])
+            after, after_areas = get_triangle_normals(positions, triangles[moved])
+            flipped = ((before * after).sum(axis=1) < MIN_NORMAL_DOT) | (after_areas <= 0)
+            if not flipped.any():
+                break
+
+            #refuse every collapse which moved a flipped triangle
+            bad_vertices = np.unique(triangles[moved][flipped])
+            selected = selected & ~np.isin(edges[:, 0], bad_vertices)
+
+        return selected
+
+    def keeps_manifold(self, edges: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """
+            The link condition: the ends of an edge may only share as
+            many neighbours as there are triangles on the edge, any more
+            and collapsing it would pinch the surface.
+
+            Parameters:
+
+                edges, counts: the mesh's edges as given by get_edges
+        """
+
+        keys = edges[:, 0] * len(self.positions) + edges[:, 1]
+
+        #both directions of every edge, grouped by the first vertex
+        both = np.concatenate((edges, edges[:, ::-1]))
+        order = np.argsort(both[:, 0], kind="stable")
+        neighbours = both[order, 1]
+        starts = np.searchsorted(both[order, 0], np.arange(len(self.positions)))
+        ends = np.searchsorted(both[order, 0], np.arange(len(self.positions)), side="right")
+
+        a, b = edges[:, 0], edges[:, 1]
+        neighbour_count = ends[a] - starts[a]
+        owner = np.repeat(np.arange(len(edges)), neighbour_count)
+        positions = np.arange(neighbour_count.sum()) \
+            - np.repeat(np.cumsum(neighbour_count) - neighbour_count, neighbour_count)
+        neighbour = neighbours[starts[a][owner] + positions]
+
+        low = np.minimum(neighbour, b[owner])
+        high = np.maximum(neighbour, b[owner])
+        shared = np.isin(low * len(self.positions) + high, keys) & (neighbour != b[owner])
+        shared_count = np.bincount(owner[shared], minlength=len(edges))
+
+        return shared_count <= counts
+
+    def apply_collapses(
+        self, edges: np.ndarray, targets: np.ndarray) -> tuple[np.ndarray]:
+        """
+            Return the vertex remapping and new positions the given
+            collapses would produce, without applying them.
+        """
+
+        remap = np.arange(len(self.positions))
+        remap[edges[:, 1]] = edges[:, 0]
+        positions = self.positions.copy()
+        positions[edges[:, 0]] = targets
+        return (remap, positions)
+
+    def collapse(self, edges: np.ndarray, targets: np.ndarray) -> None:
+        """ Merge the far end of every given edge into its near end. """
+
+        self.merge_wedges(edges, targets)
+
+        remap, self.positions = self.apply_collapses(edges, targets)
+        self.quadrics[edges[:, 0]] += self.quadrics[edges[:, 1]]
+        self.weights[edges[:, 0]] += self.weights[edges[:, 1]]
+
+        triangles = remap[self.triangles]
+        degenerate = (triangles[:, 0] == triangles[:, 1]) \
+            | (triangles[:, 1] == triangles[:, 2]) \
+            | (triangles[:, 0] == triangles[:, 2])
+        self.triangles = triangles[~degenerate]
+        self.wedges = self.wedges[~degenerate]
+
+    def merge_wedges(self, edges: np.ndarray, targets: np.ndarray) -> None:
+        """
+            Carry the corner attributes through the given collapses.
+
+            Each triangle on an edge pairs a wedge at its near end with
+            one at its far end, and the far wedge is merged into the near
+            one. A far wedge which nothing pairs, on a seam the near end
+            isn't on, stays separate. Every wedge that moves then takes
+            the values found where its vertex lands, in whichever of its
+            triangles around the two ends the vertex lands closest to.
+        """
+
+        near = np.full(len(self.positions), -1)
+        near[edges[:, 0]] = np.arange(len(edges))
+        far = np.full(len(self.positions), -1)
+        far[edges[:, 1]] = np.arange(len(edges))
+
+        remap = np.arange(len(self.wedge_values))
+        for (p, q) in ((0, 1), (1, 0), (1, 2), (2, 1), (2, 0), (0, 2)):
+            edge = near[self.triangles[:, p]]
+            on_edge = (edge >= 0) & (far[self.triangles[:, q]] == edge)
+            remap[self.wedges[on_edge, q]] = self.wedges[on_edge, p]
+
+        moved, values, outside = [], [], []
+        for p in range(3):
+            corners = [p, (p + 1) % 3, (p + 2) % 3]
+            edge = np.maximum(near[self.triangles[:, p]], far[self.triangles[:, p]])
+            involved = edge >= 0
+            wedges = self.wedges[involved][:, corners]
+            weights, distance = get_barycentrics(
+                self.positions[self.triangles[involved][:, corners]],
+                targets[edge[involved]])
+
+            moved.append(remap[wedges[:, 0]])
+            values.append(np.einsum("ij,ijk->ik", weights, self.wedge_values[wedges]))
+            outside.append(distance)
+        self.wedges = remap[self.wedges]
+
+        #the last write to a wedge wins, so write the closest triangle last
+        order = np.argsort(-np.concatenate(outside), kind="stable")
+        self.wedge_values[np.concatenate(moved)[order]] = np.concatenate(values)[order]
+
+    def get_mesh(self) -> tuple[np.ndarray]:
+        """
+            Return the current (positions, triangles, attributes), with
+            any vertices no longer used by a triangle left out. The
+            attributes are the (m,3,k) values at every corner.
+        """
+
+        used, triangles = np.unique(self.triangles, return_inverse=True)
+        return (
+            self.positions[used].astype(np.float32),
+            triangles.reshape(-1, 3),
+            self.wedge_values[self.wedges].astype(np.float32)
+        )
+
+################### Geometry ##################################################
+
+def get_triangle_normals(
+    positions: np.ndarray, triangles: np.ndarray) -> tuple[np.ndarray]:
+    """ Return the unit normal and area of every triangle. """
+
+    p0, p1, p2 = (positions[triangles[:, i]] for i in range(3))
+    normals = np.cross(p1 - p0, p2 - p0)
+    lengths = np.linalg.norm(normals, axis=1)
+    normals = np.divide(
+        normals, lengths[:, None], out=np.zeros_like(normals), where=lengths[:, None] > 0)
+    return (normals, lengths / 2)
+
+def get_barycentrics(corners: np.ndarray, points: np.ndarray) -> tuple[np.ndarray]:
+    """
+        Find where points fall in triangles.
+
+        Parameters:
+
+            corners: (n,3,3) the corner positions of every triangle
+
+            points: (n,3) a point for every triangle, projected onto
+                its plane
+
+        Returns:
+
+            (weights, outside): the (n,3) barycentric weights of every
+            point, clamped into its triangle, and how far outside the
+            triangle it was in those weights.
+    """
+
+    e0 = corners[:, 1] - corners[:, 0]
+    e1 = corners[:, 2] - corners[:, 0]
+    offset = points - corners[:, 0]
+    d00 = (e0 * e0).sum(axis=1)
+    d01 = (e0 * e1).sum(axis=1)
+    d11 = (e1 * e1).sum(axis=1)
+    d20 = (offset * e0).sum(axis=1)
+    d21 = (offset * e1).sum(axis=1)
+    denominator = d00 * d11 - d01 * d01
+
+    #degenerate triangles just take the first corner
+    safe = np.where(np.abs(denominator) > 1e-30, denominator, 1)
+    w1 = np.where(denominator != safe, 0, (d11 * d20 - d01 * d21) / safe)
+    w2 = np.where(denominator != safe, 0, (d00 * d21 - d01 * d20) / safe)
+    weights = np.stack((1 - w1 - w2, w1, w2), axis=1)
+
+    outside = np.maximum(-weights, 0).sum(axis=1)
+    weights = np.maximum(weights, 0)
+    return (weights / weights.sum(axis=1, keepdims=True), outside)
+
+def get_plane_quadrics(planes: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """ Return the weighted quadric (a 4x4 outer product) of every plane. """
+
+    return weights[:, None, None] * planes[:, :, None] * planes[:, None, :]
+
+def scatter_quadrics(
+    vertex_count: int, owners: np.ndarray, quadrics: np.ndarray) -> np.ndarray:
+    """ Sum each quadric into every vertex listed next to it. """
+
+    result = np.zeros((vertex_count, 16))
+    flat = quadrics.reshape(-1, 16)
+    for column in range(owners.shape[1]):
+        for i in range(16):
+            result[:, i] += np.bincount(owners[:, column], flat[:, i], minlength=vertex_count)
+    return result.reshape(-1, 4, 4)
+
+def scatter_weights(
+    vertex_count: int, owners: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """ Sum each weight into every vertex listed next to it. """
+
+    return sum(
+        np.bincount(owners[:, column], weights, minlength=vertex_count)
+        for column in range(owners.shape[1]))
+
+def evaluate_quadrics(quadrics: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """ Return v^T Q v for every quadric and point pair, v = (x, y, z, 1). """
+
+    v = np.concatenate((points, np.ones((len(points), 1))), axis=1)
+    return np.einsum("ni,nij,nj->n", v, quadrics, v)
+
+def get_edges(triangles: np.ndarray) -> tuple[np.ndarray]:
+    """
+        Return the unique edges of a triangle list, sorted by vertex.
+
+        Returns:
+
+            (edges, owners, counts): (e,2) vertex pairs with the lower
+            index first, a triangle using each edge and how many
+            triangles use it.
+    """
+
+    pairs = np.concatenate((triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]))
+    pairs.sort(axis=1)
+    faces = np.tile(np.arange(len(triangles)), 3)
+    edges, first, counts = np.unique(pairs, axis=0, return_index=True, return_counts=True)
+    return (edges, faces[first], counts)
+
+def get_wedges(
+    triangles: np.ndarray, attributes: np.ndarray = None) -> tuple[np.ndarray]:
+    """
+        Group the corners of a mesh into wedges, the corners on the
+        same vertex with the same attributes.
+
+        Returns:
+
+            (wedges, values): the (m,3) wedge of every corner and the
+            (w,k) attributes of every wedge.
+    """
+
+    corners = triangles.reshape(-1, 1).astype(np.float64)
+    if attributes is not None:
+        attributes = np.asarray(attributes, dtype=np.float64)
+        corners = np.concatenate(
+            (corners, attributes.reshape(len(corners), attributes.shape[-1])), axis=1)
+
+    unique_corners, wedges = np.unique(corners, axis=0, return_inverse=True)
+    return (wedges.reshape(-1, 3), unique_corners[:, 1:])
+
+def get_seams(
+    triangles: np.ndarray, wedges: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+        Return which of the given edges, as from get_edges, are seams:
+        the triangles either side of them see different wedges at
+        their ends.
+    """
+
+    pairs = np.concatenate((triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]))
+    ends = np.concatenate((wedges[:, [0, 1]], wedges[:, [1, 2]], wedges[:, [2, 0]]))
+    swapped = pairs[:, 0] > pairs[:, 1]
+    ends[swapped] = ends[swapped, ::-1]
+    pairs.sort(axis=1)
+    _, edge = np.unique(pairs, axis=0, return_inverse=True)
+    edge = edge.ravel()
+
+    codes = ends[:, 0] * (wedges.max() + 1) + ends[:, 1]
+    lowest = np.full(len(edges), np.iinfo(np.int64).max)
+    np.minimum.at(lowest, edge, codes)
+    highest = np.full(len(edges), -1, dtype=np.int64)
+    np.maximum.at(highest, edge, codes)
+    return lowest != highest
+
+################### Level Of Detail ###########################################
+
+def generate_lod_chain(
+    positions: np.ndarray, triangles: np.ndarray,
+    ratios: list[float] = None, errors: list[float] = None,
+    attributes: np.ndarray = None) -> list[tuple]:
+    """
+        Simplify a mesh into a chain of levels.
+
+        Each level continues from the one before, so the quadrics and
+        error carry down the whole chain.
+
+        Parameters:
+
+            positions, triangles: the full detail mesh
+
+            ratios: fraction of the original triangles to keep at each
+                level, eg. [0.5, 0.25, 0.125], defaults to DEFAULT_RATIOS
+
+            errors: alternatively, the geometric error each level may
+                reach, in model units
+
+            attributes: optional (m,3,k) values at every triangle
+                corner, carried through to every level
+
+        Returns:
+
+            A (positions, triangles, attributes, error) tuple for every
+            level, the attributes being (m,3,k) like the ones given.
+    """
+
+    simplifier = Simplifier(positions, triangles, attributes)
+    original_count = len(simplifier.triangles)
+    if errors is None:
+        steps = [
+            (int(ratio * original_count), np.inf)
+            for ratio in (ratios or DEFAULT_RATIOS)]
+    else:
+        steps = [(0, error) for error in errors]
+
+    levels = []
+    for (target_triangles, max_error) in steps:
+        simplifier.reduce(target_triangles, max_error)
+        levels.append((*simplifier.get_mesh(), simplifier.error))
+    return levels
+
+def select_level(level_errors: list[float], distance: float, tolerance: float) -> int:
+    """
+        Return the coarsest level whose error, seen from the given
+        distance, stays within the tolerance (roughly radians, so
+        0.002 is a pixel or so at 640 pixels across a 45 degree view).
+        Levels are ordered from most to least detailed.
+    """
+
+    level = 0
+    for (i, error) in enumerate(level_errors):
+        if error <= tolerance * distance:
+            level = i
+    return level
+
+################### Files #####################################################
+
+class ObjFile:
+    """
+        An obj file read for simplification: its triangles, the texcoord,
+        normal and material at every corner, and the material libraries
+        to point the levels written from it at.
+
+        Flat shaded files, which give every face a single normal, would
+        make each edge a seam, so their normals aren't carried but
+        worked out again for every level.
+    """
+
+
+    def __init__(self, filename: str):
+
+        self.folder = os.path.dirname(filename) or "."
+
+        v, vt, vn, v_vt_vn = obj_loader.read_obj(filename)
+        self.positions = v
+        self.triangles = v_vt_vn[:, 0].reshape(-1, 3)
+        self.has_texcoords = bool((v_vt_vn[:, 1] >= 0).any())
+        self.has_normals = bool((v_vt_vn[:, 2] >= 0).any())
+
+        text = obj_loader.ObjText(np.fromfile(filename, dtype=np.uint8))
+        self.libraries = [
+            library for line in read_lines(text, "mtllib")
+            for library in line.split()]
+        names = read_lines(text, "usemtl")
+        self.materials = [None] + list(dict.fromkeys(names))
+
+        #the material of every line, 0 for none before the first usemtl
+        switches = np.array([0] + [self.materials.index(name) for name in names])
+        line_materials = switches[np.cumsum(text.find_lines("usemtl"))]
+        faces = text.find_lines("f")
+        materials = np.repeat(line_materials[faces], text.tokens_in_line[faces] - 3)
+
+        #s, t, nx, ny, nz, material
+        vertices = obj_loader.build_vertices(v, vt, vn, v_vt_vn)
+        normals = vertices[:, 5:8].reshape(-1, 3, 3)
+        self.flat_normals = self.has_normals and bool((normals == normals[:, :1]).all())
+        if self.flat_normals:
+            vertices[:, 5:8] = 0
+        self.attributes = np.concatenate(
+            (vertices[:, 3:8], np.repeat(materials, 3)[:, None]), axis=1
+        ).reshape(-1, 3, 6)
+
+    def write_level(
+        self, filename: str, positions: np.ndarray, triangles: np.ndarray,
+        attributes: np.ndarray, error: float) -> None:
+        """
+            Write a level simplified from this file as an obj file, with
+            its error in a comment. It goes through a temporary file, so
+            a half written level is never read.
+        """
+
+        folder = os.path.dirname(filename) or "."
+        corners = attributes.reshape(-1, attributes.shape[-1])
+        columns = [triangles.reshape(-1, 1) + 1]
+        corner_format = "%d"
+        blocks = [("v %.6f %.6f %.6f", positions)]
+
+        if self.has_texcoords:
+            texcoords, index = np.unique(corners[:, 0:2], axis=0, return_inverse=True)
+            blocks.append(("vt %.6f %.6f", texcoords))
+            columns.append(index.reshape(-1, 1) + 1)
+            corner_format += "/%d"
+        if self.has_normals:
+            if self.flat_normals:
+                normals = np.repeat(get_triangle_normals(positions, triangles)[0], 3, axis=0)
+            else:
+                #merged normals are blends, so bring them back to unit length
+                normals = corners[:, 2:5]
+                lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+                normals = np.divide(
+                    normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+            normals, index = np.unique(normals, axis=0, return_inverse=True)
+            blocks.append(("vn %.6f %.6f %.6f", normals))
+            columns.append(index.reshape(-1, 1) + 1)
+            corner_format += "//%d" if not self.has_texcoords else "/%d"
+
+        faces = np.concatenate(columns, axis=1).reshape(len(triangles), -1)
+        face_format = "f " + " ".join([corner_format] * 3)
+        materials = np.rint(corners[::3, 5]).astype(np.int64)
+        libraries = [self.get_library_path(library, folder) for library in self.libraries]
+
+        temp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "w", dir = folder, prefix = os.path.basename(filename),
+                suffix = ".tmp", delete = False) as f:
+                temp_path = f.name
+                f.write(f"{ERROR_COMMENT} {error:.6g}\n")
+                f.write(f"# {len(triangles)} triangles\n")
+                for library in libraries:
+                    f.write(f"mtllib {library}\n")
+                for (line_format, data) in blocks:
+                    np.savetxt(f, data, fmt=line_format)
+                for material in np.unique(materials):
+                    if self.materials[material] is not None:
+                        f.write(f"usemtl {self.materials[material]}\n")
+                    np.savetxt(f, faces[materials == material], fmt=face_format)
+            os.replace(temp_path, filename)
+        except OSError:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def get_library_path(self, library: str, folder: str) -> str:
+        """
+            Return how a level written into the given folder should name
+            one of this file's material libraries. Readers split mtllib
+            on whitespace, so when the relative path has any the library
+            is copied into the folder and named by its basename.
+        """
+
+        source = os.path.join(self.folder, library)
+        path = os.path.relpath(source, folder)
+        if not any(c.isspace() for c in path):
+            return path
+
+        path = os.path.basename(library)
+        if any(c.isspace() for c in path):
+            raise ValueError(f"mtllib can't name {library!r}, it has whitespace in it")
+        target = os.path.join(folder, path)
+        if not os.path.exists(target) \
+            or os.path.getmtime(target) < os.path.getmtime(source):
+            shutil.copyfile(source, target)
+        return path
+
+def read_lines(text: obj_loader.ObjText, flag: str) -> list[str]:
+    """ Return what follows the flag on every line starting with it. """
+
+    is_flagged = text.find_lines(flag)
+    return [
+        text.data[start : start + length].tobytes().decode()[len(flag):].strip()
+        for (start, length) in zip(
+            text.line_starts[is_flagged], text.line_lengths[is_flagged])
+    ]
+
+def read_level_error(filename: str) -> float:
+    """
+        Return the error recorded in a generated obj file,
+        or 0 for a file written by hand.
+    """
+
+    with open(filename, "r") as f:
+        line = f.readline()
+    if line.startswith(ERROR_COMMENT):
+        return float(line[len(ERROR_COMMENT):])
+    return 0.0
+
+def get_level_filenames(filename: str, folder: str, count: int) -> list[str]:
+    """
+        The levels of an obj file are written next to it (or into the
+        given folder) as name_lod1.obj, name_lod2.obj and so on.
+    """
+
+    folder = folder or os.path.dirname(filename) or "."
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return [f"{folder}/{name}_lod{i + 1}.obj" for i in range(count)]
+
+def write_lod_chain(
+    filename: str, folder: str = None,
+    ratios: list[float] = None, errors: list[float] = None) -> list[tuple]:
+    """
+        Generate a chain of levels from an obj file and write each one
+        out, see get_level_filenames. Texcoords, normals and materials
+        are carried through. See generate_lod_chain for the ratios and
+        errors.
+
+        Returns:
+
+            A (filename, triangle count, error) tuple for every level.
+    """
+
+    source = ObjFile(filename)
+    levels = generate_lod_chain(
+        source.positions, source.triangles, ratios, errors, source.attributes)
+
+    filenames = get_level_filenames(filename, folder, len(levels))
+    os.makedirs(os.path.dirname(filenames[0]), exist_ok = True)
+
+    written = []
+    for (level_filename, (positions, triangles, attributes, error)) in zip(filenames, levels):
+        source.write_level(level_filename, positions, triangles, attributes, error)
+        written.append((level_filename, len(triangles), error))
+    return written
+
+def ensure_lod_chain(
+    filename: str, folder: str = None, ratios: list[float] = None) -> list[str]:
+    """
+        Return the filenames of the levels generated from an obj file,
+        generating them first if any is missing or older than the file.
+
+        If they can't be written a warning is given and no levels are
+        returned, so the caller carries on with the full detail mesh.
+    """
+
+    ratios = ratios or DEFAULT_RATIOS
+    filenames = get_level_filenames(filename, folder, len(ratios))
+    source_time = os.path.getmtime(filename)
+    if all(
+        os.path.exists(level) and os.path.getmtime(level) >= source_time
+        for level in filenames):
+        return filenames
+
+    try:
+        return [level for (level, _, _) in write_lod_chain(filename, folder, ratios)]
+    except (OSError, ValueError) as error:
+        warnings.warn(f"Couldn't write the levels of {filename}: {error}")
+        return []
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description = "Generate a chain of simplified levels from an obj file.")
+    parser.add_argument("filename", help = "the full detail obj file")
+    targets = parser.add_mutually_exclusive_group()
+    targets.add_argument(
+        "--ratios", type = float, nargs = "+", default = DEFAULT_RATIOS,
+        help = "fraction of triangles to keep at each level")
+    targets.add_argument(
+        "--errors", type = float, nargs = "+",
+        help = "geometric error allowed at each level, in model units")
+    parser.add_argument(
+        "--out", default = None,
+        help = "folder to write the levels to, defaults to the input's folder")
+    args = parser.parse_args()
+
+    levels = write_lod_chain(
+        args.filename, args.out,
+        ratios = None if args.errors else args.ratios, errors = args.errors)
+
+    print(f"{'level':<28}{'triangles':>10}{'error':>12}")
+    print(f"{args.filename:<28}{len(ObjFile(args.filename).triangles):>10}{0:>12.3g}")
+    for (filename, triangle_count, error) in levels:
+        print(f"{filename:<28}{triangle_count:>10}{error:>12.3g}")
+
+if __name__ == "__main__":
+
+    main()
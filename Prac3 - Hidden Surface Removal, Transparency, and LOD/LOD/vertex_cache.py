@@ -0,0 +1,187 @@
+import glob
+import sys
+import time
+import numpy as np
+import obj_loader
+
+################### Constants        ########################################
+
+#size of the cache the triangle order is tuned for
+CACHE_SIZE = 32
+
+#scoring constants from Tom Forsyth's "Linear-Speed Vertex Cache Optimisation"
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+#size of the FIFO cache ACMR is measured against, closer to real hardware
+#than the LRU cache the optimiser models
+MEASURED_CACHE_SIZE = 16
+
+################### Triangle Order ############################################
+
+def get_cache_scores() -> list[float]:
+    """ Return the score of a vertex at each position in the cache. """
+
+    scores = [LAST_TRIANGLE_SCORE] * 3
+    for i in range(3, CACHE_SIZE):
+        scores.append((1 - (i - 3) / (CACHE_SIZE - 3)) ** CACHE_DECAY_POWER)
+    return scores
+
+def optimize_vertex_cache(indices: np.ndarray, vertex_count: int) -> np.ndarray:
+    """
+        Reorder triangles so that consecutive triangles reuse the
+        vertices the GPU has just transformed.
+
+        This is Forsyth's greedy algorithm: every vertex is scored on
+        how recently it was used and how few triangles it has left, and
+        the next triangle drawn is always the best scoring one touching
+        the simulated cache.
+
+        Parameters:
+
+            indices: triangle list indices, three per triangle
+
+            vertex_count: the number of vertices the indices refer to
+
+        Returns:
+
+            The same triangles as a new index array, in the new order.
+    """
+
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    triangle_count = len(triangles)
+    if triangle_count == 0:
+        return np.asarray(indices).copy()
+
+    #triangles using each vertex, as one flat list plus offsets
+    valence = np.bincount(triangles.ravel(), minlength=vertex_count)
+    starts = np.concatenate(([0], np.cumsum(valence)))
+    owners = np.argsort(triangles.ravel(), kind="stable") // 3
+    vertex_triangles = [
+        owners[starts[i] : starts[i + 1]].tolist() for i in range(vertex_count)]
+
+    cache_scores = get_cache_scores()
+    valence_scores = [0.0] + [
+        VALENCE_BOOST_SCALE * count ** -VALENCE_BOOST_POWER
+        for count in range(1, int(valence.max()) + 1)]
+
+    remaining = valence.tolist()
+    vertex_score = [valence_scores[count] for count in remaining]
+
+    corners = triangles.tolist()
+    triangle_score = [
+        vertex_score[a] + vertex_score[b] + vertex_score[c] for (a, b, c) in corners]
+    added = [False] * triangle_count
+
+    cache: list[int] = []
+    order = []
+    best = int(np.argmax(triangle_score))
+    next_unadded = 0
+
+    for _ in range(triangle_count):
+
+        if best < 0:
+            #nothing in the cache has triangles left, start afresh
+            while added[next_unadded]:
+                next_unadded += 1
+            best = next_unadded
+
+        order.append(best)
+        added[best] = True
+        triangle = corners[best]
+
+        #move the triangle's vertices to the front of the cache
+        for vertex in triangle:
+            remaining[vertex] -= 1
+            vertex_triangles[vertex].remove(best)
+        cache = triangle + [vertex for vertex in cache if vertex not in triangle]
+
+        #rescore everything which was or still is cached
+        touched = set()
+        for (position, vertex) in enumerate(cache):
+            score = cache_scores[position] if position < CACHE_SIZE else 0.0
+            vertex_score[vertex] = \
+                score + valence_scores[remaining[vertex]] if remaining[vertex] else -1.0
+            touched.update(vertex_triangles[vertex])
+        cache = cache[:CACHE_SIZE]
+
+        best = -1
+        best_score = -1.0
+        for i in touched:
+            a, b, c = corners[i]
+            score = vertex_score[a] + vertex_score[b] + vertex_score[c]
+            triangle_score[i] = score
+            if score > best_score:
+                best = i
+                best_score = score
+
+    return triangles[order].ravel().astype(np.asarray(indices).dtype)
+
+################### Measurement ###############################################
+
+def get_acmr(indices: np.ndarray, cache_size: int = MEASURED_CACHE_SIZE) -> float:
+    """
+        Return the average cache miss ratio of drawing the given
+        triangles through a FIFO vertex cache: the number of vertices
+        transformed per triangle, from 0.5 at best to 3 at worst.
+    """
+
+    if len(indices) == 0:
+        return 0.0
+
+    cached = set()
+    fifo = []
+    misses = 0
+    for vertex in np.asarray(indices).tolist():
+        if vertex not in cached:
+            misses += 1
+            cached.add(vertex)
+            fifo.append(vertex)
+            if len(fifo) > cache_size:
+                cached.discard(fifo.pop(0))
+    return 3 * misses / len(indices)
+
+################### Loading ###################################################
+
+def load_optimized_positions(filename: str) -> np.ndarray:
+    """
+        Read the given obj file and return the position of every corner,
+        with the triangles in vertex cache friendly order.
+
+        Expanding the optimized triangles back out keeps the loader's
+        output format, so the result can go through the mesh cache and
+        the optimisation is only paid for once. Indexing the expanded
+        buffer again then recovers vertices in first use order.
+    """
+
+    vertices, indices = obj_loader.index_vertices(
+        obj_loader.load_positions_from_file(filename), 3)
+    indices = optimize_vertex_cache(indices, len(vertices) // 3)
+    return vertices.reshape(-1, 3)[indices].ravel()
+
+def main(filenames: list[str]) -> None:
+
+    print(
+        f"{'model':<16}{'triangles':>10}{'ACMR before':>13}"
+        f"{'ACMR after':>12}{'time (s)':>10}"
+    )
+    for filename in filenames:
+        vertices, indices = obj_loader.index_vertices(
+            obj_loader.load_positions_from_file(filename), 3)
+
+        start = time.perf_counter()
+        optimized = optimize_vertex_cache(indices, len(vertices) // 3)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{filename.split('/')[-1]:<16}{len(indices) // 3:>10}"
+            f"{get_acmr(indices):>13.3f}{get_acmr(optimized):>12.3f}"
+            f"{elapsed:>10.2f}"
+        )
+
+if __name__ == "__main__":
+
+    #usage: python vertex_cache.py [obj files...]
+    main(sys.argv[1:] if len(sys.argv) > 1 else sorted(glob.glob("models/*.obj")))
@@ -0,0 +1,211 @@
+import glob
+import sys
+import numpy as np
+import obj_loader
+
+################### Constants        ########################################
+
+#how each attribute can be stored, the matching glVertexAttribPointer
+#types are GL_FLOAT, GL_HALF_FLOAT, GL_UNSIGNED_SHORT (normalized)
+#and GL_INT_2_10_10_10_REV (normalized)
+POSITION_FLOAT = "float"
+POSITION_UNORM16 = "unorm16"
+
+TEXCOORD_FLOAT = "float"
+TEXCOORD_HALF = "half"
+TEXCOORD_UNORM16 = "unorm16"
+
+NORMAL_FLOAT = "float"
+NORMAL_PACKED = "packed"
+
+#(position, texcoord, normal)
+VERTEX_FORMAT_FLOAT = (POSITION_FLOAT, TEXCOORD_FLOAT, NORMAL_FLOAT)
+VERTEX_FORMAT_COMPACT = (POSITION_FLOAT, TEXCOORD_HALF, NORMAL_PACKED)
+VERTEX_FORMAT_QUANTIZED = (POSITION_UNORM16, TEXCOORD_UNORM16, NORMAL_PACKED)
+
+VERTEX_FORMATS = {
+    "float": VERTEX_FORMAT_FLOAT,
+    "compact": VERTEX_FORMAT_COMPACT,
+    "quantized": VERTEX_FORMAT_QUANTIZED,
+}
+
+#quantized positions are padded out to 4 bytes, to keep every
+#attribute aligned
+FIELD_TYPES = {
+    ("position", POSITION_FLOAT): ("<f4", (3,)),
+    ("position", POSITION_UNORM16): ("<u2", (4,)),
+    ("texcoord", TEXCOORD_FLOAT): ("<f4", (2,)),
+    ("texcoord", TEXCOORD_HALF): ("<f2", (2,)),
+    ("texcoord", TEXCOORD_UNORM16): ("<u2", (2,)),
+    ("normal", NORMAL_FLOAT): ("<f4", (3,)),
+    ("normal", NORMAL_PACKED): ("<u4", ()),
+}
+
+################### Packing ###################################################
+
+def get_vertex_dtype(vertex_format: tuple[str]) -> np.dtype:
+    """
+        Return the interleaved layout of the given vertex format, each
+        field's offset is the one to hand to glVertexAttribPointer.
+    """
+
+    return np.dtype([
+        (name, *FIELD_TYPES[(name, attribute_format)])
+        for (name, attribute_format)
+        in zip(("position", "texcoord", "normal"), vertex_format)
+    ])
+
+def pack_vertices(
+    vertices: np.ndarray, vertex_format: tuple[str]) -> tuple[np.ndarray]:
+    """
+        Convert x,y,z,s,t,nx,ny,nz vertex data to the given format.
+
+        Parameters:
+
+            vertices: flat float32 array, 8 floats per vertex
+
+            vertex_format: (position, texcoord, normal) storage formats
+
+        Returns:
+
+            (packed, position_offset, position_scale): the packed vertex
+            array, and the values the vertex shader must use to decode
+            its positions, position = offset + scale * stored position.
+    """
+
+    vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 8)
+    position_format, texcoord_format, normal_format = vertex_format
+    packed = np.zeros(len(vertices), dtype=get_vertex_dtype(vertex_format))
+
+    position_offset = np.zeros(3, dtype=np.float32)
+    position_scale = np.ones(3, dtype=np.float32)
+    if position_format == POSITION_UNORM16:
+        packed["position"][:, 0:3], position_offset, position_scale \
+            = quantize_positions(vertices[:, 0:3])
+    else:
+        packed["position"] = vertices[:, 0:3]
+
+    if texcoord_format == TEXCOORD_UNORM16:
+        packed["texcoord"] = to_unorm16(vertices[:, 3:5])
+    else:
+        packed["texcoord"] = vertices[:, 3:5]
+
+    if normal_format == NORMAL_PACKED:
+        packed["normal"] = pack_normals(vertices[:, 5:8])
+    else:
+        packed["normal"] = vertices[:, 5:8]
+
+    return (packed, position_offset, position_scale)
+
+def quantize_positions(positions: np.ndarray) -> tuple[np.ndarray]:
+    """
+        Store positions as 16 bit fractions of the mesh's bounding box.
+
+        Returns:
+
+            (quantized, offset, scale) where offset is the box's minimum
+            corner and scale its size.
+    """
+
+    offset = positions.min(axis=0) if len(positions) else np.zeros(3, np.float32)
+    scale = (positions.max(axis=0) - offset) if len(positions) else np.ones(3, np.float32)
+    #flat boxes would divide by zero, any scale decodes them correctly
+    scale = np.where(scale > 0, scale, 1).astype(np.float32)
+    return (to_unorm16((positions - offset) / scale), offset, scale)
+
+def to_unorm16(values: np.ndarray) -> np.ndarray:
+    """ Store values in [0,1] as normalized unsigned shorts. """
+
+    return np.round(np.clip(values, 0, 1) * 65535).astype(np.uint16)
+
+def pack_normals(normals: np.ndarray) -> np.ndarray:
+    """
+        Pack unit vectors into GL_INT_2_10_10_10_REV, ten signed bits
+        for each of x, y and z with the two w bits left empty.
+    """
+
+    components = np.round(np.clip(normals, -1, 1) * 511).astype(np.int32)
+    bits = components.astype(np.uint32) & 0x3FF
+    return bits[:, 0] | (bits[:, 1] << 10) | (bits[:, 2] << 20)
+
+def unpack_vertices(
+    packed: np.ndarray,
+    position_offset: np.ndarray, position_scale: np.ndarray) -> np.ndarray:
+    """
+        Decode packed vertices back to floats the same way the
+        graphics card does, so the error of a format can be measured.
+    """
+
+    vertices = np.zeros((len(packed), 8), dtype=np.float32)
+
+    positions = packed["position"][:, 0:3]
+    if positions.dtype == np.uint16:
+        positions = position_offset + position_scale * (positions / 65535)
+    vertices[:, 0:3] = positions
+
+    texcoords = packed["texcoord"]
+    if texcoords.dtype == np.uint16:
+        texcoords = texcoords / 65535
+    vertices[:, 3:5] = texcoords
+
+    normals = packed["normal"]
+    if normals.dtype == np.uint32:
+        #sign extend each 10 bit field, -512 clamps to -1
+        fields = (normals[:, None] >> np.array([0, 10, 20], dtype=np.uint32)) & 0x3FF
+        signed = fields.astype(np.int32) - ((fields & 0x200) << 1).astype(np.int32)
+        normals = np.maximum(signed / 511, -1)
+    vertices[:, 5:8] = normals
+
+    return vertices
+
+################### Error Report ##############################################
+
+def measure_error(vertices: np.ndarray, vertex_format: tuple[str]) -> dict[str, float]:
+    """
+        Pack then unpack the given vertices, and return the bytes per
+        vertex along with the worst error each attribute picked up.
+        Position error is relative to the size of the mesh, normal error
+        is the angle (in degrees) between the original and decoded normal.
+    """
+
+    vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 8)
+    packed, offset, scale = pack_vertices(vertices, vertex_format)
+    decoded = unpack_vertices(packed, offset, scale)
+
+    size = np.linalg.norm(vertices[:, 0:3].max(axis=0) - vertices[:, 0:3].min(axis=0))
+    position_error = np.abs(decoded[:, 0:3] - vertices[:, 0:3]).max() / max(size, 1e-12)
+    texcoord_error = np.abs(decoded[:, 3:5] - vertices[:, 3:5]).max()
+
+    lengths = np.linalg.norm(vertices[:, 5:8], axis=1) * np.linalg.norm(decoded[:, 5:8], axis=1)
+    has_normal = lengths > 0
+    cosines = (vertices[has_normal, 5:8] * decoded[has_normal, 5:8]).sum(axis=1) / lengths[has_normal]
+    normal_error = np.degrees(np.arccos(np.clip(cosines, -1, 1))).max() if has_normal.any() else 0.0
+
+    return {
+        "bytes": packed.dtype.itemsize,
+        "position": float(position_error),
+        "texcoord": float(texcoord_error),
+        "normal": float(normal_error),
+    }
+
+def main(filenames: list[str]) -> None:
+
+    print(
+        f"{'model':<20}{'format':<11}{'bytes':>6}{'saved':>7}"
+        f"{'position':>11}{'texcoord':>11}{'normal (deg)':>14}"
+    )
+    for filename in filenames:
+        vertices = obj_loader.load_model_from_file(filename)
+        for (name, vertex_format) in VERTEX_FORMATS.items():
+            error = measure_error(vertices, vertex_format)
+            print(
+                f"{filename.split('/')[-1]:<20}{name:<11}{error['bytes']:>6}"
+                f"{1 - error['bytes'] / 32:>7.0%}"
+                f"{error['position']:>11.2e}{error['texcoord']:>11.2e}"
+                f"{error['normal']:>14.3f}"
+            )
+
+if __name__ == "__main__":
+
+    #usage: python vertex_formats.py [obj files...]
+    main(sys.argv[1:] if len(sys.argv) > 1 else sorted(glob.glob("models/*.obj")))
@@ -0,0 +1,146 @@
+from config import *
+import collections
+
+############################## Constants ######################################
+
+#bytes of GPU memory that assets nobody is using may keep holding,
+#in case they're asked for again
+UNUSED_ASSET_BUDGET = 64 * 1024 * 1024
+
+############################## Registry #######################################
+
+class RegisteredAsset:
+
+
+    def __init__(self, asset, category: str, destroy):
+
+        self.asset = asset
+        self.category = category
+        self.destroy = destroy
+        #assets report their GPU memory through an nbytes attribute
+        self.size = getattr(asset, "nbytes", 0)
+        self.references = 0
+
+class AssetRegistry:
+    """
+        Shares meshes, textures and shaders between everything which
+        asks for them, so that each is only loaded once.
+
+        Assets are keyed by category, the canonical paths of their files
+        and any other parameters they were made with. Each acquire must
+        be matched by a release. Once nothing holds an asset it's kept
+        around in case it's needed again, and the least recently used
+        are destroyed when they hold more than the budget.
+    """
+
+
+    def __init__(self, unused_budget: int = UNUSED_ASSET_BUDGET):
+
+        self.unused_budget = unused_budget
+        self.entries: dict[tuple, RegisteredAsset] = {}
+        self.keys = {}
+        #keys of assets nobody holds, least recently released first
+        self.unused = collections.OrderedDict()
+
+    def acquire(
+        self, category: str, paths: tuple[str], params: tuple,
+        make, destroy = None):
+        """
+            Return the asset with the given key, making it if need be.
+
+            Parameters:
+
+                category: eg. "mesh", "texture" or "shader"
+
+                paths: the files the asset is made from
+
+                params: anything else which changes the asset
+
+                make: function taking no arguments and returning a new asset
+
+                destroy: function freeing the asset, by default
+                    its destroy method
+        """
+
+        key = (
+            category,
+            tuple(os.path.realpath(path) for path in paths),
+            params
+        )
+
+        entry = self.entries.get(key)
+        if entry is None:
+            asset = make()
+            entry = RegisteredAsset(
+                asset, category,
+                destroy or (lambda asset: asset.destroy())
+            )
+            self.entries[key] = entry
+            self.keys[asset] = key
+        else:
+            self.unused.pop(key, None)
+
+        entry.references += 1
+        return entry.asset
+
+    def release(self, asset) -> None:
+        """ Give up a reference to an asset returned by acquire. """
+
+        key = self.keys[asset]
+        entry = self.entries[key]
+        entry.references -= 1
+        if entry.references == 0:
+            self.unused[key] = None
+            self.evict(self.unused_budget)
+
+    def evict(self, budget: int) -> None:
+        """
+            Destroy unused assets, least recently used first,
+            until they hold at most the given number of bytes.
+        """
+
+        unused_bytes = sum(self.entries[key].size for key in self.unused)
+        while self.unused and unused_bytes > budget:
+            key, _ = self.unused.popitem(last = False)
+            entry = self.entries.pop(key)
+            del self.keys[entry.asset]
+            entry.destroy(entry.asset)
+            unused_bytes -= entry.size
+
+    def get_memory_report(self) -> dict[str, tuple[int]]:
+        """
+            Return the (asset count, bytes of GPU memory) held by
+            each category, including unused assets.
+        """
+
+        report = {}
+        for entry in self.entries.values():
+            count, size = report.get(entry.category, (0, 0))
+            report[entry.category] = (count + 1, size + entry.size)
+        return report
+
+    def print_memory_report(self) -> None:
+
+        for (category, (count, size)) in sorted(self.get_memory_report().items()):
+            print(f"{category}: {count} assets, {size / 1024:.1f} KB")
+
+    def destroy(self) -> None:
+        """ Free every asset, whether or not it's still held. """
+
+        for entry in self.entries.values():
+            entry.destroy(entry.asset)
+        self.entries.clear()
+        self.keys.clear()
+        self.unused.clear()
+
+#the one registry shared by the whole program
+registry = AssetRegistry()
+
+def acquire_shader(vertexFilepath: str, fragmentFilepath: str) -> int:
+    """ Return the shader program built from the given source files. """
+
+    return registry.acquire(
+        "shader", (vertexFilepath, fragmentFilepath), (),
+        lambda: createShader(vertexFilepath, fragmentFilepath),
+        glDeleteProgram
+    )
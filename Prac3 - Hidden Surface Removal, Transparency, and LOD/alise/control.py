@@ -1,4 +1,5 @@
 from config import *
+import assets
 import model
 import view
 
@@ -106,6 +107,7 @@ class GameApp:
 
             #timing
             self.showFrameRate()
+            transform_counter.end_frame()
 
         return result
 
@@ -168,7 +170,13 @@ class GameApp:
         delta = self.currentTime - self.lastTime
         if (delta >= 1):
             framerate = int(self.numFrames/delta)
-            glfw.set_window_title(self.window, f"Running at {framerate} fps.")
+            static_geometry = self.renderer.static_geometry_model
+            glfw.set_window_title(
+                self.window, 
+                f"Running at {framerate} fps, "
+                f"{static_geometry.parts_drawn}/{len(static_geometry.counts)} blocks drawn, "
+                f"{transform_counter.skipped_last_frame} transform builds skipped."
+            )
             self.lastTime = self.currentTime
             self.numFrames = -1
             self.frameTime = float(1000.0 / max(60,framerate))
@@ -176,4 +184,5 @@ class GameApp:
 
     def quit(self):
         
-        self.renderer.destroy()
\ No newline at end of file
+        self.renderer.destroy()
+        assets.registry.destroy()
\ No newline at end of file
@@ -37,6 +37,8 @@ class Player:
         self.float_t_max = 5_000
         self.floating = False
         self.modelTransform = pyrr.matrix44.create_from_translation(vec = self.box.center, dtype = np.float32)
+        #where the player was when the model transform was built
+        self.transform_position = np.copy(self.box.center)
         self.color = np.array([0,0,1], dtype=np.float32)
 
     def move(self, direction, amount, float_forwards = False):
@@ -108,7 +110,12 @@ class Player:
         self.velocity[0] = 0
         self.velocity[1] = 0
 
+        if np.array_equal(self.box.center, self.transform_position):
+            transform_counter.skipped += 1
+            return
         self.modelTransform = pyrr.matrix44.create_from_translation(vec = self.box.center, dtype = np.float32)
+        self.transform_position = np.copy(self.box.center)
+        transform_counter.built += 1
 
 class Camera:
 
@@ -120,6 +127,8 @@ class Camera:
         self.up = np.array([0, 0, 0],dtype=np.float32)
         self.global_up = np.array([0, 0, 1], dtype=np.float32)
         self.arm_length = 10
+        #the eye, target and up the view transform was built from
+        self.view_state = None
 
     def update(self, target_position, dt):
 
@@ -138,10 +147,16 @@ class Camera:
         self.right = pyrr.vector.normalize(pyrr.vector3.cross(self.global_up,self.forward))
         self.up = pyrr.vector.normalize(pyrr.vector3.cross(self.forward,self.right))
 
+        state = np.concatenate((self.position, target_position, self.up))
+        if np.array_equal(state, self.view_state):
+            transform_counter.skipped += 1
+            return
         self.viewTransform = pyrr.matrix44.create_look_at(
             eye = self.position, target = target_position, 
             up = self.up, dtype=np.float32
         )
+        self.view_state = state
+        transform_counter.built += 1
     
     def move(self, velocity):
 
@@ -162,13 +177,19 @@ class Ground:
         self.modelTransform = pyrr.matrix44.create_identity(dtype=np.float32)
 
         self.z = z
+        self.position = None
 
     def update(self, playerPos):
 
         position = np.array([playerPos[0], playerPos[1], self.z], dtype=np.float32)
+        if np.array_equal(position, self.position):
+            transform_counter.skipped += 1
+            return
         self.modelTransform = pyrr.matrix44.create_from_translation(
             vec = position, dtype = np.float32
         )
+        self.position = position
+        transform_counter.built += 1
 
 class Scene:
 
@@ -1,4 +1,5 @@
 from config import *
+import assets
 import geometry
 import model
 
@@ -10,6 +11,7 @@ class Mesh:
         self.vao = glGenVertexArrays(1)
         self.vbo = glGenBuffers(1)
         self.vertex_count = 0
+        self.nbytes = 0
     
     def destroy(self) -> None:
 
@@ -17,12 +19,24 @@ class Mesh:
         glDeleteBuffers(1, (self.vbo,))
 
 class StaticGeometry(Mesh):
+    """
+        Meshes baked into one shared vertex buffer, each keeping the
+        range of vertices it was baked to and a bounding sphere, so
+        that parts out of view can be skipped while everything in view
+        is still drawn by a single call.
+    """
 
 
     def __init__(self):
 
         super().__init__()
-        self.vertices = np.array([], dtype = np.float32)
+        self.parts = []
+        self.firsts = []
+        self.counts = []
+        self.centers = []
+        self.radii = []
+        self.indirect_buffer = None
+        self.parts_drawn = 0
     
     def consume(
         self, positions: list[np.ndarray], 
@@ -30,35 +44,100 @@ class StaticGeometry(Mesh):
         model_transform: np.ndarray) -> None:
         
         vertex_count = len(positions)
-        
-        for i in range(vertex_count):
-            self.vertices = np.append(
-                self.vertices, 
-                pyrr.matrix44.multiply(
-                    positions[i], model_transform
-                )[0:3]
-            )
-            self.vertices = np.append(
-                self.vertices, 
-                pyrr.matrix44.multiply(
-                    normals[i], model_transform
-                )[0:3]
-            )
+
+        part = np.zeros((vertex_count, 6), dtype = np.float32)
+        part[:, 0:3] = pyrr.matrix44.multiply(
+            np.array(positions, dtype = np.float32), model_transform)[:, 0:3]
+        part[:, 3:6] = pyrr.matrix44.multiply(
+            np.array(normals, dtype = np.float32), model_transform)[:, 0:3]
+        self.parts.append(part)
+
+        self.firsts.append(self.vertex_count)
+        self.counts.append(vertex_count)
+        self.vertex_count += vertex_count
+
+        low = part[:, 0:3].min(axis = 0)
+        high = part[:, 0:3].max(axis = 0)
+        center = (low + high) / 2
+        self.centers.append(center)
+        self.radii.append(np.max(np.linalg.norm(part[:, 0:3] - center, axis = 1)))
     
     def finalize(self):
 
-        self.vertex_count = int(len(self.vertices) // 6)
+        vertices = np.concatenate(self.parts).ravel()
+        self.parts = None
         glBindVertexArray(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        self.nbytes = vertices.nbytes
 
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(0))
 
         glEnableVertexAttribArray(1)
         glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(12))
+
+        self.firsts = np.array(self.firsts, dtype = np.int32)
+        self.counts = np.array(self.counts, dtype = np.int32)
+        self.centers = np.array(self.centers, dtype = np.float32).reshape(-1, 3)
+        self.radii = np.array(self.radii, dtype = np.float32)
+
+        #DrawArraysIndirectCommand: count, instanceCount, first, baseInstance
+        self.commands = np.zeros((len(self.counts), 4), dtype = np.uint32)
+        self.commands[:, 0] = self.counts
+        self.commands[:, 1] = 1
+        self.commands[:, 2] = self.firsts
+
+        #needs OpenGL 4.3, otherwise the visible ranges are handed
+        #straight to glMultiDrawArrays
+        if glMultiDrawArraysIndirect:
+            self.indirect_buffer = glGenBuffers(1)
+            glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.indirect_buffer)
+            glBufferData(
+                GL_DRAW_INDIRECT_BUFFER, self.commands.nbytes, None, GL_DYNAMIC_DRAW)
     
-        self.vertices = None
+    def get_visible(self, view_projection: np.ndarray) -> np.ndarray:
+        """
+            Returns a mask of the parts whose bounding spheres are
+            at least partly inside the view frustum.
+        """
+
+        #frustum planes, from the clip space tests -w <= x, y, z <= w
+        m = view_projection
+        planes = np.array((
+            m[:, 3] + m[:, 0], m[:, 3] - m[:, 0],
+            m[:, 3] + m[:, 1], m[:, 3] - m[:, 1],
+            m[:, 3] + m[:, 2], m[:, 3] - m[:, 2],
+        ), dtype = np.float32)
+        planes /= np.linalg.norm(planes[:, 0:3], axis = 1)[:, np.newaxis]
+
+        distances = self.centers @ planes[:, 0:3].T + planes[:, 3]
+        return np.all(distances >= -self.radii[:, np.newaxis], axis = 1)
+    
+    def draw(self, view_projection: np.ndarray) -> None:
+
+        visible = self.get_visible(view_projection)
+        self.parts_drawn = int(np.count_nonzero(visible))
+        if self.parts_drawn == 0:
+            return
+
+        glBindVertexArray(self.vao)
+        if self.indirect_buffer is not None:
+            commands = np.ascontiguousarray(self.commands[visible])
+            glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self.indirect_buffer)
+            glBufferSubData(GL_DRAW_INDIRECT_BUFFER, 0, commands.nbytes, commands)
+            glMultiDrawArraysIndirect(
+                GL_TRIANGLES, ctypes.c_void_p(0), self.parts_drawn, 0)
+        else:
+            glMultiDrawArrays(
+                GL_TRIANGLES, self.firsts[visible], self.counts[visible], 
+                self.parts_drawn)
+    
+    def destroy(self) -> None:
+
+        super().destroy()
+        if self.indirect_buffer is not None:
+            glDeleteBuffers(1, (self.indirect_buffer,))
 
 class ObjModel(Mesh):
 
@@ -67,9 +146,9 @@ class ObjModel(Mesh):
 
         super().__init__()
         
-        vertices = np.array(
-            load_model_from_file(folderpath, filename),
-            dtype=np.float32
+        vertices = load_cached_mesh(
+            f"{folderpath}/{filename}", (3, 3),
+            lambda _: load_model_from_file(folderpath, filename)
         )
         self.vertex_count = int(len(vertices)/6)
         self.positions = []
@@ -97,6 +176,7 @@ class ObjModel(Mesh):
         glBindVertexArray(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER,self.vbo)
         glBufferData(GL_ARRAY_BUFFER,vertices.nbytes,vertices,GL_STATIC_DRAW)
+        self.nbytes = vertices.nbytes
 
         #position attribute
         glEnableVertexAttribArray(0)
@@ -190,6 +270,7 @@ class CubeMapModel(Mesh):
         glBindVertexArray(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
         glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        self.nbytes = vertices.nbytes
 
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(0))
@@ -202,6 +283,7 @@ class CubeMapMaterial:
     def __init__(self, filepath):
 
         self.texture = glGenTextures(1)
+        self.nbytes = 0
         glBindTexture(GL_TEXTURE_CUBE_MAP, self.texture)
 
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
@@ -216,6 +298,7 @@ class CubeMapMaterial:
             img = img.convert('RGBA')
             img_data = bytes(img.tobytes())
             glTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_Y,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+            self.nbytes += len(img_data)
         
         with Image.open(f"{filepath}_right.png", mode = "r") as img:
             image_width,image_height = img.size
@@ -224,6 +307,7 @@ class CubeMapMaterial:
             img = img.convert('RGBA')
             img_data = bytes(img.tobytes())
             glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_Y,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+            self.nbytes += len(img_data)
         
         with Image.open(f"{filepath}_top.png", mode = "r") as img:
             image_width,image_height = img.size
@@ -231,12 +315,14 @@ class CubeMapMaterial:
             img = img.convert('RGBA')
             img_data = bytes(img.tobytes())
             glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_Z,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+            self.nbytes += len(img_data)
 
         with Image.open(f"{filepath}_bottom.png", mode = "r") as img:
             image_width,image_height = img.size
             img = img.convert('RGBA')
             img_data = bytes(img.tobytes())
             glTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_Z,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+            self.nbytes += len(img_data)
         
         with Image.open(f"{filepath}_back.png", mode = "r") as img:
             image_width,image_height = img.size
@@ -244,6 +330,7 @@ class CubeMapMaterial:
             img = img.convert('RGBA')
             img_data = bytes(img.tobytes())
             glTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_X,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+            self.nbytes += len(img_data)
 
         with Image.open(f"{filepath}_front.png", mode = "r") as img:
             image_width,image_height = img.size
@@ -251,6 +338,7 @@ class CubeMapMaterial:
             img = img.convert('RGBA')
             img_data = bytes(img.tobytes())
             glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_X,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+            self.nbytes += len(img_data)
 
     def use(self):
         glActiveTexture(GL_TEXTURE0)
@@ -276,11 +364,11 @@ class GameRenderer:
     
     def create_shaders(self):
 
-        self.shader3DColored = createShader("shaders/vertex_3d_colored.txt",
-                                            "shaders/fragment_3d_colored.txt")
+        self.shader3DColored = assets.acquire_shader("shaders/vertex_3d_colored.txt",
+                                                     "shaders/fragment_3d_colored.txt")
     
-        self.shader3DCubemap = createShader("shaders/vertex_3d_cubemap.txt",
-                                        "shaders/fragment_3d_cubemap.txt")
+        self.shader3DCubemap = assets.acquire_shader("shaders/vertex_3d_cubemap.txt",
+                                                     "shaders/fragment_3d_cubemap.txt")
 
     def set_onetime_shader_data(self):
 
@@ -288,6 +376,8 @@ class GameRenderer:
             fovy = 45, aspect = SCREEN_WIDTH/SCREEN_HEIGHT, 
             near = 0.1, far = 200, dtype=np.float32
         )
+        #kept for culling the static geometry
+        self.projection_transform = projection_transform
 
         glUseProgram(self.shader3DColored)
         glUniformMatrix4fv(
@@ -319,11 +409,26 @@ class GameRenderer:
 
     def create_assets(self):
 
-        self.player_debug_model = ObjModel("models", "player_mask.obj")
-        self.ground_debug_model = ObjModel("models", "ground.obj")
-        self.skyBoxMaterial = CubeMapMaterial("gfx/sky")
-        self.skyBoxModel = CubeMapModel(200, 200, 200)
-        self.block_debug_model = CubeMapModel(8, 8, 1)
+        self.player_debug_model = assets.registry.acquire(
+            "mesh", ("models/player_mask.obj",), (),
+            lambda: ObjModel("models", "player_mask.obj")
+        )
+        self.ground_debug_model = assets.registry.acquire(
+            "mesh", ("models/ground.obj",), (),
+            lambda: ObjModel("models", "ground.obj")
+        )
+        self.skyBoxMaterial = assets.registry.acquire(
+            "texture", ("gfx/sky",), (),
+            lambda: CubeMapMaterial("gfx/sky")
+        )
+        self.skyBoxModel = assets.registry.acquire(
+            "mesh", (), ("cube", 200, 200, 200),
+            lambda: CubeMapModel(200, 200, 200)
+        )
+        self.block_debug_model = assets.registry.acquire(
+            "mesh", (), ("cube", 8, 8, 1),
+            lambda: CubeMapModel(8, 8, 1)
+        )
         self.static_geometry_model = StaticGeometry()
     
     def bake_geometry(self, blocks: list[model.Block]) -> None:
@@ -337,7 +442,10 @@ class GameRenderer:
         
         self.static_geometry_model.finalize()
         
-        self.block_debug_model.destroy()
+        assets.registry.release(self.block_debug_model)
+
+        if REPORT_ASSET_MEMORY:
+            assets.registry.print_memory_report()
 
     def set_up_opengl(self, window) -> None:
 
@@ -395,14 +503,17 @@ class GameRenderer:
         glUniform3fv(self.color_location, 1, np.array([0.5, 0.5, 0.5], dtype=np.float32))
         glDrawArrays(GL_TRIANGLES, 0, self.ground_debug_model.vertex_count)
 
-        #static geometry
-        glBindVertexArray(self.static_geometry_model.vao)
+        #static geometry, the blocks in view
         glUniformMatrix4fv(
             self.model_location["colored"], 1, GL_FALSE, 
             pyrr.matrix44.create_identity()
         )
         glUniform3fv(self.color_location, 1, np.array([0.5, 0.5, 1.0], dtype=np.float32))
-        glDrawArrays(GL_TRIANGLES, 0, self.static_geometry_model.vertex_count)
+        self.static_geometry_model.draw(
+            pyrr.matrix44.multiply(
+                m1 = scene.camera.viewTransform, m2 = self.projection_transform
+            )
+        )
         
         #player
         glUniformMatrix4fv(self.model_location["colored"], 1, GL_FALSE, scene.player.modelTransform)
@@ -419,10 +530,11 @@ class GameRenderer:
 
     def destroy(self):
 
-        self.player_debug_model.destroy()
-        self.ground_debug_model.destroy()
-        self.skyBoxMaterial.destroy()
+        assets.registry.release(self.player_debug_model)
+        assets.registry.release(self.ground_debug_model)
+        assets.registry.release(self.skyBoxMaterial)
+        assets.registry.release(self.skyBoxModel)
         self.static_geometry_model.destroy()
         
-        glDeleteProgram(self.shader3DColored)
-        glDeleteProgram(self.shader3DCubemap)
+        assets.registry.release(self.shader3DColored)
+        assets.registry.release(self.shader3DCubemap)
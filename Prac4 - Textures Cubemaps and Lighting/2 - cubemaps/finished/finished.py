@@ -3,6 +3,10 @@ import glfw.GLFW as GLFW_CONSTANTS
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram,compileShader
 import numpy as np
+import os
+import tempfile
+import warnings
+import glob
 import pyrr
 from PIL import Image, ImageOps
 
@@ -15,6 +19,23 @@ OBJECT_SKY = 2
 PIPELINE_SKY = 0
 PIPELINE_3D = 1
 
+MESH_CACHE_EXTENSION = ".mesh"
+MESH_CACHE_MAGIC = b"MESH"
+MESH_CACHE_VERSION = 1
+MESH_CACHE_MAX_ATTRIBUTES = 8
+
+#fixed size header at the front of every cache file,
+#the float32 vertex data follows straight after it
+MESH_CACHE_HEADER = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u4"),
+    ("source_size", "<u8"),
+    ("source_mtime", "<i8"),
+    ("vertex_count", "<u8"),
+    ("attribute_count", "<u4"),
+    ("layout", "<u4", (MESH_CACHE_MAX_ATTRIBUTES,)),
+])
+
 ################### Helper Functions ########################################
 
 def createShader(vertexFilepath: str, fragmentFilepath: str) -> int:
@@ -43,103 +64,362 @@ def createShader(vertexFilepath: str, fragmentFilepath: str) -> int:
     
     return shader
 
-def load_model_from_file(
-    filename: str) -> list[float]:
-    """ 
-        Read the given obj file and return a list of all the
-        vertex data.
+def load_model_from_file(filename: str) -> np.ndarray:
     """
+        Read the given obj file and return a flat array of all the
+        vertex data, laid out as x, y, z, s, t, nx, ny, nz per corner.
 
-    v = []
-    vt = []
-    vn = []
-    vertices = []
-
-    with open(filename,'r') as f:
-        line = f.readline()
-        while line:
-            words = line.split(" ")
-            if words[0] == "v":
-                v.append(read_vertex_data(words))
-            elif words[0] == "vt":
-                vt.append(read_texcoord_data(words))
-            elif words[0] == "vn":
-                vn.append(read_normal_data(words))
-            elif words[0] == "f":
-                read_face_data(words, v, vt, vn, vertices)
-            line = f.readline()
-    
-    return vertices
+        Parameters:
 
-def read_vertex_data(words: list[str]) -> list[float]:
-    """ 
-        read the given position description and
-        return the vertex it represents.
+            filename: filepath to the obj file (relative to the working directory)
+
+        Returns:
+
+            A float32 array holding 8 floats for every triangle corner.
     """
 
-    return [
-        float(words[1]),
-        float(words[2]),
-        float(words[3])
-    ]
+    v, vt, vn, v_vt_vn = read_obj(filename)
 
-def read_texcoord_data(words: list[str]) -> list[float]:
-    """ 
-        read the given texcoord description and
-        return the texcoord it represents.
+    return build_vertices(v, vt, vn, v_vt_vn).ravel()
+
+def read_obj(filename: str) -> tuple[np.ndarray]:
     """
+        Read the given obj file and return its attribute blocks along
+        with the triangulated corner indices.
 
-    return [
-        float(words[1]),
-        float(words[2])
-    ]
+        Rather than walking the file line by line, the whole file is
+        treated as one byte array. Each line is classified by its flag,
+        every v, vt, vn and f block is then handed to numpy's parser in
+        a single call and polygons are fanned into triangles with
+        index arithmetic.
 
-def read_normal_data(words: list[str]) -> list[float]:
-    """ 
-        read the given normal description and
-        return the normal it represents.
+        Parameters:
+
+            filename: filepath to the obj file
+
+        Returns:
+
+            (v, vt, vn, v_vt_vn): positions (n,3), texcoords (n,2),
+            normals (n,3) and a (corners,3) int array of zero based
+            indices into them, -1 marks an index the face didn't give.
     """
 
-    return [
-        float(words[1]),
-        float(words[2]),
-        float(words[3])
-    ]
+    text = ObjText(np.fromfile(filename, dtype=np.uint8))
+
+    v = read_vertex_data(text, "v", 3)
+    vt = read_vertex_data(text, "vt", 2)
+    vn = read_vertex_data(text, "vn", 3)
+    v_vt_vn = read_face_data(text)
 
-def read_face_data(
-    words: list[str], 
-    v: list[float], vt: list[float], vn: list[float], 
-    vertices: list[float]) -> None:
+    return (v, vt, vn, v_vt_vn)
+
+#lookup table, indexed by byte value
+IS_WHITESPACE = np.zeros(256, dtype=bool)
+IS_WHITESPACE[[ord(c) for c in " \t\r\n"]] = True
+
+class ObjText:
     """
-        Read the given face description, and use the
-        data from the pre-filled v, vt, vn arrays to add
-        data to the vertices array
+        An obj file as a byte array, along with the per line
+        bookkeeping needed to pull out whole blocks at once.
     """
-    
-    triangles_in_face = len(words) - 3
 
-    for i in range(triangles_in_face):
-        read_corner(words[1], v, vt, vn, vertices)
-        read_corner(words[i + 2], v, vt, vn, vertices)
-        read_corner(words[i + 3], v, vt, vn, vertices)
 
-def read_corner(
-    description: str, 
-    v: list[float], vt: list[float], vn: list[float], 
-    vertices: list[float]) -> None:
+    def __init__(self, data: np.ndarray):
+        """
+            Index the lines and tokens of the given file contents.
+
+            Parameters:
+
+                data: the raw bytes of the file, as a uint8 array
+        """
+
+        # terminate the last line, so every line ends in a newline
+        self.data = np.append(data, np.uint8(ord("\n")))
+
+        newline = self.data == ord("\n")
+        line_ends = np.flatnonzero(newline)
+        self.line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+        self.line_lengths = line_ends + 1 - self.line_starts
+
+        self.blank_comments(newline)
+
+        is_space = IS_WHITESPACE[self.data]
+        token_starts = ~is_space
+        token_starts[1:] &= is_space[:-1]
+        self.tokens_in_line = np.add.reduceat(
+            token_starts, self.line_starts, dtype=np.int64)
+
+    def blank_comments(self, newline: np.ndarray) -> None:
+        """
+            Blank out everything from a # to the end of its line, so
+            that trailing comments don't reach numpy's parser.
+        """
+
+        is_hash = self.data == ord("#")
+        if not is_hash.any():
+            return
+
+        # a byte is commented out if a # comes before it on its line
+        hashes = np.cumsum(is_hash)
+        hashes_before_line = (hashes - is_hash)[self.line_starts]
+        line = np.cumsum(newline) - newline
+        in_comment = (hashes > hashes_before_line[line]) & ~newline
+        self.data[in_comment] = ord(" ")
+
+    def find_lines(self, flag: str) -> np.ndarray:
+        """ Return a mask of which lines begin with the given flag. """
+
+        is_flagged = np.ones(len(self.line_starts), dtype=bool)
+        for i, character in enumerate(flag):
+            is_flagged &= self.read_column(i) == ord(character)
+        return is_flagged & IS_WHITESPACE[self.read_column(len(flag))]
+
+    def read_column(self, i: int) -> np.ndarray:
+        """
+            Return the i'th byte of every line, short lines
+            just read their own newline.
+        """
+
+        return np.take(
+            self.data, self.line_starts + np.minimum(i, self.line_lengths - 1))
+
+    def read_block(self, lines: np.ndarray, flag: str) -> np.ndarray:
+        """
+            Return the text of the given lines with their flags
+            blanked out, so that only the numbers remain.
+        """
+
+        block = self.data[np.repeat(lines, self.line_lengths)]
+        line_lengths = self.line_lengths[lines]
+        flag_offsets = np.cumsum(line_lengths) - line_lengths
+        for i in range(len(flag)):
+            block[flag_offsets + i] = ord(" ")
+        return block
+
+def read_vertex_data(
+    text: ObjText, flag: str, size: int) -> np.ndarray:
+    """
+        Read every line starting with the given flag, and return
+        the first size numbers of each as an (n,size) array.
     """
-        Read the given corner description, then send the
-        approprate v, vt, vn data to the vertices array.
+
+    lines = text.find_lines(flag)
+    if not lines.any():
+        return np.zeros((0, size), dtype=np.float32)
+
+    values = np.fromstring(
+        text.read_block(lines, flag).tobytes(), dtype=np.float32, sep=" ")
+
+    # exporters are free to add optional components (eg. vt u v w),
+    # so take the first size numbers from each line
+    numbers_in_line = text.tokens_in_line[lines] - 1
+    if (numbers_in_line == size).all():
+        return values.reshape(-1, size)
+    line_offsets = np.cumsum(numbers_in_line) - numbers_in_line
+    return values[line_offsets[:, None] + np.arange(size)]
+
+def read_face_data(text: ObjText) -> np.ndarray:
+    """
+        Read every face in the file and return the (v, vt, vn) index
+        triple for every corner of every triangle.
+
+        Supports the v, v/vt, v//vn and v/vt/vn corner forms, polygons
+        are unpacked as triangle fans.
     """
 
-    v_vt_vn = description.split("/")
+    lines = text.find_lines("f")
+    if not lines.any():
+        return np.zeros((0, 3), dtype=np.int64)
 
-    for x in v[int(v_vt_vn[0]) - 1]:
-        vertices.append(x)
-    for x in vt[int(v_vt_vn[1]) - 1]:
-        vertices.append(x)
-    for x in vn[int(v_vt_vn[2]) - 1]:
-        vertices.append(x)
+    block = text.read_block(lines, "f")
+    columns = get_face_columns(block)
+    block[block == ord("/")] = ord(" ")
+
+    indices = np.fromstring(block.tobytes(), dtype=np.int64, sep=" ")
+    v_vt_vn = np.full((len(indices) // len(columns), 3), -1, dtype=np.int64)
+    v_vt_vn[:, columns] = indices.reshape(-1, len(columns)) - 1
+
+    corners_in_face = text.tokens_in_line[lines] - 1
+    return v_vt_vn[fan_triangles(corners_in_face)]
+
+def get_face_columns(block: np.ndarray) -> list[int]:
+    """
+        Work out which of v, vt, vn each corner gives, judging by the
+        first corner of the block.
+    """
+
+    is_space = IS_WHITESPACE[block[:256]]
+    first = np.argmin(is_space)
+    length = np.argmax(is_space[first:])
+    corner = block[first : first + length].tobytes().decode()
+
+    if "//" in corner:
+        return [0, 2]
+    return [0, 1, 2][: corner.count("/") + 1]
+
+def fan_triangles(corners_in_face: np.ndarray) -> np.ndarray:
+    """
+        obj file uses triangle fan format for each face individually.
+        Given the corner count of every face, return the corner order
+        which unpacks every face into triangles.
+    """
+
+    triangles_in_face = corners_in_face - 2
+    first_corner = np.cumsum(corners_in_face) - corners_in_face
+
+    first_triangle = np.cumsum(triangles_in_face) - triangles_in_face
+    owner = np.repeat(np.arange(len(corners_in_face)), triangles_in_face)
+    i = np.arange(triangles_in_face.sum()) - first_triangle[owner]
+
+    fan_center = first_corner[owner]
+    return np.stack(
+        (fan_center, fan_center + i + 1, fan_center + i + 2), axis=1
+    ).ravel()
+
+def build_vertices(
+    v: np.ndarray, vt: np.ndarray, vn: np.ndarray,
+    v_vt_vn: np.ndarray) -> np.ndarray:
+    """
+        Gather the interleaved (corners, 8) vertex array,
+        corners without a texcoord or normal are left as zero.
+    """
+
+    vertices = np.zeros((len(v_vt_vn), 8), dtype=np.float32)
+    vertices[:, 0:3] = v[v_vt_vn[:, 0]]
+
+    for (column, data, first) in ((1, vt, 3), (2, vn, 5)):
+        last = first + data.shape[1]
+        has_data = v_vt_vn[:, column] >= 0
+        if has_data.all():
+            vertices[:, first:last] = data[v_vt_vn[:, column]]
+        elif has_data.any():
+            vertices[has_data, first:last] = data[v_vt_vn[has_data, column]]
+
+    return vertices
+
+def load_cached_mesh(filename: str, layout: tuple[int], loader) -> np.ndarray:
+    """
+        Return the flat float32 vertex buffer for the given obj file,
+        reading it from the cache where possible.
+
+        The first load parses the file with the given loader and writes
+        the result next to it. Later loads memory map the cache file, so
+        the array can be handed straight to glBufferData. The cache is
+        rebuilt whenever the size or modification time of the obj file
+        no longer matches the one it was built from.
+
+        Parameters:
+
+            filename: filepath to the obj file
+
+            layout: the number of floats in each vertex attribute,
+                eg. (3, 2, 3) for position, texcoord, normal
+
+            loader: function taking the filename and returning the
+                flat vertex buffer, only called on a cache miss
+
+        Returns:
+
+            A read only float32 array of the vertex data.
+    """
+
+    vertices = read_mesh_cache(filename, layout)
+    if vertices is None:
+        vertices = np.ascontiguousarray(loader(filename), dtype=np.float32)
+        write_mesh_cache(filename, layout, vertices)
+    return vertices
+
+def get_mesh_cache_path(filename: str, layout: tuple[int]) -> str:
+    """
+        Each layout gets its own cache file, so different loaders
+        can share an obj file without rebuilding each other's caches.
+    """
+
+    layout_name = "_".join(str(size) for size in layout)
+    return f"{filename}.{layout_name}{MESH_CACHE_EXTENSION}"
+
+def make_mesh_cache_header(
+    filename: str, layout: tuple[int], vertex_count: int) -> np.ndarray:
+    """ Describe the given obj file and layout as a cache header. """
+
+    source = os.stat(filename)
+    header = np.zeros(1, dtype=MESH_CACHE_HEADER)
+    header["magic"] = MESH_CACHE_MAGIC
+    header["version"] = MESH_CACHE_VERSION
+    header["source_size"] = source.st_size
+    header["source_mtime"] = source.st_mtime_ns
+    header["vertex_count"] = vertex_count
+    header["attribute_count"] = len(layout)
+    header["layout"][0, :len(layout)] = layout
+    return header
+
+def read_mesh_cache(filename: str, layout: tuple[int]) -> np.ndarray | None:
+    """
+        Memory map the cached vertex data for the given obj file,
+        returns None if there's no cache or it's out of date.
+    """
+
+    cache_path = get_mesh_cache_path(filename, layout)
+    if not os.path.exists(cache_path) \
+        or os.path.getsize(cache_path) < MESH_CACHE_HEADER.itemsize:
+        return None
+
+    header = np.fromfile(cache_path, dtype=MESH_CACHE_HEADER, count=1)
+    expected = make_mesh_cache_header(filename, layout, header["vertex_count"][0])
+    if header.tobytes() != expected.tobytes():
+        return None
+
+    float_count = int(header["vertex_count"][0]) * sum(layout)
+    if os.path.getsize(cache_path) != MESH_CACHE_HEADER.itemsize + 4 * float_count:
+        return None
+    if float_count == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    return np.memmap(
+        cache_path, dtype=np.float32, mode="r",
+        offset=MESH_CACHE_HEADER.itemsize, shape=(float_count,))
+
+def write_mesh_cache(
+    filename: str, layout: tuple[int], vertices: np.ndarray) -> None:
+    """
+        Write the given vertex data to the obj file's cache, going
+        through a temporary file so a half written cache is never read.
+        If the cache can't be written, it's skipped with a warning.
+    """
+
+    cache_path = get_mesh_cache_path(filename, layout)
+    header = make_mesh_cache_header(filename, layout, len(vertices) // sum(layout))
+
+    temp_path = None
+    try:
+        #a uniquely named temporary file, so loaders writing the
+        #same cache at once don't clobber each other's
+        with tempfile.NamedTemporaryFile(
+            dir = os.path.dirname(cache_path) or ".", 
+            prefix = os.path.basename(cache_path), suffix = ".tmp",
+            delete = False) as f:
+            temp_path = f.name
+            f.write(header.tobytes())
+            f.write(vertices.tobytes())
+        os.replace(temp_path, cache_path)
+    except OSError as error:
+        #the data in hand is still good, it just won't be cached
+        warnings.warn(f"Couldn't write cache {cache_path}: {error}")
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def prewarm_mesh_cache(folderpath: str, layout: tuple[int], loader) -> int:
+    """
+        Make sure every obj file in the given folder has an up to date
+        cache, returns how many had to be rebuilt.
+    """
+
+    rebuilt = 0
+    for filename in sorted(glob.glob(f"{folderpath}/*.obj")):
+        if read_mesh_cache(filename, layout) is None:
+            load_cached_mesh(filename, layout, loader)
+            rebuilt += 1
+    return rebuilt
 
 ################### Model #####################################################
 
@@ -710,9 +990,8 @@ class ObjMesh(Mesh):
         super().__init__()
 
         # x, y, z, s, t, nx, ny, nz
-        vertices = load_model_from_file(filename)
+        vertices = load_cached_mesh(filename, (3, 2, 3), load_model_from_file)
         self.vertex_count = len(vertices)//8
-        vertices = np.array(vertices, dtype=np.float32)
 
         glBindVertexArray(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
@@ -0,0 +1,234 @@
+import ctypes
+import time
+import numpy as np
+import pyrr
+import OpenGL.GL
+
+################### Constants        ########################################
+
+#the stress scene: many cubes sharing one mesh, as the renderer's
+#STRESS_CUBE_COUNT lays them out
+CUBE_COUNT = 50000
+CUBE_SPACING = 3
+
+FRAMES = 20
+
+VERTEX_SRC = """
+#version 330 core
+layout (location=0) in vec3 vertexPos;
+layout (location=3) in mat4 instanceModel;
+uniform mat4 model;
+uniform mat4 viewProjection;
+uniform bool instanced;
+void main()
+{
+    mat4 modelTransform = instanced ? instanceModel : model;
+    gl_Position = viewProjection * modelTransform * vec4(vertexPos, 1.0);
+}
+"""
+
+FRAGMENT_SRC = """
+#version 330 core
+out vec4 color;
+void main()
+{
+    color = vec4(1.0);
+}
+"""
+
+################### Scene #####################################################
+
+def make_transforms(count: int) -> list[np.ndarray]:
+    """
+        The model transform of each cube, built the way
+        Entity.get_model_transform builds them.
+    """
+
+    side = int(np.ceil(np.sqrt(count)))
+    transforms = []
+    for i in range(count):
+        row, column = divmod(i, side)
+        position = np.array(
+            [10 + CUBE_SPACING * row, CUBE_SPACING * (column - side / 2), 0],
+            dtype=np.float32)
+        transform = pyrr.matrix44.multiply(
+            m1 = pyrr.matrix44.create_from_z_rotation(
+                theta = np.radians(np.random.uniform(0, 360)), dtype=np.float32),
+            m2 = pyrr.matrix44.create_from_translation(
+                vec = position, dtype=np.float32)
+        )
+        transforms.append(transform)
+    return transforms
+
+def make_cube() -> np.ndarray:
+    """ Positions of a unit cube's 36 corners. """
+
+    corners = []
+    for axis in range(3):
+        for sign in (-1, 1):
+            normal = np.zeros(3)
+            normal[axis] = sign
+            u = np.roll(normal, 1)
+            v = np.roll(np.abs(normal), 2)
+            for (s, t) in ((0, 0), (1, 0), (1, 1), (0, 0), (1, 1), (0, 1)):
+                corners.append(0.5 * normal + (s - 0.5) * u + (t - 0.5) * v)
+    return np.array(corners, dtype=np.float32).ravel()
+
+class CallCounter:
+    """
+        Stands in for the GL module, counting the calls a render loop
+        makes instead of making them. Constants are passed through.
+    """
+
+
+    def __init__(self):
+
+        self.calls = 0
+
+    def __getattr__(self, name: str):
+
+        if name.startswith("GL_"):
+            return getattr(OpenGL.GL, name)
+
+        def call(*args):
+            self.calls += 1
+        return call
+
+################### Render Loops ##############################################
+
+def render_separate(
+    gl, transforms: list[np.ndarray], model_location: int = -1,
+    instanced_location: int = -1) -> None:
+    """ The renderer's loop today: a uniform and a draw call per cube. """
+
+    gl.glUniform1i(instanced_location, 0)
+    for transform in transforms:
+        gl.glUniformMatrix4fv(model_location, 1, gl.GL_FALSE, transform)
+        gl.glDrawArrays(gl.GL_TRIANGLES, 0, 36)
+
+def render_instanced(
+    gl, transforms: list[np.ndarray], instance_buffer: int = 0,
+    instanced_location: int = -1) -> None:
+    """
+        Every transform uploaded to one buffer, as InstanceBuffer does,
+        then all the cubes drawn in one call.
+    """
+
+    transforms = np.ascontiguousarray(transforms, dtype=np.float32)
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, instance_buffer)
+    gl.glBufferData(gl.GL_ARRAY_BUFFER, transforms.nbytes, None, gl.GL_STREAM_DRAW)
+    gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, transforms.nbytes, transforms)
+    for column in range(4):
+        gl.glEnableVertexAttribArray(3 + column)
+        gl.glVertexAttribPointer(
+            3 + column, 4, gl.GL_FLOAT, gl.GL_FALSE, 64,
+            ctypes.c_void_p(16 * column))
+        gl.glVertexAttribDivisor(3 + column, 1)
+    gl.glUniform1i(instanced_location, 1)
+    gl.glDrawArraysInstanced(gl.GL_TRIANGLES, 0, 36, len(transforms))
+
+################### GL Timing #################################################
+
+def time_with_gl(transforms: list[np.ndarray]) -> dict | None:
+    """
+        Render the scene each way in a hidden window and return the
+        average milliseconds per frame, or None without glfw.
+    """
+
+    try:
+        import glfw
+        import glfw.GLFW as GLFW_CONSTANTS
+        import OpenGL.GL as gl
+        from OpenGL.GL.shaders import compileProgram, compileShader
+    except ImportError:
+        return None
+
+    if not glfw.init():
+        return None
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MAJOR, 3)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MINOR, 3)
+    glfw.window_hint(
+        GLFW_CONSTANTS.GLFW_OPENGL_PROFILE, GLFW_CONSTANTS.GLFW_OPENGL_CORE_PROFILE)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_OPENGL_FORWARD_COMPAT, GLFW_CONSTANTS.GLFW_TRUE)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_VISIBLE, GLFW_CONSTANTS.GLFW_FALSE)
+    window = glfw.create_window(640, 480, "instancing benchmark", None, None)
+    if not window:
+        glfw.terminate()
+        return None
+    glfw.make_context_current(window)
+    gl.glEnable(gl.GL_DEPTH_TEST)
+
+    cube = make_cube()
+    vao = gl.glGenVertexArrays(1)
+    gl.glBindVertexArray(vao)
+    vbo = gl.glGenBuffers(1)
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, vbo)
+    gl.glBufferData(gl.GL_ARRAY_BUFFER, cube.nbytes, cube, gl.GL_STATIC_DRAW)
+    gl.glEnableVertexAttribArray(0)
+    gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 12, None)
+    instance_buffer = gl.glGenBuffers(1)
+
+    shader = compileProgram(
+        compileShader(VERTEX_SRC, gl.GL_VERTEX_SHADER),
+        compileShader(FRAGMENT_SRC, gl.GL_FRAGMENT_SHADER))
+    gl.glUseProgram(shader)
+    view_projection = pyrr.matrix44.multiply(
+        m1 = pyrr.matrix44.create_look_at(
+            eye = (0, 0, 40), target = (40, 0, 0), up = (0, 0, 1), dtype=np.float32),
+        m2 = pyrr.matrix44.create_perspective_projection(
+            fovy = 45, aspect = 640 / 480, near = 0.1, far = 1000, dtype=np.float32)
+    )
+    gl.glUniformMatrix4fv(
+        gl.glGetUniformLocation(shader, "viewProjection"), 1, gl.GL_FALSE, view_projection)
+    model_location = gl.glGetUniformLocation(shader, "model")
+    instanced_location = gl.glGetUniformLocation(shader, "instanced")
+
+    def run(draw_frame) -> float:
+        gl.glFinish()
+        start = time.perf_counter()
+        for _ in range(FRAMES):
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+            draw_frame()
+        gl.glFinish()
+        return 1000 * (time.perf_counter() - start) / FRAMES
+
+    results = {
+        "separate": run(lambda: render_separate(
+            gl, transforms, model_location, instanced_location)),
+        "instanced": run(lambda: render_instanced(
+            gl, transforms, instance_buffer, instanced_location)),
+    }
+
+    gl.glDeleteBuffers(2, (vbo, instance_buffer))
+    gl.glDeleteVertexArrays(1, (vao,))
+    gl.glDeleteProgram(shader)
+    glfw.terminate()
+    return results
+
+def main() -> None:
+
+    transforms = make_transforms(CUBE_COUNT)
+
+    print(f"{CUBE_COUNT} cubes")
+    print(f"{'path':<12}{'GL calls':>10}{'CPU ms':>10}")
+    for (name, render) in (
+        ("separate", render_separate),
+        ("instanced", render_instanced),
+    ):
+        counter = CallCounter()
+        start = time.perf_counter()
+        render(counter, transforms)
+        ms = 1000 * (time.perf_counter() - start)
+        print(f"{name:<12}{counter.calls:>10}{ms:>10.2f}")
+
+    times = time_with_gl(transforms)
+    if times is None:
+        print("glfw unavailable, skipping the GL frame timing")
+    else:
+        for (name, ms) in times.items():
+            print(f"{name:<12}{ms:>10.2f} ms per frame")
+
+if __name__ == "__main__":
+
+    #usage: python instancing_benchmark.py, from this folder
+    main()
@@ -0,0 +1,307 @@
+import colorsys
+import time
+import numpy as np
+from PIL import Image
+
+################### Constants        ########################################
+
+#the scene: many cubes sharing one mesh, each with one of a set
+#of same sized textures
+TEXTURE_FILE = "gfx/wood.jpeg"
+TEXTURE_COUNT = 16
+OBJECT_COUNT = 1024
+OBJECT_SPACING = 1.5
+#how far in front of the camera the grid of cubes stands
+OBJECT_DISTANCE = 50
+
+FRAMES = 100
+
+################### Scene #####################################################
+
+def make_textures() -> list[np.ndarray]:
+    """ Tint the wood texture TEXTURE_COUNT ways, giving same sized images. """
+
+    with Image.open(TEXTURE_FILE, mode = "r") as img:
+        pixels = np.asarray(img.convert("RGB"), dtype=np.float32)
+
+    textures = []
+    for i in range(TEXTURE_COUNT):
+        tint = np.array(colorsys.hsv_to_rgb(i / TEXTURE_COUNT, 0.5, 1.0))
+        textures.append((pixels * tint).astype(np.uint8))
+    return textures
+
+def get_object_textures() -> np.ndarray:
+    """
+        The texture of each object, in the order the scene lists them.
+        Neighbours differ, as they do when every object is its own type.
+    """
+
+    return np.arange(OBJECT_COUNT, dtype=np.int32) % TEXTURE_COUNT
+
+def get_object_positions() -> np.ndarray:
+    """ A square grid of objects facing the camera, which looks along x. """
+
+    side = int(np.ceil(np.sqrt(OBJECT_COUNT)))
+    row, column = np.divmod(np.arange(OBJECT_COUNT), side)
+    positions = np.zeros((OBJECT_COUNT, 3), dtype=np.float32)
+    positions[:, 0] = OBJECT_DISTANCE
+    positions[:, 1] = OBJECT_SPACING * (column - side / 2)
+    positions[:, 2] = OBJECT_SPACING * (row - side / 2)
+    return positions
+
+class DrawCounter:
+    """
+        Stands between a render loop and GL, counting the texture binds
+        and draw calls it makes. Without a GLScene it only counts.
+    """
+
+
+    def __init__(self, scene = None):
+
+        self.scene = scene
+        self.binds = 0
+        self.draws = 0
+
+    def bind(self, texture: int) -> None:
+        """ Bind one of the 2D textures. """
+
+        self.binds += 1
+        if self.scene:
+            self.scene.bind(texture)
+
+    def bind_array(self) -> None:
+
+        self.binds += 1
+        if self.scene:
+            self.scene.bind_array()
+
+    def draw(self, i: int, layer: int = 0) -> None:
+        """ Draw one object. """
+
+        self.draws += 1
+        if self.scene:
+            self.scene.draw(i, layer)
+
+    def draw_instanced(self, objects: np.ndarray, layers: np.ndarray = None) -> None:
+        """ Draw the given objects in one call. """
+
+        self.draws += 1
+        if self.scene:
+            self.scene.draw_instanced(objects, layers)
+
+################### Render Loops ##############################################
+
+def render_separate(
+    counter: DrawCounter, object_textures: np.ndarray, sort: bool) -> None:
+    """
+        One GL_TEXTURE_2D per material, rebound whenever the next
+        object uses a different one, and a draw per object.
+    """
+
+    order = range(len(object_textures))
+    if sort:
+        order = np.argsort(object_textures, kind = "stable")
+
+    bound = None
+    for i in order:
+        if object_textures[i] != bound:
+            bound = object_textures[i]
+            counter.bind(bound)
+        counter.draw(i)
+
+def render_instanced_by_texture(
+    counter: DrawCounter, object_textures: np.ndarray) -> None:
+    """ One GL_TEXTURE_2D per material, and an instanced draw for each. """
+
+    for texture in range(TEXTURE_COUNT):
+        counter.bind(texture)
+        counter.draw_instanced(np.flatnonzero(object_textures == texture))
+
+def render_array(counter: DrawCounter, object_textures: np.ndarray) -> None:
+    """
+        The way the renderer draws the cubes: one MaterialArray bound
+        once, and one instanced draw with each object's layer read
+        next to its transform.
+    """
+
+    counter.bind_array()
+    counter.draw_instanced(np.arange(len(object_textures)), object_textures)
+
+################### GL Timing #################################################
+
+class GLScene:
+    """
+        The scene made from finished.py's own meshes, materials, instance
+        buffer and shaders, so the timings are of the renderer's paths.
+    """
+
+
+    def __init__(self, finished, images: list[np.ndarray]):
+
+        self.finished = finished
+
+        self.mesh = finished.CubeMesh()
+        self.textures = [
+            finished.Material2D(None, mipmaps = finished.make_mipmaps(pixels))
+            for pixels in images
+        ]
+        self.array = finished.MaterialArray(
+            [f"{TEXTURE_FILE} #{i}" for i in range(len(images))],
+            layers = [finished.make_mipmaps(pixels) for pixels in images])
+        self.instances = finished.InstanceBuffer()
+        self.transforms = finished.make_model_transforms(
+            get_object_positions(), np.zeros((OBJECT_COUNT, 3)))
+
+        self.shaders = {
+            finished.PIPELINE_3D: finished.createShader(
+                "shaders/vertex.txt", "shaders/fragment.txt"),
+            finished.PIPELINE_3D_ARRAY: finished.createShader(
+                "shaders/vertex.txt", "shaders/fragment_array.txt"),
+        }
+        projection = finished.pyrr.matrix44.create_perspective_projection(
+            fovy = 45, aspect = 640 / 480, near = 0.1,
+            far = 2 * OBJECT_DISTANCE, dtype = np.float32)
+        self.frameUniforms = finished.FrameUniforms(projection)
+        self.frameUniforms.update(finished.Player(position = [0,0,0], eulers = [0,0,0]))
+        self.locations = {}
+        for (pipeline, shader) in self.shaders.items():
+            self.frameUniforms.attach(shader)
+            finished.glUseProgram(shader)
+            finished.glUniform1i(finished.glGetUniformLocation(shader, "imageTexture"), 1)
+            finished.glUniform1i(finished.glGetUniformLocation(shader, "imageTextures"), 1)
+            finished.glUniform1i(finished.glGetUniformLocation(shader, "skyTexture"), 0)
+            self.locations[pipeline] = {
+                name: finished.glGetUniformLocation(shader, name)
+                for name in ("model", "instanced", "layer")
+            }
+
+        finished.glBindVertexArray(self.mesh.vao)
+        finished.glEnable(finished.GL_DEPTH_TEST)
+        self.pipeline = None
+
+    def use(self, pipeline: int) -> None:
+
+        self.pipeline = pipeline
+        self.finished.glUseProgram(self.shaders[pipeline])
+
+    def bind(self, texture: int) -> None:
+
+        self.textures[texture].use()
+
+    def bind_array(self) -> None:
+
+        self.array.use()
+
+    def draw(self, i: int, layer: int) -> None:
+
+        locations = self.locations[self.pipeline]
+        self.finished.glUniformMatrix4fv(
+            locations["model"], 1, self.finished.GL_FALSE, self.transforms[i])
+        self.finished.glUniform1i(locations["layer"], layer)
+        self.mesh.draw()
+
+    def draw_instanced(self, objects: np.ndarray, layers: np.ndarray) -> None:
+
+        locations = self.locations[self.pipeline]
+        self.instances.update(self.transforms[objects], layers)
+        self.instances.attach()
+        self.finished.glUniform1i(locations["instanced"], 1)
+        self.mesh.draw_instanced(len(objects))
+        self.finished.glUniform1i(locations["instanced"], 0)
+
+    def destroy(self) -> None:
+
+        self.mesh.destroy()
+        for texture in self.textures:
+            texture.destroy()
+        self.array.destroy()
+        self.instances.destroy()
+        self.frameUniforms.destroy()
+        for shader in self.shaders.values():
+            self.finished.glDeleteProgram(shader)
+
+def time_with_gl(images: list[np.ndarray], object_textures: np.ndarray) -> dict | None:
+    """
+        Render the scene each way in a hidden window and return the
+        average milliseconds per frame, or None without glfw.
+    """
+
+    try:
+        import glfw
+        import glfw.GLFW as GLFW_CONSTANTS
+        #only defines the renderer, App is started when it's run itself
+        import finished
+    except ImportError:
+        return None
+
+    if not glfw.init():
+        return None
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MAJOR, 3)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_CONTEXT_VERSION_MINOR, 3)
+    glfw.window_hint(
+        GLFW_CONSTANTS.GLFW_OPENGL_PROFILE, GLFW_CONSTANTS.GLFW_OPENGL_CORE_PROFILE)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_OPENGL_FORWARD_COMPAT, GLFW_CONSTANTS.GLFW_TRUE)
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_VISIBLE, GLFW_CONSTANTS.GLFW_FALSE)
+    window = glfw.create_window(640, 480, "texture array benchmark", None, None)
+    if not window:
+        glfw.terminate()
+        return None
+    glfw.make_context_current(window)
+
+    scene = GLScene(finished, images)
+
+    def run(pipeline: int, render) -> float:
+        scene.use(pipeline)
+        finished.glFinish()
+        start = time.perf_counter()
+        for _ in range(FRAMES):
+            finished.glClear(finished.GL_COLOR_BUFFER_BIT | finished.GL_DEPTH_BUFFER_BIT)
+            render(DrawCounter(scene))
+        finished.glFinish()
+        return 1000 * (time.perf_counter() - start) / FRAMES
+
+    results = {
+        "separate": run(finished.PIPELINE_3D, lambda counter: render_separate(
+            counter, object_textures, False)),
+        "separate, sorted": run(finished.PIPELINE_3D, lambda counter: render_separate(
+            counter, object_textures, True)),
+        "instanced, sorted": run(finished.PIPELINE_3D, lambda counter:
+            render_instanced_by_texture(counter, object_textures)),
+        "array": run(finished.PIPELINE_3D_ARRAY, lambda counter: render_array(
+            counter, object_textures)),
+    }
+
+    scene.destroy()
+    glfw.terminate()
+    return results
+
+def main() -> None:
+
+    object_textures = get_object_textures()
+
+    print(f"{OBJECT_COUNT} objects, {TEXTURE_COUNT} textures")
+    print(f"{'path':<19}{'binds':>8}{'draws':>8}")
+    for (name, render) in (
+        ("separate", lambda counter: render_separate(
+            counter, object_textures, False)),
+        ("separate, sorted", lambda counter: render_separate(
+            counter, object_textures, True)),
+        ("instanced, sorted", lambda counter: render_instanced_by_texture(
+            counter, object_textures)),
+        ("array", lambda counter: render_array(counter, object_textures)),
+    ):
+        counter = DrawCounter()
+        render(counter)
+        print(f"{name:<19}{counter.binds:>8}{counter.draws:>8}")
+
+    times = time_with_gl(make_textures(), object_textures)
+    if times is None:
+        print("glfw unavailable, skipping the GL frame timing")
+    else:
+        for (name, ms) in times.items():
+            print(f"{name:<19}{ms:>8.2f} ms per frame")
+
+if __name__ == "__main__":
+
+    #usage: python texture_array_benchmark.py, from this folder
+    main()
@@ -0,0 +1,255 @@
+import concurrent.futures
+import os
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image, ImageOps
+
+################### Constants        ########################################
+
+#the textures finished.py loads
+IMAGE_FILES = ("gfx/wood.jpeg",)
+CUBEMAP_FILES = ("gfx/sky",)
+
+#orientation of each face of a cubemap, as in finished.py
+CUBEMAP_FACES = (
+    ("left", lambda img: img),
+    ("right", lambda img: ImageOps.mirror(ImageOps.flip(img))),
+    ("top", lambda img: img.rotate(90)),
+    ("bottom", lambda img: img),
+    ("back", lambda img: img.rotate(-90)),
+    ("front", lambda img: img.rotate(90)),
+)
+
+TEXTURE_MODES = ("L", "RGB", "RGBA")
+
+REPEATS = 5
+
+################### Loading Paths #############################################
+
+def read_rgba_bytes(img: Image.Image):
+    """ The old path: widen to RGBA, then copy out to bytes twice. """
+
+    img = img.convert("RGBA")
+    return bytes(img.tobytes())
+
+def read_pixels(img: Image.Image):
+    """
+        The new path: keep the image's channels, and paste grey and RGBA
+        images straight into the array which will be handed to GL.
+    """
+
+    if img.mode not in TEXTURE_MODES:
+        has_alpha = "A" in img.mode or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+    if img.mode == "RGB":
+        return np.asarray(img)
+
+    pixels = np.empty((img.height, img.width, len(img.mode)), dtype=np.uint8)
+    target = Image.frombuffer(img.mode, img.size, pixels, "raw", img.mode, 0, 1)
+    target.readonly = 0
+    target.paste(img)
+    return pixels
+
+def get_texture_loaders() -> list:
+    """
+        Return a function for every texture finished.py uses, which
+        decodes it the way the given read function would.
+    """
+
+    def load_image(filepath):
+        def load(read):
+            with Image.open(filepath, mode = "r") as img:
+                return read(img)
+        return load
+
+    def load_face(filepath, suffix, orient):
+        def load(read):
+            with Image.open(f"{filepath}_{suffix}.png", mode = "r") as img:
+                return read(orient(img))
+        return load
+
+    loaders = [load_image(filepath) for filepath in IMAGE_FILES]
+    for filepath in CUBEMAP_FILES:
+        for (suffix, orient) in CUBEMAP_FACES:
+            loaders.append(load_face(filepath, suffix, orient))
+    return loaders
+
+def load_textures(read) -> list:
+    """ Decode every texture finished.py uses, the way read would. """
+
+    return [load(read) for load in get_texture_loaders()]
+
+################### Measurement ###############################################
+
+def measure(read) -> dict[str, float]:
+    """
+        Load every texture with the given path, and return the best time
+        taken, the most memory loading any one texture needed and the
+        number of bytes left to hand to GL.
+
+        Memory is as seen by tracemalloc, which follows Python and numpy
+        allocations but not PIL's own image buffers, so it counts the
+        copies made after decoding.
+    """
+
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        load_textures(read)
+        times.append(time.perf_counter() - start)
+
+    peak = 0
+    upload = 0
+    for load in get_texture_loaders():
+        tracemalloc.start()
+        texture = load(read)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        upload += len(memoryview(texture).cast("B"))
+        del texture
+
+    return {"time": min(times), "peak": peak, "upload": upload}
+
+def measure_cubemap_decode(filepath: str) -> tuple[float]:
+    """
+        Time decoding and orienting the six faces of a cubemap one after
+        another, then on a thread pool as finished.py does.
+
+        Returns:
+
+            (sequential, threaded, workers): the best times in seconds,
+            and the number of threads used.
+    """
+
+    def read_face(face):
+        (suffix, orient) = face
+        with Image.open(f"{filepath}_{suffix}.png", mode = "r") as img:
+            return read_pixels(orient(img))
+
+    workers = min(len(CUBEMAP_FACES), os.cpu_count() or 1)
+
+    def read_sequential():
+        return [read_face(face) for face in CUBEMAP_FACES]
+
+    def read_threaded():
+        with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as pool:
+            return list(pool.map(read_face, CUBEMAP_FACES))
+
+    results = []
+    for read in (read_sequential, read_threaded):
+        times = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            read()
+            times.append(time.perf_counter() - start)
+        results.append(min(times))
+    return (*results, workers)
+
+def measure_gl_upload(textures: list) -> tuple[float] | None:
+    """
+        Time handing the given (height, width, channels) arrays to GL,
+        the way finished.py now does, along with their RGBA bytes the old
+        way. Returns (old, new) seconds, or None without glfw.
+    """
+
+    try:
+        import glfw
+        import glfw.GLFW as GLFW_CONSTANTS
+        from OpenGL.GL import (
+            glGenTextures, glBindTexture, glDeleteTextures, glFinish, 
+            glPixelStorei, glTexImage2D, glTexStorage2D, glTexSubImage2D,
+            GL_TEXTURE_2D, GL_UNPACK_ALIGNMENT, GL_UNSIGNED_BYTE,
+            GL_RGBA, GL_RGBA8, GL_R8, GL_RED, GL_RGB8, GL_RGB)
+    except ImportError:
+        return None
+
+    if not glfw.init():
+        return None
+    glfw.window_hint(GLFW_CONSTANTS.GLFW_VISIBLE, GLFW_CONSTANTS.GLFW_FALSE)
+    window = glfw.create_window(64, 64, "texture benchmark", None, None)
+    if not window:
+        glfw.terminate()
+        return None
+    glfw.make_context_current(window)
+
+    formats = {1: (GL_R8, GL_RED), 3: (GL_RGB8, GL_RGB), 4: (GL_RGBA8, GL_RGBA)}
+    rgba = [
+        np.ascontiguousarray(np.concatenate(
+            (pixels, np.full(pixels.shape[:2] + (1,), 255, np.uint8)), axis=2)
+            if pixels.shape[2] == 3 else pixels).tobytes()
+        for pixels in textures
+    ]
+
+    def upload_old():
+        for (pixels, data) in zip(textures, rgba):
+            glTexImage2D(
+                GL_TEXTURE_2D, 0, GL_RGBA, pixels.shape[1], pixels.shape[0], 0,
+                GL_RGBA, GL_UNSIGNED_BYTE, data)
+
+    def upload_new():
+        for pixels in textures:
+            height, width, channels = pixels.shape
+            internal_format, pixel_format = formats[channels]
+            texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexStorage2D(GL_TEXTURE_2D, 1, internal_format, width, height)
+            row_bytes = width * channels
+            glPixelStorei(
+                GL_UNPACK_ALIGNMENT, 
+                next(alignment for alignment in (8, 4, 2, 1) if row_bytes % alignment == 0))
+            glTexSubImage2D(
+                GL_TEXTURE_2D, 0, 0, 0, width, height, 
+                pixel_format, GL_UNSIGNED_BYTE, pixels)
+            glDeleteTextures(1, (texture,))
+
+    results = []
+    for upload in (upload_old, upload_new):
+        texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        best = None
+        for _ in range(REPEATS):
+            glFinish()
+            start = time.perf_counter()
+            upload()
+            glFinish()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        glDeleteTextures(1, (texture,))
+        results.append(best)
+
+    glfw.terminate()
+    return tuple(results)
+
+def main() -> None:
+
+    #decode every image once first, so neither path pays for a cold disk
+    load_textures(read_pixels)
+
+    print(f"{'path':<8}{'time (ms)':>11}{'peak per image (MB)':>21}{'upload (MB)':>13}")
+    for (name, read) in (("old", read_rgba_bytes), ("new", read_pixels)):
+        result = measure(read)
+        print(
+            f"{name:<8}{1000 * result['time']:>11.1f}"
+            f"{result['peak'] / 2**20:>21.1f}{result['upload'] / 2**20:>13.1f}"
+        )
+
+    for filepath in CUBEMAP_FILES:
+        sequential, threaded, workers = measure_cubemap_decode(filepath)
+        print(
+            f"{filepath} faces: sequential {1000 * sequential:.1f} ms, "
+            f"{workers} threads {1000 * threaded:.1f} ms"
+        )
+
+    upload_times = measure_gl_upload(load_textures(read_pixels))
+    if upload_times is None:
+        print("glfw unavailable, skipping the GL upload timing")
+    else:
+        old, new = upload_times
+        print(f"GL upload: old {1000 * old:.1f} ms, new {1000 * new:.1f} ms")
+
+if __name__ == "__main__":
+
+    #usage: python texture_benchmark.py, from this folder
+    main()
@@ -1,4 +1,6 @@
+import concurrent.futures
 import ctypes
+import sys
 import numpy as np
 import pyrr
 
@@ -7,12 +9,113 @@ from OpenGL.GL.shaders import compileProgram, compileShader
 
 from PyQt6.QtCore import QSize, QRect
 
-from PyQt6.QtGui import QSurfaceFormat, QPixmap, QImage
+from PyQt6.QtGui import QSurfaceFormat, QImage, QImageReader
 from PyQt6.QtOpenGL import QOpenGLVersionProfile
 from PyQt6.QtOpenGLWidgets import QOpenGLWidget
 
 import grid
 
+# bytes of image rows uploaded per paint, so a large image
+# comes in over a few frames rather than stalling one
+IMAGE_UPLOAD_BUDGET = 4 * 1024 * 1024
+
+# images are decoded into these in turn, so the next image
+# needn't wait for the GPU to finish reading the last one
+PIXEL_BUFFER_COUNT = 2
+
+def get_pixels(image):
+
+    pixels = image.constBits()
+    pixels.setsize(image.sizeInBytes())
+    return np.frombuffer(pixels, dtype=np.uint8)
+
+def decode_image(filename, memory):
+    """
+        Decode an image, copying it into memory (a mapped pixel buffer)
+        if that's given and the right size. Returns (image, pixels, staged):
+        pixels are RGBA8888 rows, and staged is whether they're in memory.
+        The image is always one of Qt's own, since the buffer is only
+        mapped for writing and is never read back, eg. by export_images.
+    """
+
+    image = QImageReader(filename).read()
+    if image.isNull():
+        return (QImage(), None, False)
+
+    # memory is sized from the file's header, which can disagree
+    if memory is None or memory.nbytes != 4 * image.width() * image.height():
+        image = image.convertedTo(QImage.Format.Format_RGBA8888)
+        return (image, get_pixels(image), False)
+    
+    if image.format() in (QImage.Format.Format_ARGB32, QImage.Format.Format_RGB32) \
+        and sys.byteorder == "little":
+        # what Qt's png and jpeg decoders give, stored B,G,R,A,
+        # so it's swizzled into the buffer in one pass
+        np.take(
+            get_pixels(image).reshape(-1, 4), (2, 1, 0, 3), axis = 1,
+            out = memory.reshape(-1, 4), mode = "clip")
+    else:
+        memory[:] = get_pixels(image.convertedTo(QImage.Format.Format_RGBA8888))
+    return (image, memory, True)
+
+class PixelBuffer:
+    """
+        A pixel unpack buffer which stays mapped, so a worker thread
+        can decode into it while the GUI thread carries on. It grows
+        to fit the largest image written to it.
+    """
+
+    def __init__(self):
+        self.buffer = None
+        self.size = 0
+        self.memory = None
+        self.fence = None
+        self.writing = None
+
+    def reserve(self, size):
+
+        # wait for the last image to be written, and read by the GPU
+        if self.writing is not None:
+            concurrent.futures.wait((self.writing,))
+            self.writing = None
+        if self.fence is not None:
+            glClientWaitSync(self.fence, GL_SYNC_FLUSH_COMMANDS_BIT, GL_TIMEOUT_IGNORED)
+            glDeleteSync(self.fence)
+            self.fence = None
+
+        if size > self.size:
+            self.destroy()
+            flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+            self.buffer = glGenBuffers(1)
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffer)
+            glBufferStorage(GL_PIXEL_UNPACK_BUFFER, size, None, flags)
+            address = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, size, flags)
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+            self.memory = np.ctypeslib.as_array(
+                (ctypes.c_ubyte * size).from_address(
+                    ctypes.cast(address, ctypes.c_void_p).value))
+            self.size = size
+        
+        return self.memory[:size]
+
+    def release(self):
+
+        # the GPU may still be reading, mark when it's done
+        self.fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def destroy(self):
+
+        if self.buffer is None:
+            return
+        
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffer)
+        glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+        glDeleteBuffers(1, (self.buffer,))
+        self.buffer = None
+        self.size = 0
+        self.memory = None
+
 class ImageFrame(QOpenGLWidget):
 
     def __init__(self, width, height):
@@ -20,6 +123,14 @@ class ImageFrame(QOpenGLWidget):
         self.setFixedSize(QSize(width,height))
         self.image_loaded = False
 
+        # the image being decoded and uploaded, and its rows uploaded so far.
+        # img may read its pixels from the pixel buffer, which isn't
+        # reused until the next image is loaded
+        self.workers = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+        self.loading = None
+        self.pixel_buffer = None
+        self.upload_row = 0
+
     def initializeGL(self):
 
         self.fmt = QOpenGLVersionProfile()
@@ -79,11 +190,20 @@ class ImageFrame(QOpenGLWidget):
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 8, ctypes.c_void_p(0))
 
+        # persistent mapping needs GL 4.4 or ARB_buffer_storage,
+        # without it images are uploaded from client memory
+        self.pixel_buffers = []
+        if glBufferStorage:
+            self.pixel_buffers = [PixelBuffer() for _ in range(PIXEL_BUFFER_COUNT)]
+        self.next_pixel_buffer = 0
+
     def load_image(self, filename):
 
         self.unload_image()
-        
-        self.image_loaded = True
+
+        size = QImageReader(filename).size()
+        self.image_length = size.width()
+        self.image_width = size.height()
 
         self.image_texture = glGenTextures(1)
         glBindTexture(GL_TEXTURE_2D, self.image_texture)
@@ -93,19 +213,75 @@ class ImageFrame(QOpenGLWidget):
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
 
-        self.img = QPixmap(filename)
-        size = self.img.size()
-        self.image_length = size.width()
-        self.image_width = size.height()
-        self.img = self.img.toImage()
-        self.img = self.img.convertedTo(QImage.Format.Format_RGBA8888)
-        pixels = self.img.constBits()
-        pixels.setsize(self.img.sizeInBytes())
-        img_data = np.array(pixels, copy=True)
-        glTexImage2D(GL_TEXTURE_2D,0,GL_RGBA8,self.image_length,self.image_width,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+        glTexImage2D(GL_TEXTURE_2D,0,GL_RGBA8,self.image_length,self.image_width,0,GL_RGBA,GL_UNSIGNED_BYTE,None)
+
+        # decode on a worker, straight into a pixel buffer if there is one,
+        # paintGL uploads it once it's ready
+        memory = None
+        self.pixel_buffer = None
+        if self.pixel_buffers and size.isValid():
+            self.pixel_buffer = self.pixel_buffers[self.next_pixel_buffer]
+            self.next_pixel_buffer = (self.next_pixel_buffer + 1) % len(self.pixel_buffers)
+            memory = self.pixel_buffer.reserve(4 * self.image_length * self.image_width)
+        self.loading = self.workers.submit(decode_image, filename, memory)
+        if self.pixel_buffer is not None:
+            self.pixel_buffer.writing = self.loading
+        self.upload_row = 0
+        self.update()
+
+    def upload_rows(self):
+
+        self.img, pixels, staged = self.loading.result()
+        if self.img.isNull():
+            self.finish_loading()
+            glDeleteTextures(1, (self.image_texture,))
+            return
+
+        if (self.img.width(), self.img.height()) != (self.image_length, self.image_width):
+            # the header was wrong, size the texture to the decoded image
+            self.image_length = self.img.width()
+            self.image_width = self.img.height()
+            glBindTexture(GL_TEXTURE_2D, self.image_texture)
+            glTexImage2D(GL_TEXTURE_2D,0,GL_RGBA8,self.image_length,self.image_width,0,GL_RGBA,GL_UNSIGNED_BYTE,None)
+
+        row_bytes = 4 * self.image_length
+        rows = min(self.image_width - self.upload_row, max(1, IMAGE_UPLOAD_BUDGET // row_bytes))
+        offset = self.upload_row * row_bytes
+
+        glBindTexture(GL_TEXTURE_2D, self.image_texture)
+        if staged:
+            # with a buffer bound, the data pointer is an offset into it
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.pixel_buffer.buffer)
+            data = ctypes.c_void_p(offset)
+        else:
+            data = pixels[offset : offset + rows * row_bytes]
+        glTexSubImage2D(GL_TEXTURE_2D,0,0,self.upload_row,self.image_length,rows,GL_RGBA,GL_UNSIGNED_BYTE,data)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+        self.upload_row += rows
+        if self.upload_row < self.image_width:
+            # the rest next frame
+            self.update()
+            return
+        
+        self.finish_loading()
+        self.image_loaded = True
+    
+    def finish_loading(self):
+
+        if self.pixel_buffer is not None:
+            self.pixel_buffer.release()
+            self.pixel_buffer = None
+        self.loading = None
     
     def unload_image(self):
 
+        if self.loading is not None:
+            # any decode still running finishes in the background,
+            # its pixel buffer waits for it before it's used again
+            self.finish_loading()
+            glDeleteTextures(1, (self.image_texture,))
+
         if not self.image_loaded:
             return
         
@@ -160,6 +336,9 @@ class ImageFrame(QOpenGLWidget):
 
         glClear(GL_COLOR_BUFFER_BIT)
 
+        if self.loading is not None and self.loading.done():
+            self.upload_rows()
+
         if self.image_loaded:
 
             # Image
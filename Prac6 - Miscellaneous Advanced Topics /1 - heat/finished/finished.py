@@ -3,6 +3,15 @@ import glfw.GLFW as GLFW_CONSTANTS
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram,compileShader
 import numpy as np
+import os
+import tempfile
+import warnings
+import glob
+import concurrent.futures
+import queue
+import time
+import sys
+import traceback
 import pyrr
 from PIL import Image, ImageOps
 
@@ -17,9 +26,172 @@ PIPELINE_SKY = 0
 PIPELINE_3D = 1
 PIPELINE_POST = 2
 
+#passes of the render queue, drawn in this order
+PASS_SKY = 0
+PASS_OPAQUE = 1
+PASS_EFFECTS = 2
+PASS_POST = 3
+
+#binding point of the Frame uniform block every shader reads
+FRAME_UNIFORM_BINDING = 0
+
 LAYER_STANDARD = 0
 LAYER_EFFECTS = 1
 
+#how each attribute of a mesh can be stored on the graphics card
+POSITION_FLOAT = "float"
+POSITION_UNORM16 = "unorm16"
+
+TEXCOORD_FLOAT = "float"
+TEXCOORD_HALF = "half"
+TEXCOORD_UNORM16 = "unorm16"
+
+NORMAL_FLOAT = "float"
+NORMAL_PACKED = "packed"
+
+#(position, texcoord, normal)
+VERTEX_FORMAT_FLOAT = (POSITION_FLOAT, TEXCOORD_FLOAT, NORMAL_FLOAT)
+VERTEX_FORMAT_COMPACT = (POSITION_FLOAT, TEXCOORD_HALF, NORMAL_PACKED)
+VERTEX_FORMAT_QUANTIZED = (POSITION_UNORM16, TEXCOORD_UNORM16, NORMAL_PACKED)
+
+#quantized positions are padded out to 4 bytes, to keep every
+#attribute aligned
+FIELD_TYPES = {
+    ("position", POSITION_FLOAT): ("<f4", (3,)),
+    ("position", POSITION_UNORM16): ("<u2", (4,)),
+    ("texcoord", TEXCOORD_FLOAT): ("<f4", (2,)),
+    ("texcoord", TEXCOORD_HALF): ("<f2", (2,)),
+    ("texcoord", TEXCOORD_UNORM16): ("<u2", (2,)),
+    ("normal", NORMAL_FLOAT): ("<f4", (3,)),
+    ("normal", NORMAL_PACKED): ("<u4", ()),
+}
+
+#(size, type, normalized) to hand glVertexAttribPointer
+ATTRIBUTE_TYPES = {
+    ("position", POSITION_FLOAT): (3, GL_FLOAT, GL_FALSE),
+    ("position", POSITION_UNORM16): (3, GL_UNSIGNED_SHORT, GL_TRUE),
+    ("texcoord", TEXCOORD_FLOAT): (2, GL_FLOAT, GL_FALSE),
+    ("texcoord", TEXCOORD_HALF): (2, GL_HALF_FLOAT, GL_FALSE),
+    ("texcoord", TEXCOORD_UNORM16): (2, GL_UNSIGNED_SHORT, GL_TRUE),
+    ("normal", NORMAL_FLOAT): (3, GL_FLOAT, GL_FALSE),
+    ("normal", NORMAL_PACKED): (4, GL_INT_2_10_10_10_REV, GL_TRUE),
+}
+
+#object types drawn with one instanced call for all their entities,
+#rather than a call each, the I key switches the cubes between the two
+INSTANCED_OBJECT_TYPES = (OBJECT_CUBE,)
+
+#first of the four attribute locations an instance's model transform
+#takes up, one per column
+INSTANCE_ATTRIBUTE = 3
+
+#extra cubes laid out on a grid, for comparing the two ways of drawing
+#them. 50000 makes the difference plain
+STRESS_CUBE_COUNT = 0
+STRESS_CUBE_SPACING = 3
+
+#print the memory each indexed mesh saves as it's made
+REPORT_MESH_MEMORY = False
+
+#print how long assets take to decode when they aren't cached, and
+#how long loading took and the GPU memory in use once it's all done
+REPORT_ASSET_LOADING = False
+
+#seconds per frame the asset manager may spend making GL objects
+ASSET_UPLOAD_BUDGET = 0.004
+
+#bytes of GPU memory the program should stay within, a summary of
+#what's using it is printed if it goes over
+GPU_MEMORY_BUDGET = 256 * 1024 * 1024
+
+#threads reading asset files in the background
+ASSET_WORKERS = 4
+
+#pixel unpack buffers uploads are staged through, and the bytes each
+#holds. Images too large for one are uploaded from client memory
+PIXEL_BUFFER_COUNT = 4
+PIXEL_BUFFER_SIZE = 8 * 1024 * 1024
+
+#staged images start on multiples of this many bytes
+PIXEL_BUFFER_ALIGNMENT = 16
+
+#bytes of staged pixels the asset manager may upload per frame,
+#at least one step is taken every frame however large
+PIXEL_UPLOAD_BUDGET = 8 * 1024 * 1024
+
+#the single pixel image textures show while they load
+PLACEHOLDER_IMAGE = np.full((1, 1, 3), 128, dtype=np.uint8)
+
+#PIL modes which can be uploaded as they are, others are converted
+TEXTURE_MODES = ("L", "RGB", "RGBA")
+
+#(internal format, pixel format) of an image with each number of channels
+TEXTURE_FORMATS = {
+    1: (GL_R8, GL_RED),
+    3: (GL_RGB8, GL_RGB),
+    4: (GL_RGBA8, GL_RGBA),
+}
+
+#file suffix, target and orientation of each face of a cubemap
+CUBEMAP_FACES = (
+    ("left", GL_TEXTURE_CUBE_MAP_NEGATIVE_Y, lambda img: img),
+    ("right", GL_TEXTURE_CUBE_MAP_POSITIVE_Y, lambda img: ImageOps.mirror(ImageOps.flip(img))),
+    ("top", GL_TEXTURE_CUBE_MAP_POSITIVE_Z, lambda img: img.rotate(90)),
+    ("bottom", GL_TEXTURE_CUBE_MAP_NEGATIVE_Z, lambda img: img),
+    ("back", GL_TEXTURE_CUBE_MAP_NEGATIVE_X, lambda img: img.rotate(-90)),
+    ("front", GL_TEXTURE_CUBE_MAP_POSITIVE_X, lambda img: img.rotate(90)),
+)
+
+#texels each tile of a texture atlas is padded out by, repeating its
+#border. Tiles are laid out on blocks of this many texels, so it must
+#be a power of two: each mip level halves the padding, and filtering
+#stays inside a tile down to the level where one texel is left
+ATLAS_PADDING = 4
+#the smallest mip level an atlas is made with, see ATLAS_PADDING
+ATLAS_MAX_LEVEL = ATLAS_PADDING.bit_length() - 1
+
+#diffuse color of faces without a material, matching Blender's default
+DEFAULT_DIFFUSE_COLOR = (0.8, 0.8, 0.8)
+
+MESH_CACHE_EXTENSION = ".mesh"
+MESH_CACHE_MAGIC = b"MESH"
+MESH_CACHE_VERSION = 1
+MESH_CACHE_MAX_ATTRIBUTES = 8
+
+#fixed size header at the front of every cache file,
+#the float32 vertex data follows straight after it
+MESH_CACHE_HEADER = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u4"),
+    ("source_size", "<u8"),
+    ("source_mtime", "<i8"),
+    ("vertex_count", "<u8"),
+    ("attribute_count", "<u4"),
+    ("layout", "<u4", (MESH_CACHE_MAX_ATTRIBUTES,)),
+])
+
+TEXTURE_CACHE_EXTENSION = ".tex"
+TEXTURE_CACHE_MAGIC = b"TEXR"
+TEXTURE_CACHE_VERSION = 1
+
+#fixed size header at the front of every cooked texture, the pixels
+#follow straight after it: each face in turn, every mip level of a
+#face from largest to smallest
+TEXTURE_CACHE_HEADER = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u4"),
+    ("source_size", "<u8"),
+    ("source_mtime", "<i8"),
+    ("width", "<u4"),
+    ("height", "<u4"),
+    ("channels", "<u4"),
+    ("levels", "<u4"),
+    ("faces", "<u4"),
+])
+
+#PIL mode of an image with each number of channels
+CHANNEL_MODES = {1: "L", 3: "RGB", 4: "RGBA"}
+
 ################### Helper Functions ########################################
 
 def createShader(vertexFilepath: str, fragmentFilepath: str) -> int:
@@ -50,103 +222,1202 @@ def createShader(vertexFilepath: str, fragmentFilepath: str) -> int:
     
     return shader
 
-def load_model_from_file(
-    filename: str) -> list[float]:
-    """ 
-        Read the given obj file and return a list of all the
-        vertex data.
-    """
-
-    v = []
-    vt = []
-    vn = []
-    vertices = []
-
-    with open(filename,'r') as f:
-        line = f.readline()
-        while line:
-            words = line.split(" ")
-            if words[0] == "v":
-                v.append(read_vertex_data(words))
-            elif words[0] == "vt":
-                vt.append(read_texcoord_data(words))
-            elif words[0] == "vn":
-                vn.append(read_normal_data(words))
-            elif words[0] == "f":
-                read_face_data(words, v, vt, vn, vertices)
-            line = f.readline()
-    
+def read_image(filepath: str) -> np.ndarray:
+    """
+        Decode an image file, without touching any GL state,
+        so that it can run on a worker thread.
+
+        Returns:
+
+            The pixels as a (height, width, channels) uint8 array.
+    """
+
+    with Image.open(filepath, mode = "r") as image:
+        return get_pixels(image)
+
+def get_pixels(image: Image.Image) -> np.ndarray:
+    """
+        Return the pixels of the given image as a (height, width, channels)
+        uint8 array, which can be handed to GL as it is.
+
+        Grey, RGB and RGBA images keep their channels rather than being
+        widened to RGBA. Grey and RGBA images are laid out in memory just
+        as GL wants them, so they're pasted straight into the array.
+        PIL pads RGB pixels out to 4 bytes, so those are repacked.
+    """
+
+    if image.mode not in TEXTURE_MODES:
+        has_alpha = "A" in image.mode or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    if image.mode == "RGB":
+        return np.asarray(image)
+
+    pixels = np.empty(
+        (image.height, image.width, len(image.mode)), dtype=np.uint8)
+    target = Image.frombuffer(
+        image.mode, image.size, pixels, "raw", image.mode, 0, 1)
+    #the array is ours to write, so let paste fill it rather than
+    #taking a private copy
+    target.readonly = 0
+    target.paste(image)
+    return pixels
+
+def read_cubemap_faces(filepath: str) -> list[tuple]:
+    """
+        Decode the six images of a cubemap, turning each to face the
+        right way. Touches no GL state, so can run on a worker thread.
+
+        Parameters:
+
+            filepath: the images are read from filepath_left.png,
+                filepath_right.png and so on
+
+        Returns:
+
+            A (target, pixels) pair for every face.
+    """
+
+    #PIL lets go of the GIL while decoding and transforming,
+    #so the faces are read side by side
+    workers = min(len(CUBEMAP_FACES), os.cpu_count() or 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as pool:
+        return list(pool.map(
+            lambda face: read_cubemap_face(filepath, *face), CUBEMAP_FACES))
+
+def read_cubemap_face(
+    filepath: str, suffix: str, target: int, orient) -> tuple:
+    """ Decode and orient one face of a cubemap, see read_cubemap_faces. """
+
+    with Image.open(f"{filepath}_{suffix}.png", mode = "r") as img:
+        return (target, get_pixels(orient(img)))
+
+def allocate_texture(
+    target: int, width: int, height: int, 
+    channels: int, levels: int) -> int:
+    """
+        Give the bound texture immutable storage, in the sized format
+        matching the given number of channels. A cubemap's faces are
+        all allocated at once. Returns the bytes allocated.
+
+        Parameters:
+
+            target: GL_TEXTURE_2D or GL_TEXTURE_CUBE_MAP
+
+            levels: the number of mipmap levels to make room for
+    """
+
+    internal_format, pixel_format = TEXTURE_FORMATS[channels]
+    if glTexStorage2D:
+        glTexStorage2D(target, levels, internal_format, width, height)
+    else:
+        #glTexStorage2D needs GL 4.2 or ARB_texture_storage,
+        #without it every level has to be allocated on its own
+        targets = [target]
+        if target == GL_TEXTURE_CUBE_MAP:
+            targets = [face_target for (_, face_target, _) in CUBEMAP_FACES]
+        for level in range(levels):
+            for level_target in targets:
+                glTexImage2D(
+                    level_target, level, internal_format,
+                    max(1, width >> level), max(1, height >> level), 0,
+                    pixel_format, GL_UNSIGNED_BYTE, None)
+        glTexParameteri(target, GL_TEXTURE_MAX_LEVEL, levels - 1)
+
+    if channels == 1:
+        #read single channel textures as grey rather than red
+        glTexParameteriv(
+            target, GL_TEXTURE_SWIZZLE_RGBA, 
+            (GL_RED, GL_RED, GL_RED, GL_ONE))
+
+    images = 6 if target == GL_TEXTURE_CUBE_MAP else 1
+    return images * sum(
+        w * h * channels for (w, h) in get_mipmap_sizes(width, height, levels))
+
+def upload_pixels(
+    target: int, pixels: np.ndarray, 
+    level: int = 0, pixel_buffer = None) -> None:
+    """
+        Copy a (height, width, channels) image into the given mip level
+        of the bound texture (or cubemap face) straight from its array.
+
+        If the image was staged in a PixelBuffer, pass that too. The
+        GPU then copies from the buffer in its own time, rather than
+        the driver copying from client memory before returning.
+    """
+
+    height, width, channels = pixels.shape
+    _, pixel_format = TEXTURE_FORMATS[channels]
+
+    #rows are tightly packed, eg. 3 byte pixels often leave
+    #them short of GL's default 4 byte alignment
+    row_bytes = width * channels
+    glPixelStorei(
+        GL_UNPACK_ALIGNMENT, 
+        next(alignment for alignment in (8, 4, 2, 1) if row_bytes % alignment == 0))
+
+    if pixel_buffer is None:
+        data = np.ascontiguousarray(pixels)
+    else:
+        #with a buffer bound, the data pointer is an offset into it
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pixel_buffer.buffer)
+        data = ctypes.c_void_p(pixel_buffer.get_offset(pixels))
+        pixel_buffer.uploaded += pixels.nbytes
+
+    glTexSubImage2D(
+        target, level, 0, 0, width, height, 
+        pixel_format, GL_UNSIGNED_BYTE, data)
+
+    if pixel_buffer is not None:
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+def get_staged_size(pixels: np.ndarray) -> int:
+    """ Return the bytes an image takes up in a pixel buffer. """
+
+    return -(-pixels.nbytes // PIXEL_BUFFER_ALIGNMENT) * PIXEL_BUFFER_ALIGNMENT
+
+def load_model_from_file(filename: str) -> np.ndarray:
+    """
+        Read the given obj file and return a flat array of all the
+        vertex data, laid out as x, y, z, s, t, nx, ny, nz per corner.
+
+        Parameters:
+
+            filename: filepath to the obj file (relative to the working directory)
+
+        Returns:
+
+            A float32 array holding 8 floats for every triangle corner.
+    """
+
+    v, vt, vn, v_vt_vn = read_obj(filename)
+
+    return build_vertices(v, vt, vn, v_vt_vn).ravel()
+
+def read_obj(filename: str) -> tuple[np.ndarray]:
+    """
+        Read the given obj file and return its attribute blocks along
+        with the triangulated corner indices.
+
+        Rather than walking the file line by line, the whole file is
+        treated as one byte array. Each line is classified by its flag,
+        every v, vt, vn and f block is then handed to numpy's parser in
+        a single call and polygons are fanned into triangles with
+        index arithmetic.
+
+        Parameters:
+
+            filename: filepath to the obj file
+
+        Returns:
+
+            (v, vt, vn, v_vt_vn): positions (n,3), texcoords (n,2),
+            normals (n,3) and a (corners,3) int array of zero based
+            indices into them, -1 marks an index the face didn't give.
+    """
+
+    text = ObjText(np.fromfile(filename, dtype=np.uint8))
+
+    v = read_vertex_data(text, "v", 3)
+    vt = read_vertex_data(text, "vt", 2)
+    vn = read_vertex_data(text, "vn", 3)
+    v_vt_vn = read_face_data(text)
+
+    return (v, vt, vn, v_vt_vn)
+
+#lookup table, indexed by byte value
+IS_WHITESPACE = np.zeros(256, dtype=bool)
+IS_WHITESPACE[[ord(c) for c in " \t\r\n"]] = True
+
+class ObjText:
+    """
+        An obj file as a byte array, along with the per line
+        bookkeeping needed to pull out whole blocks at once.
+    """
+
+
+    def __init__(self, data: np.ndarray):
+        """
+            Index the lines and tokens of the given file contents.
+
+            Parameters:
+
+                data: the raw bytes of the file, as a uint8 array
+        """
+
+        # terminate the last line, so every line ends in a newline
+        self.data = np.append(data, np.uint8(ord("\n")))
+
+        newline = self.data == ord("\n")
+        line_ends = np.flatnonzero(newline)
+        self.line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+        self.line_lengths = line_ends + 1 - self.line_starts
+
+        self.blank_comments(newline)
+
+        is_space = IS_WHITESPACE[self.data]
+        token_starts = ~is_space
+        token_starts[1:] &= is_space[:-1]
+        self.tokens_in_line = np.add.reduceat(
+            token_starts, self.line_starts, dtype=np.int64)
+
+    def blank_comments(self, newline: np.ndarray) -> None:
+        """
+            Blank out everything from a # to the end of its line, so
+            that trailing comments don't reach numpy's parser.
+        """
+
+        is_hash = self.data == ord("#")
+        if not is_hash.any():
+            return
+
+        # a byte is commented out if a # comes before it on its line
+        hashes = np.cumsum(is_hash)
+        hashes_before_line = (hashes - is_hash)[self.line_starts]
+        line = np.cumsum(newline) - newline
+        in_comment = (hashes > hashes_before_line[line]) & ~newline
+        self.data[in_comment] = ord(" ")
+
+    def find_lines(self, flag: str) -> np.ndarray:
+        """ Return a mask of which lines begin with the given flag. """
+
+        is_flagged = np.ones(len(self.line_starts), dtype=bool)
+        for i, character in enumerate(flag):
+            is_flagged &= self.read_column(i) == ord(character)
+        return is_flagged & IS_WHITESPACE[self.read_column(len(flag))]
+
+    def read_column(self, i: int) -> np.ndarray:
+        """
+            Return the i'th byte of every line, short lines
+            just read their own newline.
+        """
+
+        return np.take(
+            self.data, self.line_starts + np.minimum(i, self.line_lengths - 1))
+
+    def read_block(self, lines: np.ndarray, flag: str) -> np.ndarray:
+        """
+            Return the text of the given lines with their flags
+            blanked out, so that only the numbers remain.
+        """
+
+        block = self.data[np.repeat(lines, self.line_lengths)]
+        line_lengths = self.line_lengths[lines]
+        flag_offsets = np.cumsum(line_lengths) - line_lengths
+        for i in range(len(flag)):
+            block[flag_offsets + i] = ord(" ")
+        return block
+
+    def read_words(self, lines: np.ndarray) -> list[str]:
+        """
+            Return the text following the flag of each of the given
+            lines, eg. the name given by a usemtl line.
+        """
+
+        return [
+            " ".join(self.data[start : start + length].tobytes().decode().split()[1:])
+            for (start, length)
+            in zip(self.line_starts[lines], self.line_lengths[lines])
+        ]
+
+def read_vertex_data(
+    text: ObjText, flag: str, size: int) -> np.ndarray:
+    """
+        Read every line starting with the given flag, and return
+        the first size numbers of each as an (n,size) array.
+    """
+
+    lines = text.find_lines(flag)
+    if not lines.any():
+        return np.zeros((0, size), dtype=np.float32)
+
+    values = np.fromstring(
+        text.read_block(lines, flag).tobytes(), dtype=np.float32, sep=" ")
+
+    # exporters are free to add optional components (eg. vt u v w),
+    # so take the first size numbers from each line
+    numbers_in_line = text.tokens_in_line[lines] - 1
+    if (numbers_in_line == size).all():
+        return values.reshape(-1, size)
+    line_offsets = np.cumsum(numbers_in_line) - numbers_in_line
+    return values[line_offsets[:, None] + np.arange(size)]
+
+def read_face_data(text: ObjText) -> np.ndarray:
+    """
+        Read every face in the file and return the (v, vt, vn) index
+        triple for every corner of every triangle.
+
+        Supports the v, v/vt, v//vn and v/vt/vn corner forms, polygons
+        are unpacked as triangle fans.
+    """
+
+    lines = text.find_lines("f")
+    if not lines.any():
+        return np.zeros((0, 3), dtype=np.int64)
+
+    block = text.read_block(lines, "f")
+    columns = get_face_columns(block)
+    block[block == ord("/")] = ord(" ")
+
+    indices = np.fromstring(block.tobytes(), dtype=np.int64, sep=" ")
+    v_vt_vn = np.full((len(indices) // len(columns), 3), -1, dtype=np.int64)
+    v_vt_vn[:, columns] = indices.reshape(-1, len(columns)) - 1
+
+    corners_in_face = text.tokens_in_line[lines] - 1
+    return v_vt_vn[fan_triangles(corners_in_face)]
+
+def get_face_columns(block: np.ndarray) -> list[int]:
+    """
+        Work out which of v, vt, vn each corner gives, judging by the
+        first corner of the block.
+    """
+
+    is_space = IS_WHITESPACE[block[:256]]
+    first = np.argmin(is_space)
+    length = np.argmax(is_space[first:])
+    corner = block[first : first + length].tobytes().decode()
+
+    if "//" in corner:
+        return [0, 2]
+    return [0, 1, 2][: corner.count("/") + 1]
+
+def fan_triangles(corners_in_face: np.ndarray) -> np.ndarray:
+    """
+        obj file uses triangle fan format for each face individually.
+        Given the corner count of every face, return the corner order
+        which unpacks every face into triangles.
+    """
+
+    triangles_in_face = corners_in_face - 2
+    first_corner = np.cumsum(corners_in_face) - corners_in_face
+
+    first_triangle = np.cumsum(triangles_in_face) - triangles_in_face
+    owner = np.repeat(np.arange(len(corners_in_face)), triangles_in_face)
+    i = np.arange(triangles_in_face.sum()) - first_triangle[owner]
+
+    fan_center = first_corner[owner]
+    return np.stack(
+        (fan_center, fan_center + i + 1, fan_center + i + 2), axis=1
+    ).ravel()
+
+def build_vertices(
+    v: np.ndarray, vt: np.ndarray, vn: np.ndarray,
+    v_vt_vn: np.ndarray) -> np.ndarray:
+    """
+        Gather the interleaved (corners, 8) vertex array,
+        corners without a texcoord or normal are left as zero.
+    """
+
+    vertices = np.zeros((len(v_vt_vn), 8), dtype=np.float32)
+    vertices[:, 0:3] = v[v_vt_vn[:, 0]]
+
+    for (column, data, first) in ((1, vt, 3), (2, vn, 5)):
+        last = first + data.shape[1]
+        has_data = v_vt_vn[:, column] >= 0
+        if has_data.all():
+            vertices[:, first:last] = data[v_vt_vn[:, column]]
+        elif has_data.any():
+            vertices[has_data, first:last] = data[v_vt_vn[has_data, column]]
+
     return vertices
 
-def read_vertex_data(words: list[str]) -> list[float]:
-    """ 
-        read the given position description and
-        return the vertex it represents.
+def read_obj_materials(filename: str) -> tuple:
+    """
+        Read which material each triangle corner of the given obj file
+        uses, the corners are in the same order as load_model_from_file.
+
+        Parameters:
+
+            filename: filepath to the obj file, its mtllib files
+                are looked for in the same folder
+
+        Returns:
+
+            (materials, names, corner_materials): the materials of the
+            file's mtllib files as returned by read_mtl, the name given
+            by each usemtl line and the index into names of every corner's
+            material. Corners before any usemtl line have the name None.
+    """
+
+    text = ObjText(np.fromfile(filename, dtype=np.uint8))
+
+    materials = {}
+    folder = os.path.dirname(filename)
+    for libraries in text.read_words(text.find_lines("mtllib")):
+        for library in libraries.split():
+            #a missing library leaves its faces with the default material
+            if os.path.exists(os.path.join(folder, library)):
+                materials.update(read_mtl(os.path.join(folder, library)))
+
+    usemtl_lines = text.find_lines("usemtl")
+    names = text.read_words(usemtl_lines) + [None]
+
+    #the usemtl line in effect on every line, -1 before the first
+    line_materials = np.cumsum(usemtl_lines) - 1
+    line_materials[line_materials < 0] = len(names) - 1
+
+    face_lines = text.find_lines("f")
+    triangles_in_face = text.tokens_in_line[face_lines] - 3
+    corner_materials = np.repeat(line_materials[face_lines], 3 * triangles_in_face)
+
+    return (materials, names, corner_materials)
+
+def read_mtl(filepath: str) -> dict[str, tuple]:
+    """
+        Read the diffuse color and diffuse map of every material
+        in the given mtl file.
+
+        Returns:
+
+            A dictionary mapping each material's name to its
+            (diffuse color, diffuse map) pair. Diffuse maps are filepaths
+            relative to the working directory, or None if there isn't one.
+    """
+
+    materials = {}
+    folder = os.path.dirname(filepath)
+    name = None
+    with open(filepath, "r") as f:
+        for line in f:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == "newmtl":
+                name = " ".join(words[1:])
+                materials[name] = (DEFAULT_DIFFUSE_COLOR, None)
+            elif words[0] == "Kd" and name is not None:
+                color = tuple(float(value) for value in words[1:4])
+                materials[name] = (color, materials[name][1])
+            elif words[0] == "map_Kd" and name is not None:
+                #any options come before the filename
+                diffuse_map = os.path.normpath(os.path.join(folder, words[-1]))
+                materials[name] = (materials[name][0], diffuse_map)
+    return materials
+
+def index_vertices(
+    vertices: np.ndarray, stride: int) -> tuple[np.ndarray]:
     """
+        Merge the repeated vertices of an expanded vertex buffer.
+
+        Parameters:
 
+            vertices: flat float32 array, one vertex per stride floats
+
+            stride: the number of floats in each vertex
+
+        Returns:
+
+            (vertices, indices): the unique vertices, in the order they
+            first appear, and the index of each original corner into
+            them. The indices are uint16 when they fit, uint32 otherwise.
+    """
+
+    vertices = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, stride)
+
+    # view each vertex as a single opaque value so np.unique can key on it
+    keys = vertices.view(np.dtype((np.void, 4 * stride))).ravel()
+    _, first_corner, unique_id = np.unique(
+        keys, return_index=True, return_inverse=True)
+
+    # np.unique sorts its output, restore the first appearance order
+    order = np.argsort(first_corner)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    index_type = np.uint16 if len(order) <= 65536 else np.uint32
+    indices = rank[unique_id.ravel()].astype(index_type)
+    return (vertices[first_corner[order]].ravel(), indices)
+
+def get_vertex_dtype(vertex_format: tuple[str]) -> np.dtype:
+    """
+        Return the interleaved layout of the given vertex format, each
+        field's offset is the one to hand to glVertexAttribPointer.
+    """
+
+    return np.dtype([
+        (name, *FIELD_TYPES[(name, attribute_format)])
+        for (name, attribute_format)
+        in zip(("position", "texcoord", "normal"), vertex_format)
+    ])
+
+def pack_vertices(
+    vertices: np.ndarray, vertex_format: tuple[str]) -> tuple[np.ndarray]:
+    """
+        Convert x,y,z,s,t,nx,ny,nz vertex data to the given format.
+
+        Parameters:
+
+            vertices: flat float32 array, 8 floats per vertex
+
+            vertex_format: (position, texcoord, normal) storage formats
+
+        Returns:
+
+            (packed, position_offset, position_scale): the packed vertex
+            array, and the values the vertex shader must use to decode
+            its positions, position = offset + scale * stored position.
+    """
+
+    vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 8)
+    position_format, texcoord_format, normal_format = vertex_format
+    packed = np.zeros(len(vertices), dtype=get_vertex_dtype(vertex_format))
+
+    position_offset = np.zeros(3, dtype=np.float32)
+    position_scale = np.ones(3, dtype=np.float32)
+    if position_format == POSITION_UNORM16:
+        packed["position"][:, 0:3], position_offset, position_scale \
+            = quantize_positions(vertices[:, 0:3])
+    else:
+        packed["position"] = vertices[:, 0:3]
+
+    if texcoord_format == TEXCOORD_UNORM16:
+        packed["texcoord"] = to_unorm16(vertices[:, 3:5])
+    else:
+        packed["texcoord"] = vertices[:, 3:5]
+
+    if normal_format == NORMAL_PACKED:
+        packed["normal"] = pack_normals(vertices[:, 5:8])
+    else:
+        packed["normal"] = vertices[:, 5:8]
+
+    return (packed, position_offset, position_scale)
+
+def quantize_positions(positions: np.ndarray) -> tuple[np.ndarray]:
+    """
+        Store positions as 16 bit fractions of the mesh's bounding box.
+
+        Returns:
+
+            (quantized, offset, scale) where offset is the box's minimum
+            corner and scale its size.
+    """
+
+    offset = positions.min(axis=0) if len(positions) else np.zeros(3, np.float32)
+    scale = (positions.max(axis=0) - offset) if len(positions) else np.ones(3, np.float32)
+    #flat boxes would divide by zero, any scale decodes them correctly
+    scale = np.where(scale > 0, scale, 1).astype(np.float32)
+    return (to_unorm16((positions - offset) / scale), offset, scale)
+
+def to_unorm16(values: np.ndarray) -> np.ndarray:
+    """ Store values in [0,1] as normalized unsigned shorts. """
+
+    return np.round(np.clip(values, 0, 1) * 65535).astype(np.uint16)
+
+def pack_normals(normals: np.ndarray) -> np.ndarray:
+    """
+        Pack unit vectors into GL_INT_2_10_10_10_REV, ten signed bits
+        for each of x, y and z with the two w bits left empty.
+    """
+
+    components = np.round(np.clip(normals, -1, 1) * 511).astype(np.int32)
+    bits = components.astype(np.uint32) & 0x3FF
+    return bits[:, 0] | (bits[:, 1] << 10) | (bits[:, 2] << 20)
+
+def load_cached_mesh(filename: str, layout: tuple[int], loader) -> np.ndarray:
+    """
+        Return the flat float32 vertex buffer for the given obj file,
+        reading it from the cache where possible.
+
+        The first load parses the file with the given loader and writes
+        the result next to it. Later loads memory map the cache file, so
+        the array can be handed straight to glBufferData. The cache is
+        rebuilt whenever the size or modification time of the obj file
+        no longer matches the one it was built from.
+
+        Parameters:
+
+            filename: filepath to the obj file
+
+            layout: the number of floats in each vertex attribute,
+                eg. (3, 2, 3) for position, texcoord, normal
+
+            loader: function taking the filename and returning the
+                flat vertex buffer, only called on a cache miss
+
+        Returns:
+
+            A read only float32 array of the vertex data.
+    """
+
+    vertices = read_mesh_cache(filename, layout)
+    if vertices is None:
+        vertices = np.ascontiguousarray(loader(filename), dtype=np.float32)
+        write_mesh_cache(filename, layout, vertices)
+    return vertices
+
+def get_mesh_cache_path(filename: str, layout: tuple[int]) -> str:
+    """
+        Each layout gets its own cache file, so different loaders
+        can share an obj file without rebuilding each other's caches.
+    """
+
+    layout_name = "_".join(str(size) for size in layout)
+    return f"{filename}.{layout_name}{MESH_CACHE_EXTENSION}"
+
+def make_mesh_cache_header(
+    filename: str, layout: tuple[int], vertex_count: int) -> np.ndarray:
+    """ Describe the given obj file and layout as a cache header. """
+
+    source = os.stat(filename)
+    header = np.zeros(1, dtype=MESH_CACHE_HEADER)
+    header["magic"] = MESH_CACHE_MAGIC
+    header["version"] = MESH_CACHE_VERSION
+    header["source_size"] = source.st_size
+    header["source_mtime"] = source.st_mtime_ns
+    header["vertex_count"] = vertex_count
+    header["attribute_count"] = len(layout)
+    header["layout"][0, :len(layout)] = layout
+    return header
+
+def read_mesh_cache(filename: str, layout: tuple[int]) -> np.ndarray | None:
+    """
+        Memory map the cached vertex data for the given obj file,
+        returns None if there's no cache or it's out of date.
+    """
+
+    cache_path = get_mesh_cache_path(filename, layout)
+    if not os.path.exists(cache_path) \
+        or os.path.getsize(cache_path) < MESH_CACHE_HEADER.itemsize:
+        return None
+
+    header = np.fromfile(cache_path, dtype=MESH_CACHE_HEADER, count=1)
+    expected = make_mesh_cache_header(filename, layout, header["vertex_count"][0])
+    if header.tobytes() != expected.tobytes():
+        return None
+
+    float_count = int(header["vertex_count"][0]) * sum(layout)
+    if os.path.getsize(cache_path) != MESH_CACHE_HEADER.itemsize + 4 * float_count:
+        return None
+    if float_count == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    return np.memmap(
+        cache_path, dtype=np.float32, mode="r",
+        offset=MESH_CACHE_HEADER.itemsize, shape=(float_count,))
+
+def write_mesh_cache(
+    filename: str, layout: tuple[int], vertices: np.ndarray) -> None:
+    """
+        Write the given vertex data to the obj file's cache, going
+        through a temporary file so a half written cache is never read.
+        If the cache can't be written, it's skipped with a warning.
+    """
+
+    cache_path = get_mesh_cache_path(filename, layout)
+    header = make_mesh_cache_header(filename, layout, len(vertices) // sum(layout))
+
+    temp_path = None
+    try:
+        #a uniquely named temporary file, so loaders writing the
+        #same cache at once don't clobber each other's
+        with tempfile.NamedTemporaryFile(
+            dir = os.path.dirname(cache_path) or ".", 
+            prefix = os.path.basename(cache_path), suffix = ".tmp",
+            delete = False) as f:
+            temp_path = f.name
+            f.write(header.tobytes())
+            f.write(vertices.tobytes())
+        os.replace(temp_path, cache_path)
+    except OSError as error:
+        #the data in hand is still good, it just won't be cached
+        warnings.warn(f"Couldn't write cache {cache_path}: {error}")
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def prewarm_mesh_cache(folderpath: str, layout: tuple[int], loader) -> int:
+    """
+        Make sure every obj file in the given folder has an up to date
+        cache, returns how many had to be rebuilt.
+    """
+
+    rebuilt = 0
+    for filename in sorted(glob.glob(f"{folderpath}/*.obj")):
+        if read_mesh_cache(filename, layout) is None:
+            load_cached_mesh(filename, layout, loader)
+            rebuilt += 1
+    return rebuilt
+
+def load_cached_texture(filepath: str) -> list[np.ndarray]:
+    """
+        Return every mip level of the given image, largest first,
+        cooking it the first time it's loaded.
+
+        A cooked texture holds the pixels of each level exactly as
+        they're uploaded, so later loads memory map them rather than
+        decoding the image and generating mipmaps. The texture is cooked
+        again whenever its image file changes.
+
+        Returns:
+
+            A read only (height, width, channels) array for each level.
+    """
+
+    faces = read_texture_cache([filepath], filepath)
+    if faces is None:
+        faces = [make_mipmaps(read_image(filepath))]
+        write_texture_cache([filepath], filepath, faces)
+    return faces[0]
+
+def load_cached_cubemap(filepath: str) -> list[tuple]:
+    """
+        Return the faces of the given cubemap, cooking them the first
+        time it's loaded. Cooked faces are already turned to face the
+        right way, so they can go straight to upload_face.
+
+        Returns:
+
+            A (target, pixels) pair for every face.
+    """
+
+    sources = [f"{filepath}_{suffix}.png" for (suffix, _, _) in CUBEMAP_FACES]
+    faces = read_texture_cache(sources, filepath)
+    if faces is None:
+        start = time.perf_counter()
+        faces = [[pixels] for (_, pixels) in read_cubemap_faces(filepath)]
+        if REPORT_ASSET_LOADING:
+            print(f"Decoded {filepath} cubemap in {time.perf_counter() - start:.2f}s")
+        write_texture_cache(sources, filepath, faces)
     return [
-        float(words[1]),
-        float(words[2]),
-        float(words[3])
+        (target, levels[0])
+        for ((_, target, _), levels) in zip(CUBEMAP_FACES, faces)
     ]
 
-def read_texcoord_data(words: list[str]) -> list[float]:
-    """ 
-        read the given texcoord description and
-        return the texcoord it represents.
+def make_mipmaps(pixels: np.ndarray) -> list[np.ndarray]:
+    """
+        Return the given image followed by each of its mip levels, down
+        to a single pixel. Each level halves the last one, rounding down,
+        as glGenerateMipmap would.
     """
 
+    height, width, channels = pixels.shape
+    image = Image.fromarray(
+        pixels[:, :, 0] if channels == 1 else pixels, CHANNEL_MODES[channels])
+
+    levels = [pixels]
+    while width > 1 or height > 1:
+        width, height = max(1, width // 2), max(1, height // 2)
+        image = image.resize((width, height), Image.Resampling.BOX)
+        levels.append(get_pixels(image))
+    return levels
+
+def get_texture_cache_path(filepath: str) -> str:
+
+    return f"{filepath}{TEXTURE_CACHE_EXTENSION}"
+
+def get_mipmap_sizes(width: int, height: int, levels: int) -> list[tuple[int]]:
+    """ Return the (width, height) of each mip level. """
+
     return [
-        float(words[1]),
-        float(words[2])
+        (max(1, width >> level), max(1, height >> level)) 
+        for level in range(levels)
     ]
 
-def read_normal_data(words: list[str]) -> list[float]:
-    """ 
-        read the given normal description and
-        return the normal it represents.
+def make_texture_cache_header(
+    sources: list[str], width: int, height: int, 
+    channels: int, levels: int, faces: int) -> np.ndarray:
+    """
+        Describe the given texture as a cache header. A texture made
+        from several images is stamped with their total size and the
+        time the newest of them was modified.
     """
 
-    return [
-        float(words[1]),
-        float(words[2]),
-        float(words[3])
+    stats = [os.stat(source) for source in sources]
+    header = np.zeros(1, dtype=TEXTURE_CACHE_HEADER)
+    header["magic"] = TEXTURE_CACHE_MAGIC
+    header["version"] = TEXTURE_CACHE_VERSION
+    header["source_size"] = sum(stat.st_size for stat in stats)
+    header["source_mtime"] = max(stat.st_mtime_ns for stat in stats)
+    header["width"] = width
+    header["height"] = height
+    header["channels"] = channels
+    header["levels"] = levels
+    header["faces"] = faces
+    return header
+
+def read_texture_cache(
+    sources: list[str], filepath: str) -> list[list[np.ndarray]] | None:
+    """
+        Memory map the cooked texture made from the given images,
+        returns None if there's no cache or it's out of date.
+
+        Returns:
+
+            The mip levels of each face, as read only views of the file.
+    """
+
+    cache_path = get_texture_cache_path(filepath)
+    if not os.path.exists(cache_path) \
+        or os.path.getsize(cache_path) < TEXTURE_CACHE_HEADER.itemsize:
+        return None
+
+    header = np.fromfile(cache_path, dtype=TEXTURE_CACHE_HEADER, count=1)[0]
+    width, height, channels, levels, faces = (
+        int(header[field]) 
+        for field in ("width", "height", "channels", "levels", "faces"))
+    expected = make_texture_cache_header(
+        sources, width, height, channels, levels, faces)
+    if header.tobytes() != expected.tobytes():
+        return None
+
+    sizes = get_mipmap_sizes(width, height, levels)
+    face_bytes = sum(w * h * channels for (w, h) in sizes)
+    if os.path.getsize(cache_path) \
+        != TEXTURE_CACHE_HEADER.itemsize + faces * face_bytes:
+        return None
+
+    data = np.memmap(
+        cache_path, dtype=np.uint8, mode="r",
+        offset=TEXTURE_CACHE_HEADER.itemsize, shape=(faces * face_bytes,))
+
+    cooked = []
+    offset = 0
+    for _ in range(faces):
+        face = []
+        for (w, h) in sizes:
+            face.append(data[offset : offset + w * h * channels].reshape(h, w, channels))
+            offset += w * h * channels
+        cooked.append(face)
+    return cooked
+
+def write_texture_cache(
+    sources: list[str], filepath: str, faces: list[list[np.ndarray]]) -> None:
+    """
+        Write the mip levels of each face to the texture's cache, going
+        through a temporary file so a half written cache is never read.
+        If the cache can't be written, it's skipped with a warning.
+    """
+
+    cache_path = get_texture_cache_path(filepath)
+    height, width, channels = faces[0][0].shape
+    header = make_texture_cache_header(
+        sources, width, height, channels, len(faces[0]), len(faces))
+
+    temp_path = None
+    try:
+        #a uniquely named temporary file, so loaders writing the
+        #same cache at once don't clobber each other's
+        with tempfile.NamedTemporaryFile(
+            dir = os.path.dirname(cache_path) or ".", 
+            prefix = os.path.basename(cache_path), suffix = ".tmp",
+            delete = False) as f:
+            temp_path = f.name
+            f.write(header.tobytes())
+            for levels in faces:
+                for pixels in levels:
+                    f.write(np.ascontiguousarray(pixels).tobytes())
+        os.replace(temp_path, cache_path)
+    except OSError as error:
+        #the data in hand is still good, it just won't be cached
+        warnings.warn(f"Couldn't write cache {cache_path}: {error}")
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def prewarm_texture_cache(folderpath: str) -> int:
+    """
+        Cook every image in the given folder ahead of time, along with
+        every cubemap (a set of files ending in _left.png, _right.png
+        and so on). Returns how many textures had to be rebuilt.
+    """
+
+    cubemaps = set()
+    images = []
+    for filepath in sorted(glob.glob(f"{folderpath}/*")):
+        for (suffix, _, _) in CUBEMAP_FACES:
+            if filepath.endswith(f"_{suffix}.png"):
+                cubemaps.add(filepath[: -len(f"_{suffix}.png")])
+                break
+        else:
+            if not filepath.endswith((TEXTURE_CACHE_EXTENSION, ".tmp")):
+                images.append(filepath)
+
+    rebuilt = 0
+    for filepath in images:
+        if read_texture_cache([filepath], filepath) is None:
+            load_cached_texture(filepath)
+            rebuilt += 1
+    for filepath in sorted(cubemaps):
+        sources = [f"{filepath}_{suffix}.png" for (suffix, _, _) in CUBEMAP_FACES]
+        if read_texture_cache(sources, filepath) is None:
+            load_cached_cubemap(filepath)
+            rebuilt += 1
+    return rebuilt
+
+def read_atlas_models(filenames: list[str]) -> tuple:
+    """
+        Read the given obj files along with the diffuse maps of their
+        materials, pack the maps into one texture atlas and point each
+        corner's texcoords at its own material's tile. Touches no GL
+        state, so can run on a worker thread.
+
+        Materials without a diffuse map get a single texel tile of
+        their diffuse color, and materials sharing a map share a tile.
+
+        Returns:
+
+            (atlas, vertices): the atlas as a (height, width, channels)
+            image and the remapped vertex data of each file, in the
+            layout of load_model_from_file.
+    """
+
+    tiles = {}
+    images = []
+    models = []
+    for filename in filenames:
+        vertices = np.array(
+            load_cached_mesh(filename, (3, 2, 3), load_model_from_file),
+            dtype=np.float32).reshape(-1, 8)
+        materials, names, corner_materials = read_obj_materials(filename)
+
+        tile_of_name = []
+        for name in names:
+            diffuse_color, diffuse_map = materials.get(
+                name, (DEFAULT_DIFFUSE_COLOR, None))
+            tile_key = diffuse_map or diffuse_color
+            if tile_key not in tiles:
+                tiles[tile_key] = len(images)
+                images.append(
+                    load_cached_texture(diffuse_map)[0] if diffuse_map 
+                    else make_color_image(diffuse_color))
+            tile_of_name.append(tiles[tile_key])
+
+        models.append((vertices, np.array(tile_of_name)[corner_materials]))
+
+    atlas, rects = pack_atlas(images)
+    return (
+        atlas, 
+        [remap_texcoords(vertices, rects[corner_tiles]) 
+            for (vertices, corner_tiles) in models]
+    )
+
+def make_color_image(color: tuple[float]) -> np.ndarray:
+    """ Return a single pixel image of the given rgb color. """
+
+    rgb = np.round(255 * np.clip(color, 0, 1)).astype(np.uint8)
+    return rgb.reshape(1, 1, 3)
+
+def expand_channels(pixels: np.ndarray, channels: int) -> np.ndarray:
+    """
+        Widen a grey or RGB image to the given number of channels,
+        grey is copied to each color and alpha is opaque.
+    """
+
+    if pixels.shape[2] == channels:
+        return pixels
+    if pixels.shape[2] == 1:
+        pixels = np.repeat(pixels, 3, axis=2)
+    if channels == 4:
+        alpha = np.full(pixels.shape[:2] + (1,), 255, dtype=np.uint8)
+        pixels = np.concatenate((pixels, alpha), axis=2)
+    return pixels
+
+def pack_atlas(images: list[tuple]) -> tuple:
+    """
+        Pack the given images into one, on shelves, tallest first.
+        Its mip levels only keep the tiles apart up to ATLAS_MAX_LEVEL.
+
+        Parameters:
+
+            images: (height, width, channels) pixels of each image
+
+        Returns:
+
+            (atlas, rects): the atlas image, with as many channels as
+            the image which has most, and an (n,4) array holding the
+            texcoord rectangle (s0, t0, s1, t1) each image was placed in.
+    """
+
+    padding = ATLAS_PADDING
+    channels = max(image.shape[2] for image in images)
+    #whole blocks, so every tile starts on a block boundary
+    sizes = [
+        (
+            -(-(image.shape[1] + 2 * padding) // padding) * padding,
+            -(-(image.shape[0] + 2 * padding) // padding) * padding
+        )
+        for image in images
     ]
+    area = sum(w * h for (w, h) in sizes)
+    atlas_width = max(
+        max(w for (w, _) in sizes),
+        1 << (int(np.ceil(np.sqrt(area))) - 1).bit_length()
+    )
+
+    corners = [None] * len(images)
+    x, y, shelf_height = 0, 0, 0
+    for i in sorted(range(len(images)), key = lambda i: -sizes[i][1]):
+        (w, h) = sizes[i]
+        if x + w > atlas_width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        corners[i] = (x, y)
+        x += w
+        shelf_height = max(shelf_height, h)
+    atlas_height = y + shelf_height
+
+    pixels = np.zeros((atlas_height, atlas_width, channels), dtype=np.uint8)
+    rects = np.zeros((len(images), 4), dtype=np.float32)
+    for (i, image) in enumerate(images):
+        (x, y) = corners[i]
+        (h, w) = image.shape[:2]
+        (block_w, block_h) = sizes[i]
+        tile = expand_channels(image, channels)
+        pixels[y : y + block_h, x : x + block_w] = np.pad(
+            tile, 
+            ((padding, block_h - h - padding), (padding, block_w - w - padding), (0, 0)), 
+            mode="edge")
+        rects[i] = (
+            (x + padding) / atlas_width, (y + padding) / atlas_height,
+            (x + padding + w) / atlas_width, (y + padding + h) / atlas_height
+        )
+
+    return (pixels, rects)
+
+def remap_texcoords(vertices: np.ndarray, rects: np.ndarray) -> np.ndarray:
+    """
+        Move each corner's texcoords into its tile of an atlas.
+
+        A tile can't repeat, so texcoords are clamped to [0,1] first,
+        models with tiling textures need their faces split up instead.
+
+        Parameters:
+
+            vertices: (corners, 8) vertex array, changed in place
+
+            rects: (corners, 4) texcoord rectangle of each corner's tile
+
+        Returns:
 
-def read_face_data(
-    words: list[str], 
-    v: list[float], vt: list[float], vn: list[float], 
-    vertices: list[float]) -> None:
+            The vertex data as a flat array.
     """
-        Read the given face description, and use the
-        data from the pre-filled v, vt, vn arrays to add
-        data to the vertices array
+
+    texcoords = np.clip(vertices[:, 3:5], 0, 1)
+    vertices[:, 3:5] = rects[:, 0:2] + texcoords * (rects[:, 2:4] - rects[:, 0:2])
+    return vertices.ravel()
+
+def make_model_transforms(
+    positions: np.ndarray, eulers: np.ndarray, 
+    scales: np.ndarray | float = 1.0) -> np.ndarray:
+    """
+        Build the model transforms of many objects at once.
+
+        Each is the matrix pyrr gives for a scale, then rotations about
+        x, y and z, then a translation, multiplied in that order. Written
+        out in closed form, a whole batch takes a handful of array
+        operations rather than several matrices per object.
+
+        Parameters:
+
+            positions: (N,3) positions
+
+            eulers: (N,3) angles in degrees about the x, y and z axes
+
+            scales: scale along each axis, shared or (N,3)
+        
+        Returns:
+
+            (N,4,4) float32 transforms, ready to upload.
+    """
+
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+    angles = np.radians(np.asarray(eulers, dtype=np.float32).reshape(-1, 3))
+    (sx, sy, sz) = np.sin(angles).T
+    (cx, cy, cz) = np.cos(angles).T
+
+    transforms = np.empty((len(positions), 4, 4), dtype=np.float32)
+    transforms[:, 0, 0] = cy * cz
+    transforms[:, 0, 1] = -cy * sz
+    transforms[:, 0, 2] = sy
+    transforms[:, 1, 0] = sx * sy * cz + cx * sz
+    transforms[:, 1, 1] = cx * cz - sx * sy * sz
+    transforms[:, 1, 2] = -sx * cy
+    transforms[:, 2, 0] = sx * sz - cx * sy * cz
+    transforms[:, 2, 1] = cx * sy * sz + sx * cz
+    transforms[:, 2, 2] = cx * cy
+    #scaling first scales the rows of the rotation
+    transforms[:, 0:3, 0:3] *= np.broadcast_to(scales, positions.shape)[:, :, np.newaxis]
+    transforms[:, 0:3, 3] = 0
+    transforms[:, 3, 0:3] = positions
+    transforms[:, 3, 3] = 1
+    return transforms
+
+class TransformCounter:
+    """
+        Counts the matrices built, and the rebuilds skipped because
+        nothing they depend on had changed, over each frame.
     """
+
+
+    def __init__(self):
+
+        self.built = 0
+        self.skipped = 0
+
+        #the counts of the last finished frame
+        self.built_last_frame = 0
+        self.skipped_last_frame = 0
     
-    triangles_in_face = len(words) - 3
+    def end_frame(self) -> None:
 
-    for i in range(triangles_in_face):
-        read_corner(words[1], v, vt, vn, vertices)
-        read_corner(words[i + 2], v, vt, vn, vertices)
-        read_corner(words[i + 3], v, vt, vn, vertices)
+        self.built_last_frame = self.built
+        self.skipped_last_frame = self.skipped
+        self.built = 0
+        self.skipped = 0
 
-def read_corner(
-    description: str, 
-    v: list[float], vt: list[float], vn: list[float], 
-    vertices: list[float]) -> None:
+transform_counter = TransformCounter()
+
+class CachedTransforms:
     """
-        Read the given corner description, then send the
-        approprate v, vt, vn data to the vertices array.
+        Model transforms kept between frames, along with the positions
+        and eulers they were built from. Each frame only the transforms
+        whose state has changed are rebuilt, or all of them if the
+        parent transform carrying them has been rebuilt.
     """
 
-    v_vt_vn = description.split("/")
 
-    for x in v[int(v_vt_vn[0]) - 1]:
-        vertices.append(x)
-    for x in vt[int(v_vt_vn[1]) - 1]:
-        vertices.append(x)
-    for x in vn[int(v_vt_vn[2]) - 1]:
-        vertices.append(x)
+    def __init__(self):
+
+        self.states = None
+        self.transforms = None
+        #bumped on every rebuild, so that children know to follow
+        self.version = 0
+        self.parent_version = None
+    
+    def get(
+        self, positions: np.ndarray, eulers: np.ndarray, 
+        parent: "CachedTransforms" = None) -> np.ndarray:
+        """
+            Return the (N,4,4) transforms of objects with the given
+            (N,3) positions and eulers, carried by the parent's first
+            transform if one is given.
+        """
+
+        states = np.hstack((
+            np.reshape(positions, (-1, 3)), np.reshape(eulers, (-1, 3))
+        )).astype(np.float32)
+        parent_version = None if parent is None else parent.version
+
+        if self.states is None or len(states) != len(self.states) \
+            or parent_version != self.parent_version:
+            dirty = np.ones(len(states), dtype=bool)
+        else:
+            dirty = np.any(states != self.states, axis = 1)
+        
+        built = int(np.count_nonzero(dirty))
+        transform_counter.built += built
+        transform_counter.skipped += len(states) - built
+        if built == 0:
+            return self.transforms
+
+        transforms = make_model_transforms(states[dirty, 0:3], states[dirty, 3:6])
+        if parent is not None:
+            transforms = transforms @ parent.transforms[0]
+        if built == len(states):
+            self.transforms = transforms
+        else:
+            self.transforms[dirty] = transforms
+        self.states = states
+        self.parent_version = parent_version
+        self.version += 1
+        return self.transforms
 
 ################### Model #####################################################
 
@@ -174,37 +1445,33 @@ class Entity:
         self.position = np.array(position, dtype=np.float32)
         self.eulers = np.array(eulers, dtype=np.float32)
         self.objectType = objectType
+        self.transform = CachedTransforms()
     
     def get_model_transform(self) -> np.ndarray:
         """
-            Calculates and returns the entity's transform matrix,
-            based on its position and rotation.
+            Returns the entity's transform matrix, based on its position
+            and rotation. It's only recalculated when either has changed.
         """
 
-        model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
-        
-        model_transform = pyrr.matrix44.multiply(
-            m1=model_transform, 
-            m2=pyrr.matrix44.create_from_z_rotation(
-                theta = np.radians(self.eulers[2]), 
-                dtype=np.float32
-            )
-        )
-
-        model_transform = pyrr.matrix44.multiply(
-            m1=model_transform, 
-            m2=pyrr.matrix44.create_from_translation(
-                vec=self.position,
-                dtype=np.float32
-            )
-        )
-
-        return model_transform
+        return self.transform.get(self.position, self.eulers)[0]
 
     def update(self, rate: float) -> None:
 
         pass
 
+def get_model_transforms(
+    entities: list[Entity], cache: CachedTransforms = None) -> np.ndarray:
+    """
+        Return the model transforms of the given entities, as one array.
+        With a cache, only the entities which have moved are rebuilt.
+    """
+
+    positions = [entity.position for entity in entities]
+    eulers = [entity.eulers for entity in entities]
+    if cache is None:
+        return make_model_transforms(positions, eulers)
+    return cache.get(positions, eulers)
+
 class Billboard:
     """
         A billboard object, represents a region of heat haze.
@@ -219,28 +1486,27 @@ class Billboard:
     
     def get_model_transform(self, viewerPos: np.ndarray) -> np.ndarray:
 
-        directionFromPlayer = self.position - viewerPos
-        angle1 = np.arctan2(-directionFromPlayer[1],directionFromPlayer[0])
-        dist2d = np.sqrt(directionFromPlayer[0] ** 2 + directionFromPlayer[1] ** 2)
-        angle2 = np.arctan2(directionFromPlayer[2],dist2d)
+        return get_billboard_transforms([self], viewerPos)[0]
 
-        model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
-        model_transform = pyrr.matrix44.multiply(
-            model_transform,
-            pyrr.matrix44.create_from_scale(scale=self.size, dtype=np.float32)
-        )
-        model_transform = pyrr.matrix44.multiply(
-            model_transform,
-            pyrr.matrix44.create_from_y_rotation(theta=angle2, dtype=np.float32)
-        )
-        model_transform = pyrr.matrix44.multiply(
-            model_transform,
-            pyrr.matrix44.create_from_z_rotation(theta=angle1, dtype=np.float32)
-        )
-        return pyrr.matrix44.multiply(
-            model_transform,
-            pyrr.matrix44.create_from_translation(self.position,dtype=np.float32)
-        )
+def get_billboard_transforms(
+    billboards: list[Billboard], viewerPos: np.ndarray) -> np.ndarray:
+    """
+        Return the model transforms of the given billboards, as one
+        array, each turned to face the viewer.
+    """
+
+    positions = np.reshape(
+        [billboard.position for billboard in billboards], (-1, 3))
+    directionFromPlayer = positions - viewerPos
+    dist2d = np.hypot(directionFromPlayer[:, 0], directionFromPlayer[:, 1])
+
+    eulers = np.zeros_like(positions)
+    eulers[:, 1] = np.degrees(np.arctan2(directionFromPlayer[:, 2], dist2d))
+    eulers[:, 2] = np.degrees(
+        np.arctan2(-directionFromPlayer[:, 1], directionFromPlayer[:, 0]))
+    return make_model_transforms(
+        positions, eulers,
+        np.reshape([billboard.size for billboard in billboards], (-1, 3)))
 
 class Cube(Entity):
 
@@ -271,6 +1537,11 @@ class Player(Entity):
         self.up = np.array([0,0,1], dtype=np.float32)
         self.right = np.array([0,1,0], dtype=np.float32)
         self.forwards = np.array([1,0,0], dtype=np.float32)
+
+        #the state the vectors and view transform were last calculated from
+        self.vector_eulers = None
+        self.view_state = None
+        self.view_transform = None
     
     def calculate_vectors(self) -> None:
         """ 
@@ -294,19 +1565,29 @@ class Player(Entity):
         self.up = pyrr.vector.normalise(np.cross(self.right, self.forwards))
 
     def update(self) -> None:
-        """ Updates the camera """
+        """ Updates the camera, if it's turned since the last update """
 
-        self.calculate_vectors()
+        if not np.array_equal(self.eulers, self.vector_eulers):
+            self.calculate_vectors()
+            self.vector_eulers = np.copy(self.eulers)
     
     def get_view_transform(self) -> np.ndarray:
         """ Return's the camera's view transform. """
 
-        return pyrr.matrix44.create_look_at(
+        state = np.concatenate((self.position, self.forwards, self.up))
+        if np.array_equal(state, self.view_state):
+            transform_counter.skipped += 1
+            return self.view_transform
+
+        self.view_transform = pyrr.matrix44.create_look_at(
             eye = self.position,
             target = self.position + self.forwards,
             up = self.up,
             dtype = np.float32
         )
+        self.view_state = state
+        transform_counter.built += 1
+        return self.view_transform
 
 class Scene:
     """ 
@@ -325,6 +1606,7 @@ class Scene:
                 eulers = [0,0,0]
             ),
         ]
+        self.add_stress_cubes(STRESS_CUBE_COUNT)
         self.hazeRegions: list[Billboard] = [Billboard(position = [6,0,2], size = [2,2,2])]
 
         self.camera = Player(
@@ -347,6 +1629,26 @@ class Scene:
         
         self.camera.update()
 
+    def add_stress_cubes(self, count: int) -> None:
+        """
+            Add the given number of cubes on a square grid in front of
+            the camera, each turned a random amount.
+        """
+
+        side = int(np.ceil(np.sqrt(count)))
+        for i in range(count):
+            row, column = divmod(i, side)
+            self.renderables[OBJECT_CUBE].append(
+                Cube(
+                    position = [
+                        10 + STRESS_CUBE_SPACING * row,
+                        STRESS_CUBE_SPACING * (column - side / 2),
+                        0
+                    ],
+                    eulers = [0, 0, np.random.uniform(0, 360)]
+                )
+            )
+
     def move_camera(self, dPos: np.ndarray) -> None:
         """ Moves the camera by the given amount """
 
@@ -425,6 +1727,7 @@ class App:
             GLFW_CONSTANTS.GLFW_CURSOR, 
             GLFW_CONSTANTS.GLFW_CURSOR_HIDDEN
         )
+        glfw.set_key_callback(self.window, self.handleKeyPress)
         glfw.set_cursor_pos(
             self.window,
             self.screenWidth // 2, 
@@ -482,6 +1785,7 @@ class App:
 
             #timing
             self.calcuateFramerate()
+            transform_counter.end_frame()
 
         self.quit()
 
@@ -525,6 +1829,16 @@ class App:
 
             self.scene.move_camera(dPos)
 
+    def handleKeyPress(self, window, key, scancode, action, mods) -> None:
+        """
+            Handle keys which should act once per press.
+        """
+
+        if key == GLFW_CONSTANTS.GLFW_KEY_I and action == GLFW_CONSTANTS.GLFW_PRESS:
+            instanced = not self.renderer.is_instanced(OBJECT_CUBE)
+            self.renderer.set_instanced(OBJECT_CUBE, instanced)
+            print(f"Cubes drawn {'instanced' if instanced else 'one at a time'}")
+
     def handleMouse(self) -> None:
         """
             Handle mouse movement.
@@ -547,7 +1861,11 @@ class App:
         delta = self.currentTime - self.lastTime
         if (delta >= 1):
             framerate = int(self.numFrames/delta)
-            glfw.set_window_title(self.window, f"Running at {framerate} fps.")
+            glfw.set_window_title(
+                self.window, 
+                f"Running at {framerate} fps, "
+                f"{self.renderer.queue.state_changes_saved} binds saved, "
+                f"{transform_counter.skipped_last_frame} transform builds skipped per frame.")
             self.lastTime = self.currentTime
             self.numFrames = -1
             self.frameTime = float(1000.0 / max(60,framerate))
@@ -556,10 +1874,146 @@ class App:
     def quit(self):
         
         self.renderer.destroy()
+        gpu_resources.report_leaks()
         glfw.terminate()
 
 ################### View  #####################################################
 
+class TrackedResource:
+
+
+    def __init__(self, kind: str, name: int, owner, site: str):
+
+        self.kind = kind
+        self.name = name
+        #resources are summed up by the class of their owner
+        self.category = type(owner).__name__
+        self.owner = f"{self.category} at {id(owner):#x}"
+        self.site = site
+        self.nbytes = 0
+
+class GPUResourceTracker:
+    """
+        Records every GL object made through track, along with the
+        bytes of GPU memory it holds, the object which owns it and the
+        line which made it, until it's deleted through untrack.
+
+        Anything still recorded once the program has freed everything
+        was leaked, report_leaks lists it. A summary is printed the
+        first time the objects together go over the budget.
+    """
+
+
+    def __init__(self, budget: int = GPU_MEMORY_BUDGET):
+
+        self.budget = budget
+        self.resources: dict[tuple, TrackedResource] = {}
+        self.total_bytes = 0
+        self.over_budget = False
+    
+    def track(self, kind: str, name: int, owner, nbytes: int = 0) -> int:
+        """
+            Record a GL object which has just been made and return its
+            name, so the call making it can be wrapped in place, eg.
+
+                self.vbo = gpu_resources.track("buffer", glGenBuffers(1), self)
+
+            Parameters:
+
+                kind: eg. "buffer", "texture" or "framebuffer",
+                    GL names are only unique within a kind
+
+                name: the name glGen* returned
+
+                owner: the object responsible for deleting it
+
+                nbytes: the GPU memory it holds, if already known
+        """
+
+        #the first caller outside the owner's base classes, eg. the
+        #subclass __init__ rather than the base __init__ it called
+        base_code = {
+            getattr(member, "__code__", None)
+            for base in type(owner).__mro__[1:]
+            for member in vars(base).values()
+        }
+        code, lineno = next(
+            (frame.f_code, lineno)
+            for (frame, lineno) in traceback.walk_stack(sys._getframe(1))
+            if frame.f_code not in base_code)
+        previous = self.resources.pop((kind, name), None)
+        if previous is not None:
+            #deleted without untrack, and its name has been reused
+            self.total_bytes -= previous.nbytes
+        self.resources[(kind, name)] = TrackedResource(
+            kind, name, owner,
+            f"{os.path.basename(code.co_filename)}:{lineno} in {code.co_name}")
+        self.resize(kind, name, nbytes)
+        return name
+    
+    def resize(self, kind: str, name: int, nbytes: int) -> None:
+        """ Record how much GPU memory an object holds, once it's allocated. """
+
+        resource = self.resources[(kind, name)]
+        self.total_bytes += nbytes - resource.nbytes
+        resource.nbytes = nbytes
+
+        if self.total_bytes > self.budget and not self.over_budget:
+            print(
+                f"GPU memory over budget, {self.total_bytes / 2**20:.1f} MB "
+                f"of {self.budget / 2**20:.1f} MB")
+            self.print_summary()
+        self.over_budget = self.total_bytes > self.budget
+    
+    def untrack(self, kind: str, name: int) -> None:
+        """ Forget a GL object which has just been deleted. """
+
+        resource = self.resources.pop((kind, name), None)
+        if resource is not None:
+            self.total_bytes -= resource.nbytes
+    
+    def get_summary(self) -> dict[str, tuple[int]]:
+        """ Return the (object count, bytes of GPU memory) of each category. """
+
+        summary = {}
+        for resource in self.resources.values():
+            count, size = summary.get(resource.category, (0, 0))
+            summary[resource.category] = (count + 1, size + resource.nbytes)
+        return summary
+    
+    def get_top_consumers(self, count: int = 5) -> list[TrackedResource]:
+        """ Return the objects holding the most GPU memory, largest first. """
+
+        return sorted(
+            self.resources.values(), 
+            key = lambda resource: resource.nbytes, reverse = True)[:count]
+    
+    def print_summary(self) -> None:
+
+        print(f"GPU memory: {self.total_bytes / 1024:.1f} KB in {len(self.resources)} objects")
+        for (category, (count, size)) in sorted(self.get_summary().items()):
+            print(f"{category}: {count} objects, {size / 1024:.1f} KB")
+        for resource in self.get_top_consumers():
+            print(
+                f"    {resource.nbytes / 1024:.1f} KB {resource.kind} {resource.name}, "
+                f"{resource.owner}, made at {resource.site}")
+    
+    def report_leaks(self) -> list[TrackedResource]:
+        """
+            Print and return every object which hasn't been deleted,
+            call once everything should have been freed.
+        """
+
+        leaks = list(self.resources.values())
+        for resource in leaks:
+            print(
+                f"Leaked {resource.kind} {resource.name} ({resource.nbytes / 1024:.1f} KB), "
+                f"{resource.owner}, made at {resource.site}")
+        return leaks
+
+#every GL object the program makes
+gpu_resources = GPUResourceTracker()
+
 class Renderer:
 
 
@@ -576,9 +2030,17 @@ class Renderer:
         
         self.make_assets()
 
+        #object types drawn instanced, and their transform buffers
+        self.instanced_types = set(INSTANCED_OBJECT_TYPES)
+        self.instances: dict[int, InstanceBuffer] = {}
+        #model transforms of each object type, kept between frames
+        self.transforms: dict[int, CachedTransforms] = {}
+
         self.set_onetime_uniforms()
 
         self.get_uniform_locations()
+
+        self.set_up_passes()
     
     def set_up_opengl(self, window) -> None:
         """
@@ -602,20 +2064,25 @@ class Renderer:
             the renderer will use.
         """
 
+        self.assets = AssetManager()
+
         self.meshes: dict[int, Mesh] = {
-            OBJECT_CUBE: ObjMesh("models/cube.obj"),
             OBJECT_SKY: Quad2D(
                 center = (0,0),
                 size = (1,1)
-            ),
-            OBJECT_HAZE: ObjMesh("models/quad.obj")
+            )
         }
 
-        self.materials: dict[int, Material] = {
-            OBJECT_CUBE: Material2D("gfx/wood.jpeg"),
-            OBJECT_HAZE: Material2D("gfx/explosion.jpg"),
-            OBJECT_SKY: MaterialCubemap("gfx/sky")
-        }
+        #the cube and haze both take their textures from their mtl files
+        self.materials: dict[int, Material] = {}
+        self.assets.load_atlas_models(
+            self.meshes, self.materials, {
+                OBJECT_CUBE: (
+                    IndexedObjMesh, "models/cube.obj", VERTEX_FORMAT_QUANTIZED),
+                OBJECT_HAZE: (ObjMesh, "models/quad.obj", VERTEX_FORMAT_FLOAT),
+            }
+        )
+        self.assets.load_cubemap(self.materials, OBJECT_SKY, "gfx/sky")
         self.framebuffers: dict[int,Framebuffer] = {}
         self.framebuffers[LAYER_STANDARD] = Framebuffer(self.w, self.h)
         self.framebuffers[LAYER_EFFECTS] = Framebuffer(self.w, self.h)
@@ -637,177 +2104,727 @@ class Renderer:
             )
         }
 
-    def set_onetime_uniforms(self) -> None:
-        """ Set any uniforms which can simply get set once and forgotten """
-        
-        glUseProgram(self.shaders[PIPELINE_3D])
-        projection_transform = pyrr.matrix44.create_perspective_projection(
-            fovy = 45, aspect = self.screenWidth / self.screenHeight, 
-            near = 0.1, far = 50, dtype = np.float32
-        )
-        glUniformMatrix4fv(
-            glGetUniformLocation(self.shaders[PIPELINE_3D], "projection"), 
-            1, GL_FALSE, projection_transform
-        )
-        glUniform1i(
-            glGetUniformLocation(self.shaders[PIPELINE_3D], "imageTexture"), 1)
-        glUniform1i(
-            glGetUniformLocation(self.shaders[PIPELINE_3D], "skyTexture"), 0)
-        
-        glUseProgram(self.shaders[PIPELINE_SKY])
-        glUniform1i(
-            glGetUniformLocation(self.shaders[PIPELINE_SKY], "imageTexture"), 0)
-        
-        glUseProgram(self.shaders[PIPELINE_POST])
-        glUniform1i(
-            glGetUniformLocation(self.shaders[PIPELINE_POST], "colorbuffer"), 0)
-        glUniform1i(
-            glGetUniformLocation(self.shaders[PIPELINE_POST], "fxbuffer"), 1)
+    def set_up_passes(self) -> None:
+        """
+            Make the render queue, and tell it how to set up the
+            framebuffer and depth test for each pass.
+        """
+
+        self.queue = RenderQueue()
+
+        def begin_scene():
+            #regular 3D rendering to our standard framebuffer
+            glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffers[LAYER_STANDARD].fbo)
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            #the sky is drawn behind everything
+            glDisable(GL_DEPTH_TEST)
+
+        def begin_effects():
+            #regular 3D rendering to our specialfx framebuffer
+            glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffers[LAYER_EFFECTS].fbo)
+            glClear(GL_COLOR_BUFFER_BIT)
+            glEnable(GL_DEPTH_TEST)
+
+            #blit depth buffer from standard render. No need to redraw stuff!
+            glBindFramebuffer(GL_READ_FRAMEBUFFER, self.framebuffers[LAYER_STANDARD].fbo)
+            glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.framebuffers[LAYER_EFFECTS].fbo)
+            glBlitFramebuffer(0, 0, self.w, self.h, 0, 0, self.w, self.h, GL_DEPTH_BUFFER_BIT, GL_NEAREST)
+
+        def begin_post():
+            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            glDisable(GL_DEPTH_TEST)
+
+        self.queue.set_pass(PASS_SKY, begin_scene)
+        self.queue.set_pass(PASS_OPAQUE, lambda: glEnable(GL_DEPTH_TEST))
+        self.queue.set_pass(PASS_EFFECTS, begin_effects)
+        self.queue.set_pass(PASS_POST, begin_post)
+
+    def set_onetime_uniforms(self) -> None:
+        """ Set any uniforms which can simply get set once and forgotten """
+        
+        projection_transform = pyrr.matrix44.create_perspective_projection(
+            fovy = 45, aspect = self.screenWidth / self.screenHeight, 
+            near = 0.1, far = 50, dtype = np.float32
+        )
+        #camera and time, shared by every pipeline
+        self.frameUniforms = FrameUniforms(projection_transform)
+        for shader in self.shaders.values():
+            self.frameUniforms.attach(shader)
+
+        glUseProgram(self.shaders[PIPELINE_3D])
+        glUniform1i(
+            glGetUniformLocation(self.shaders[PIPELINE_3D], "imageTexture"), 1)
+        glUniform1i(
+            glGetUniformLocation(self.shaders[PIPELINE_3D], "skyTexture"), 0)
+        
+        glUseProgram(self.shaders[PIPELINE_SKY])
+        glUniform1i(
+            glGetUniformLocation(self.shaders[PIPELINE_SKY], "imageTexture"), 0)
+        
+        glUseProgram(self.shaders[PIPELINE_POST])
+        glUniform1i(
+            glGetUniformLocation(self.shaders[PIPELINE_POST], "colorbuffer"), 0)
+        glUniform1i(
+            glGetUniformLocation(self.shaders[PIPELINE_POST], "fxbuffer"), 1)
+    
+    def get_uniform_locations(self) -> None:
+        """ 
+            Query and store the locations of any uniforms 
+            on the shader 
+        """
+
+        glUseProgram(self.shaders[PIPELINE_3D])
+        self.modelMatrixLocation = glGetUniformLocation(
+            self.shaders[PIPELINE_3D], "model")
+        self.instancedLocation = glGetUniformLocation(
+            self.shaders[PIPELINE_3D], "instanced")
+        self.positionOffsetLocation = glGetUniformLocation(
+            self.shaders[PIPELINE_3D], "positionOffset")
+        self.positionScaleLocation = glGetUniformLocation(
+            self.shaders[PIPELINE_3D], "positionScale")
+    
+    def render(
+        self, camera: Player, 
+        renderables: dict[int, list[Entity]],
+        hazeRegions: list[Billboard]) -> None:
+        """
+            Render a frame.
+
+            Parameters:
+
+                camera: the camera to render from
+
+                renderables: a dictionary of entities to draw, keys are the
+                            entity types, for each of these there is a list
+                            of entities.
+        """
+
+        #swap in any assets which have finished loading
+        self.assets.update()
+
+        self.t += 0.1
+        if self.t > 2 * np.pi:
+            self.t -= 2 * np.pi
+        self.frameUniforms.update(camera, self.t)
+
+        #draw sky
+        self.queue.submit(
+            PASS_SKY, self.shaders[PIPELINE_SKY], self.materials[OBJECT_SKY],
+            self.meshes[OBJECT_SKY], self.draw_sky)
+        
+        #Everything else
+        self.queue.set_shader_uniforms(
+            self.shaders[PIPELINE_3D], self.bind_reflections)
+        for objectType,objectList in renderables.items():
+            if objectList:
+                self.submit_entities(objectType, objectList, camera)
+
+        #Heat haze, furthest first as it's blended over what's behind
+        if hazeRegions:
+            mesh = self.meshes[OBJECT_HAZE]
+            transforms = get_billboard_transforms(hazeRegions, camera.position)
+            depths = self.get_depths(transforms, camera)
+            furthest_first = transforms[np.argsort(-depths)]
+            self.queue.submit(
+                PASS_EFFECTS, self.shaders[PIPELINE_3D], 
+                self.materials[OBJECT_HAZE], mesh,
+                lambda: self.draw_separately(mesh, furthest_first),
+                float(depths.min()))
+
+        #2D rendering from our custom framebuffers to the screen's framebuffer
+        self.queue.submit(
+            PASS_POST, self.shaders[PIPELINE_POST], None, self.screenQuad,
+            self.draw_post)
+
+        self.queue.flush()
+        glFlush()
+
+    def draw_sky(self) -> None:
+        """ Draw the sky behind everything, as seen from the camera. """
+
+        glDrawArrays(
+            GL_TRIANGLES, 
+            0, self.meshes[OBJECT_SKY].vertex_count)
+    
+    def bind_reflections(self) -> None:
+        """ Bind the sky for the 3D shader's reflections to sample. """
+
+        self.materials[OBJECT_SKY].use()
+    
+    def submit_entities(
+        self, objectType: int, objectList: list[Entity], camera: Player) -> None:
+        """
+            Queue the drawing of every entity of one type. Unless they're
+            drawn instanced they're drawn nearest first, so the depth test
+            can reject more of what's behind.
+        """
+
+        mesh = self.meshes[objectType]
+        material = self.materials[objectType]
+        if objectType not in self.transforms:
+            self.transforms[objectType] = CachedTransforms()
+        transforms = get_model_transforms(objectList, self.transforms[objectType])
+        depths = self.get_depths(transforms, camera)
+
+        if objectType in self.instanced_types:
+            draw = lambda: self.draw_instanced(objectType, mesh, transforms)
+        else:
+            nearest_first = transforms[np.argsort(depths)]
+            draw = lambda: self.draw_separately(mesh, nearest_first)
+        self.queue.submit(
+            PASS_OPAQUE, self.shaders[PIPELINE_3D], material, mesh, draw,
+            float(depths.min()))
+    
+    def get_depths(self, transforms: np.ndarray, camera: Player) -> np.ndarray:
+        """ Return the squared distance from the camera to each transform's origin. """
+
+        offsets = transforms[:, 3, 0:3] - camera.position
+        return np.sum(offsets * offsets, axis = 1)
+    
+    def set_mesh_uniforms(self, mesh) -> None:
+        """ Set the uniforms decoding the bound mesh's positions. """
+
+        glUniform3fv(self.positionOffsetLocation, 1, mesh.position_offset)
+        glUniform3fv(self.positionScaleLocation, 1, mesh.position_scale)
+    
+    def draw_separately(self, mesh, transforms: np.ndarray) -> None:
+        """
+            Draw the mesh once per transform, setting the model uniform
+            between draws. The mesh must already be bound.
+        """
+
+        self.set_mesh_uniforms(mesh)
+        for transform in transforms:
+            glUniformMatrix4fv(
+                self.modelMatrixLocation,
+                1,GL_FALSE,
+                transform
+            )
+            mesh.draw()
+
+    def draw_post(self) -> None:
+        """ Draw a screen-sized quad, reading from the framebuffers just rendered to. """
+
+        #bind the textures we just rendered to as the textures we're now going to read from
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.framebuffers[LAYER_STANDARD].colorBuffer)
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, self.framebuffers[LAYER_EFFECTS].colorBuffer)
+        glDrawArrays(GL_TRIANGLES, 0, self.screenQuad.vertex_count)
+
+    def draw_instanced(
+        self, objectType: int, mesh, transforms: np.ndarray) -> None:
+        """
+            Draw every entity of one type in a single call, their model
+            transforms read per instance from a buffer rather than set
+            as a uniform between draws. The mesh must already be bound.
+        """
+
+        self.set_mesh_uniforms(mesh)
+        if objectType not in self.instances:
+            self.instances[objectType] = InstanceBuffer()
+        instances = self.instances[objectType]
+        instances.update(transforms)
+        #the mesh may be a placeholder shared with other types, so
+        #point it at this type's transforms every time
+        instances.attach()
+
+        glUniform1i(self.instancedLocation, 1)
+        mesh.draw_instanced(len(transforms))
+        glUniform1i(self.instancedLocation, 0)
+
+    def is_instanced(self, objectType: int) -> bool:
+
+        return objectType in self.instanced_types
+
+    def set_instanced(self, objectType: int, instanced: bool) -> None:
+        """ Choose whether entities of the given type are drawn instanced. """
+
+        if instanced:
+            self.instanced_types.add(objectType)
+        else:
+            self.instanced_types.discard(objectType)
+
+    def destroy(self) -> None:
+        """ Free any allocated memory """
+
+        self.assets.destroy()
+        for mesh in self.meshes.values():
+            if not self.assets.is_placeholder(mesh):
+                mesh.destroy()
+        for material in set(self.materials.values()):
+            if not self.assets.is_placeholder(material):
+                material.destroy()
+        for instances in self.instances.values():
+            instances.destroy()
+        self.screenQuad.destroy()
+        self.frameUniforms.destroy()
+        for shader in self.shaders.values():
+            glDeleteProgram(shader)
+        for framebuffer in self.framebuffers.values():
+            framebuffer.destroy()
+
+class AssetManager:
+    """
+        Reads meshes and images on worker threads, so that the window
+        can open before any of them have loaded.
+
+        Every asset starts out as a shared placeholder, a unit cube or
+        a single pixel texture. Once its file has been read, the GL
+        object is made on the main thread and swapped in. Making an
+        object is broken into steps (eg. one per cubemap face), and only
+        as many steps are taken each frame as fit in the upload budgets.
+
+        Pixels are staged through a PixelUploader: a worker copies each
+        image into a mapped pixel buffer, and the step which uploads it
+        only has to queue the copy on the GPU.
+    """
+
+
+    def __init__(self, upload_budget: float = ASSET_UPLOAD_BUDGET):
+        """
+            Parameters:
+
+                upload_budget: seconds per frame to spend making GL objects.
+                    At least one step is taken every frame, however long.
+        """
+
+        self.upload_budget = upload_budget
+        self.workers = concurrent.futures.ThreadPoolExecutor(
+            max_workers = ASSET_WORKERS)
+        self.start_time = time.perf_counter()
+
+        #(future, steps, name) of every asset waiting on a worker
+        self.waiting: list[tuple] = []
+        #(steps, value to resume them with, name) of every asset being made
+        self.making: list[tuple] = []
+        self.uploader = PixelUploader()
+
+        self.placeholder_mesh = CubeMesh()
+        self.placeholder_texture = Material2D(
+            None, image = PLACEHOLDER_IMAGE)
+        self.placeholder_cubemap = MaterialCubemap(
+            None, faces = [
+                (target, PLACEHOLDER_IMAGE) 
+                for (_, target, _) in CUBEMAP_FACES
+            ])
+    
+    def load_mesh(
+        self, assets: dict, key: int, 
+        mesh_type: type, filename: str, 
+        vertex_format: tuple[str] = VERTEX_FORMAT_FLOAT) -> None:
+        """
+            Start loading an obj mesh, assets[key] holds the placeholder
+            cube until it's ready.
+
+            Parameters:
+
+                assets: the dictionary the mesh lives in
+
+                key: the mesh's key in assets
+
+                mesh_type: ObjMesh or IndexedObjMesh
+
+                filename, vertex_format: as for mesh_type
+        """
+
+        def make(vertices):
+            assets[key] = mesh_type(filename, vertex_format, vertices)
+            yield
+
+        assets[key] = self.placeholder_mesh
+        self.request(
+            lambda: load_cached_mesh(filename, (3, 2, 3), load_model_from_file),
+            make, filename
+        )
+    
+    def load_texture(self, assets: dict, key: int, filepath: str) -> None:
+        """
+            Start loading a 2D texture, assets[key] holds the placeholder
+            texture until it's ready.
+        """
+
+        def make(mipmaps):
+            pixel_buffer, staged = yield self.stage(mipmaps)
+            try:
+                assets[key] = Material2D(
+                    filepath, mipmaps = mipmaps, 
+                    staged = staged, pixel_buffer = pixel_buffer)
+            finally:
+                self.uploader.release(pixel_buffer)
+            yield
+
+        assets[key] = self.placeholder_texture
+        self.request(lambda: load_cached_texture(filepath), make, filepath)
+    
+    def load_cubemap(self, assets: dict, key: int, filepath: str) -> None:
+        """
+            Start loading a cubemap, assets[key] holds the placeholder
+            cubemap until it's ready.
+        """
+
+        def make(faces):
+            cubemap = MaterialCubemap(filepath, faces = [])
+            try:
+                for (target, pixels) in faces:
+                    #one face at a time, they're too big to stage together
+                    pixel_buffer, (staged,) = yield self.stage([pixels])
+                    try:
+                        cubemap.upload_face(target, staged, pixel_buffer)
+                    finally:
+                        self.uploader.release(pixel_buffer)
+                    yield
+            except BaseException:
+                #failed or abandoned, free it and leave the placeholder in
+                cubemap.destroy()
+                raise
+            assets[key] = cubemap
+
+        assets[key] = self.placeholder_cubemap
+        self.request(lambda: load_cached_cubemap(filepath), make, filepath)
+    
+    def load_atlas_models(
+        self, meshes: dict, materials: dict, models: dict[int, tuple]) -> None:
+        """
+            Start loading obj meshes which take their textures from their
+            mtl files, with every diffuse map packed into one shared atlas.
+            meshes[key] and materials[key] hold placeholders until ready.
+
+            Parameters:
+
+                meshes, materials: the dictionaries the assets live in
+
+                models: the (mesh_type, filename, vertex_format) of each key,
+                    as for load_mesh
+        """
+
+        keys = list(models)
+
+        def read():
+            atlas_image, vertices = read_atlas_models(
+                [models[key][1] for key in keys])
+            return (make_mipmaps(atlas_image)[:ATLAS_MAX_LEVEL + 1], vertices)
+
+        def make(result):
+            atlas_mipmaps, vertices = result
+            pixel_buffer, staged = yield self.stage(atlas_mipmaps)
+            try:
+                atlas = Material2D(
+                    None, mipmaps = atlas_mipmaps, 
+                    staged = staged, pixel_buffer = pixel_buffer)
+            finally:
+                self.uploader.release(pixel_buffer)
+            made = {}
+            try:
+                yield
+                for (key, model_vertices) in zip(keys, vertices):
+                    mesh_type, filename, vertex_format = models[key]
+                    made[key] = mesh_type(filename, vertex_format, model_vertices)
+                    yield
+            except BaseException:
+                #failed or abandoned, free them and leave the placeholders in
+                atlas.destroy()
+                for mesh in made.values():
+                    mesh.destroy()
+                raise
+            #swapped in together, so none is left sharing a freed atlas
+            for key in keys:
+                meshes[key] = made[key]
+                materials[key] = atlas
+
+        for key in keys:
+            meshes[key] = self.placeholder_mesh
+            materials[key] = self.placeholder_texture
+        self.request(read, make, ", ".join(models[key][1] for key in keys))
+    
+    def request(self, read, make, name: str) -> None:
+        """
+            Run read on a worker thread, then later hand its result to
+            make on the main thread.
+
+            Parameters:
+
+                read: function returning the asset's file data
+
+                make: generator function taking the data, which makes the
+                    GL objects one step per yield and stores them where
+                    they belong once they're finished. A step can instead
+                    yield a future, eg. from stage, to be resumed with its
+                    result once it's done.
+
+                name: the asset's file(s), to report it by if it fails
+        """
+
+        def steps():
+            data = yield self.workers.submit(read)
+            yield from make(data)
+
+        steps = steps()
+        self.waiting.append((next(steps), steps, name))
+    
+    def stage(self, images: list[np.ndarray]) -> concurrent.futures.Future:
+        """
+            Copy images into a pixel buffer on a worker thread, for a
+            make step to yield. It's resumed with (pixel_buffer, staged),
+            see PixelUploader.stage, and must release the buffer once
+            it's uploaded from it.
+        """
+
+        return self.workers.submit(self.uploader.stage, images)
+    
+    def update(self) -> None:
+        """
+            Make and swap in assets which have finished reading, until
+            this frame's upload budgets run out. Call once per frame,
+            from the thread which owns the GL context.
+        """
+
+        self.uploader.update()
+
+        if not (self.waiting or self.making):
+            return
+
+        start = time.perf_counter()
+
+        still_waiting = []
+        for (future, steps, name) in self.waiting:
+            if not future.done():
+                still_waiting.append((future, steps, name))
+                continue
+            try:
+                self.making.append((steps, future.result(), name))
+            except Exception as error:
+                #leave the placeholder in, rather than take the app down
+                warnings.warn(f"Couldn't load {name}: {error!r}")
+                steps.close()
+        self.waiting = still_waiting
+
+        stepped = False
+        while self.making and not (stepped and (
+            time.perf_counter() - start > self.upload_budget
+            or self.uploader.get_uploaded() > self.uploader.budget)):
+
+            steps, value, name = self.making[0]
+            try:
+                result = steps.send(value)
+            except StopIteration:
+                self.making.pop(0)
+            except Exception as error:
+                #the step frees what it had made, the placeholder stays
+                warnings.warn(f"Couldn't load {name}: {error!r}")
+                steps.close()
+                self.making.pop(0)
+            else:
+                if isinstance(result, concurrent.futures.Future):
+                    self.making.pop(0)
+                    self.waiting.append((result, steps, name))
+                else:
+                    self.making[0] = (steps, None, name)
+            stepped = True
+
+        if REPORT_ASSET_LOADING and not (self.waiting or self.making):
+            print(f"Assets loaded after {time.perf_counter() - self.start_time:.2f}s")
+            gpu_resources.print_summary()
     
-    def get_uniform_locations(self) -> None:
+    def is_placeholder(self, asset) -> bool:
+        """ Return whether the given mesh or material is a placeholder. """
+
+        return asset is self.placeholder_mesh \
+            or asset is self.placeholder_texture \
+            or asset is self.placeholder_cubemap
+    
+    def destroy(self) -> None:
         """ 
-            Query and store the locations of any uniforms 
-            on the shader 
+            Stop any reading still under way, and free any assets half
+            made, the placeholders and the pixel buffers.
         """
 
-        glUseProgram(self.shaders[PIPELINE_SKY])
-        self.cameraForwardsLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_SKY], "camera_forwards")
-        self.cameraRightLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_SKY], "camera_right")
-        self.cameraUpLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_SKY], "camera_up")
+        #workers waiting on a pixel buffer would otherwise never finish
+        self.uploader.close()
+        self.workers.shutdown(wait = True, cancel_futures = True)
+        #assets still being made free what they have so far
+        for (_, steps, _) in self.waiting:
+            steps.close()
+        for (steps, _, _) in self.making:
+            steps.close()
+        self.waiting.clear()
+        self.making.clear()
+        self.uploader.destroy()
+        self.placeholder_mesh.destroy()
+        self.placeholder_texture.destroy()
+        self.placeholder_cubemap.destroy()
+
+class PixelBuffer:
+    """
+        A pixel unpack buffer which stays mapped for as long as it
+        lives, so any thread can write pixels into it. Textures are
+        then filled from it by upload_pixels, and a fence marks when
+        the GPU has finished reading it.
+    """
 
-        glUseProgram(self.shaders[PIPELINE_3D])
-        self.modelMatrixLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_3D], "model")
-        self.viewMatrixLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_3D], "view")
-        self.cameraPosLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_3D], "viewerPos")
-        
-        glUseProgram(self.shaders[PIPELINE_POST])
-        self.tLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_POST], "t"
-        )
+
+    def __init__(self, size: int):
+
+        self.size = size
+        self.fence = None
+        #bytes uploaded from the buffer this frame
+        self.uploaded = 0
+
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        self.buffer = gpu_resources.track("buffer", glGenBuffers(1), self, size)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffer)
+        glBufferStorage(GL_PIXEL_UNPACK_BUFFER, size, None, flags)
+        address = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, size, flags)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+        self.memory = np.ctypeslib.as_array(
+            (ctypes.c_ubyte * size).from_address(
+                ctypes.cast(address, ctypes.c_void_p).value))
     
-    def render(
-        self, camera: Player, 
-        renderables: dict[int, list[Entity]],
-        hazeRegions: list[Billboard]) -> None:
+    def write(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        """
+            Copy the given images into the buffer one after another,
+            and return views of the copies. They must fit.
         """
-            Render a frame.
 
-            Parameters:
+        staged = []
+        offset = 0
+        for pixels in images:
+            copy = self.memory[offset : offset + pixels.nbytes].reshape(pixels.shape)
+            np.copyto(copy, pixels)
+            staged.append(copy)
+            offset += get_staged_size(pixels)
+        return staged
+    
+    def get_offset(self, pixels: np.ndarray) -> int:
+        """ Return where the given staged image starts in the buffer. """
 
-                camera: the camera to render from
+        return pixels.ctypes.data - self.memory.ctypes.data
+    
+    def destroy(self) -> None:
 
-                renderables: a dictionary of entities to draw, keys are the
-                            entity types, for each of these there is a list
-                            of entities.
+        if self.fence is not None:
+            glDeleteSync(self.fence)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffer)
+        glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+        glDeleteBuffers(1, (self.buffer,))
+        gpu_resources.untrack("buffer", self.buffer)
+
+class PixelUploader:
+    """
+        A ring of PixelBuffers which uploads are staged through.
+
+        A worker thread takes a free buffer and copies pixels into it,
+        then the GL thread uploads from it and releases it. Release
+        fences the buffer, and once the GPU has passed the fence the
+        buffer goes back to the ring. Uploads so overlap rendering,
+        where uploading from client memory would stall until the
+        driver had copied the pixels.
+
+        Buffers can only stay mapped with GL 4.4 or ARB_buffer_storage,
+        without them stage hands back the images as they are, to be
+        uploaded from client memory.
+    """
+
+
+    def __init__(
+        self, count: int = PIXEL_BUFFER_COUNT, size: int = PIXEL_BUFFER_SIZE,
+        budget: int = PIXEL_UPLOAD_BUDGET):
         """
+            Parameters:
 
-        self.t += 0.1
-        if self.t > 2 * np.pi:
-            self.t -= 2 * np.pi
+                count, size: the number of pixel buffers and bytes in each
 
-        #regular 3D rendering to our standard framebuffer
-        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffers[LAYER_STANDARD].fbo)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glEnable(GL_DEPTH_TEST)
+                budget: bytes of staged pixels to upload per frame,
+                    callers check get_uploaded against it
+        """
 
-        #draw sky
-        glUseProgram(self.shaders[PIPELINE_SKY])
-        glDisable(GL_DEPTH_TEST)
-        self.materials[OBJECT_SKY].use()
-        glUniform3fv(
-            self.cameraForwardsLocation, 1, camera.forwards)
-        glUniform3fv(
-            self.cameraRightLocation, 1, camera.right)
-        glUniform3fv(
-            self.cameraUpLocation, 1, 
-            (self.screenHeight / self.screenWidth) * camera.up)
-        glBindVertexArray(self.meshes[OBJECT_SKY].vao)
-        glDrawArrays(
-            GL_TRIANGLES, 
-            0, self.meshes[OBJECT_SKY].vertex_count)
-        
-        #Everything else
-        glUseProgram(self.shaders[PIPELINE_3D])
-        glEnable(GL_DEPTH_TEST)
+        self.size = size
+        self.budget = budget
+        self.buffers = [PixelBuffer(size) for _ in range(count)] \
+            if glBufferStorage else []
+        #buffers workers may write to
+        self.free = queue.Queue()
+        for pixel_buffer in self.buffers:
+            self.free.put(pixel_buffer)
+        #released buffers the GPU may still be reading
+        self.fenced: list[PixelBuffer] = []
+        self.closed = False
+    
+    def stage(self, images: list[np.ndarray]) -> tuple:
+        """
+            Copy the given images into a free pixel buffer, waiting for
+            one if need be. Call from a worker thread.
 
-        glUniformMatrix4fv(
-            self.viewMatrixLocation, 
-            1, GL_FALSE, camera.get_view_transform()
-        )
-        glUniform3fv(self.cameraPosLocation, 1, camera.position)
-        self.materials[OBJECT_SKY].use()
+            Returns:
 
-        for objectType,objectList in renderables.items():
-            mesh = self.meshes[objectType]
-            material = self.materials[objectType]
-            glBindVertexArray(mesh.vao)
-            material.use()
-            for object in objectList:
-                glUniformMatrix4fv(
-                    self.modelMatrixLocation,
-                    1,GL_FALSE,
-                    object.get_model_transform()
-                )
-                glDrawArrays(GL_TRIANGLES, 0, mesh.vertex_count)
-        
-        #regular 3D rendering to our specialfx framebuffer
-        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffers[LAYER_EFFECTS].fbo)
-        glClear(GL_COLOR_BUFFER_BIT)
-        glEnable(GL_DEPTH_TEST)
+                (pixel_buffer, staged): the buffer and views of the copies
+                in it, to hand to upload_pixels. If there are no buffers,
+                or the images don't fit in one, pixel_buffer is None and
+                staged holds the images themselves.
+        """
 
-        #blit depth buffer from standard render. No need to redraw stuff!
-        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.framebuffers[LAYER_STANDARD].fbo)
-        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.framebuffers[LAYER_EFFECTS].fbo)
-        glBlitFramebuffer(0, 0, self.w, self.h, 0, 0, self.w, self.h, GL_DEPTH_BUFFER_BIT, GL_NEAREST)
-        
-        #Heat haze
-        glUseProgram(self.shaders[PIPELINE_3D])
+        if not self.buffers \
+            or sum(get_staged_size(pixels) for pixels in images) > self.size:
+            return (None, list(images))
+
+        while not self.closed:
+            try:
+                pixel_buffer = self.free.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+            return (pixel_buffer, pixel_buffer.write(images))
+        return (None, list(images))
+    
+    def release(self, pixel_buffer: PixelBuffer | None) -> None:
+        """
+            Hand back a buffer returned by stage, once every upload
+            from it has been made. Call from the GL thread.
+        """
 
-        self.materials[OBJECT_HAZE].use()
-        glBindVertexArray(self.meshes[OBJECT_HAZE].vao)
-        for object in hazeRegions:
-            glUniformMatrix4fv(
-                self.modelMatrixLocation,
-                1,GL_FALSE,
-                object.get_model_transform(camera.position)
-            )
-            glDrawArrays(GL_TRIANGLES, 0, mesh.vertex_count)
-        
-        #2D rendering from our custom framebuffer to the screen's framebuffer
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glDisable(GL_DEPTH_TEST)
+        if pixel_buffer is None:
+            return
 
-        glUseProgram(self.shaders[PIPELINE_POST])
-        glUniform1f(self.tLocation, self.t)
-        #bind the texture we just rendered to as the texture we're now going to read from
-        glActiveTexture(GL_TEXTURE0)
-        glBindTexture(GL_TEXTURE_2D, self.framebuffers[LAYER_STANDARD].colorBuffer)
-        glActiveTexture(GL_TEXTURE1)
-        glBindTexture(GL_TEXTURE_2D, self.framebuffers[LAYER_EFFECTS].colorBuffer)
-        #draw a screen-sized quad
-        glBindVertexArray(self.screenQuad.vao)
-        glDrawArrays(GL_TRIANGLES, 0, self.screenQuad.vertex_count)
+        pixel_buffer.fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.fenced.append(pixel_buffer)
+    
+    def get_uploaded(self) -> int:
+        """ Return the bytes uploaded from pixel buffers this frame. """
 
-        glFlush()
+        return sum(pixel_buffer.uploaded for pixel_buffer in self.buffers)
+    
+    def update(self) -> None:
+        """
+            Return buffers the GPU has finished reading to the ring, and
+            start counting a new frame's uploads. Call once per frame,
+            from the GL thread.
+        """
+
+        still_fenced = []
+        for pixel_buffer in self.fenced:
+            if glClientWaitSync(pixel_buffer.fence, 0, 0) \
+                in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED):
+                glDeleteSync(pixel_buffer.fence)
+                pixel_buffer.fence = None
+                self.free.put(pixel_buffer)
+            else:
+                still_fenced.append(pixel_buffer)
+        self.fenced = still_fenced
+
+        for pixel_buffer in self.buffers:
+            pixel_buffer.uploaded = 0
+    
+    def close(self) -> None:
+        """ Stop workers waiting for buffers, staging from now on fails. """
 
+        self.closed = True
+    
     def destroy(self) -> None:
-        """ Free any allocated memory """
 
-        for mesh in self.meshes.values():
-            mesh.destroy()
-        for material in self.materials.values():
-            material.destroy()
-        for shader in self.shaders.values():
-            glDeleteProgram(shader)
-        for framebuffer in self.framebuffers.values():
-            framebuffer.destroy()
+        for pixel_buffer in self.buffers:
+            pixel_buffer.destroy()
 
 class Mesh:
     """ A general mesh """
@@ -817,38 +2834,164 @@ class Mesh:
 
         self.vertex_count = 0
 
-        self.vao = glGenVertexArrays(1)
-        self.vbo = glGenBuffers(1)
+        #decodes quantized positions, position = offset + scale * stored
+        self.position_offset = np.zeros(3, dtype=np.float32)
+        self.position_scale = np.ones(3, dtype=np.float32)
+
+        self.vao = gpu_resources.track("vertex array", glGenVertexArrays(1), self)
+        self.vbo = gpu_resources.track("buffer", glGenBuffers(1), self)
+    
+    def upload_vertices(
+        self, vertices: np.ndarray, vertex_format: tuple[str]) -> int:
+        """
+            Store x,y,z,s,t,nx,ny,nz vertex data in the given format,
+            upload it and describe its attributes to the vertex array.
+
+            Parameters:
+
+                vertices: flat float32 array, 8 floats per vertex
+
+                vertex_format: (position, texcoord, normal) storage formats
+            
+            Returns:
+
+                The number of bytes uploaded.
+        """
+
+        if vertex_format == VERTEX_FORMAT_FLOAT:
+            #already laid out this way, upload without a copy
+            data = vertices
+        else:
+            packed, self.position_offset, self.position_scale = pack_vertices(
+                vertices, vertex_format)
+            #PyOpenGL can't read structured arrays, hand over the raw bytes
+            data = packed.view(np.uint8)
+        layout = get_vertex_dtype(vertex_format)
+
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+        gpu_resources.resize("buffer", self.vbo, data.nbytes)
+
+        for (location, name) in enumerate(layout.names):
+            size, attribute_type, normalized = ATTRIBUTE_TYPES[
+                (name, vertex_format[location])]
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(
+                location, size, attribute_type, normalized, 
+                layout.itemsize, ctypes.c_void_p(layout.fields[name][1]))
+        
+        return data.nbytes
+    
+    def draw(self) -> None:
+        """ Draw the mesh, its vertex array must already be bound. """
+
+        glDrawArrays(GL_TRIANGLES, 0, self.vertex_count)
+    
+    def draw_instanced(self, count: int) -> None:
+        """ Draw the given number of instances of the bound mesh. """
+
+        glDrawArraysInstanced(GL_TRIANGLES, 0, self.vertex_count, count)
     
     def destroy(self):
         
         glDeleteVertexArrays(1, (self.vao,))
         glDeleteBuffers(1,(self.vbo,))
+        gpu_resources.untrack("vertex array", self.vao)
+        gpu_resources.untrack("buffer", self.vbo)
 
 class ObjMesh(Mesh):
 
 
-    def __init__(self, filename):
+    def __init__(
+        self, filename, vertex_format: tuple[str] = VERTEX_FORMAT_FLOAT,
+        vertices: np.ndarray = None):
 
         super().__init__()
 
         # x, y, z, s, t, nx, ny, nz
-        vertices = load_model_from_file(filename)
+        if vertices is None:
+            vertices = load_cached_mesh(filename, (3, 2, 3), load_model_from_file)
         self.vertex_count = len(vertices)//8
-        vertices = np.array(vertices, dtype=np.float32)
+        self.upload_vertices(vertices, vertex_format)
 
-        glBindVertexArray(self.vao)
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
-        #position
-        glEnableVertexAttribArray(0)
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
-        #texture
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(12))
-        #normal
-        glEnableVertexAttribArray(2)
-        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
+class IndexedObjMesh(Mesh):
+    """
+        An obj mesh which stores each unique vertex once,
+        and draws through an element buffer.
+    """
+
+
+    def __init__(
+        self, filename, vertex_format: tuple[str] = VERTEX_FORMAT_FLOAT,
+        vertices: np.ndarray = None):
+
+        super().__init__()
+
+        # x, y, z, s, t, nx, ny, nz
+        if vertices is None:
+            vertices = load_cached_mesh(filename, (3, 2, 3), load_model_from_file)
+        vertices, indices = index_vertices(vertices, 8)
+        self.vertex_count = len(indices)
+        self.index_type = GL_UNSIGNED_SHORT \
+            if indices.dtype == np.uint16 else GL_UNSIGNED_INT
+
+        vertex_size = self.upload_vertices(vertices, vertex_format)
+
+        self.ebo = gpu_resources.track(
+            "buffer", glGenBuffers(1), self, indices.nbytes)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+
+        if REPORT_MESH_MEMORY:
+            expanded_size = 32 * self.vertex_count
+            indexed_size = vertex_size + indices.nbytes
+            print(
+                f"{filename}: {self.vertex_count} corners -> {len(vertices) // 8} vertices, "
+                f"{expanded_size / 1024:.1f} KB -> {indexed_size / 1024:.1f} KB "
+                f"({(expanded_size - indexed_size) / 1024:.1f} KB saved)"
+            )
+    
+    def draw(self) -> None:
+
+        glDrawElements(
+            GL_TRIANGLES, self.vertex_count, self.index_type, ctypes.c_void_p(0))
+    
+    def draw_instanced(self, count: int) -> None:
+
+        glDrawElementsInstanced(
+            GL_TRIANGLES, self.vertex_count, self.index_type, 
+            ctypes.c_void_p(0), count)
+    
+    def destroy(self):
+
+        super().destroy()
+        glDeleteBuffers(1, (self.ebo,))
+        gpu_resources.untrack("buffer", self.ebo)
+
+class CubeMesh(Mesh):
+    """ A unit cube, centered on the origin. """
+
+
+    def __init__(self):
+
+        super().__init__()
+
+        # x, y, z, s, t, nx, ny, nz
+        vertices = []
+        for axis in range(3):
+            for sign in (-1, 1):
+                normal = np.zeros(3)
+                normal[axis] = sign
+                #two edges of the face, chosen so that u x v = normal
+                u = np.roll(normal, 1)
+                v = np.roll(np.abs(normal), 2)
+                for (s, t) in ((0, 0), (1, 0), (1, 1), (0, 0), (1, 1), (0, 1)):
+                    position = 0.5 * normal + (s - 0.5) * u + (t - 0.5) * v
+                    vertices.append((*position, s, t, *normal))
+        vertices = np.array(vertices, dtype=np.float32).ravel()
+        self.vertex_count = len(vertices)//8
+        self.upload_vertices(vertices, VERTEX_FORMAT_FLOAT)
 
 class Quad2D(Mesh):
 
@@ -875,6 +3018,7 @@ class Quad2D(Mesh):
         glBindVertexArray(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
         glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        gpu_resources.resize("buffer", self.vbo, vertices.nbytes)
         #position
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 16, ctypes.c_void_p(0))
@@ -882,10 +3026,110 @@ class Quad2D(Mesh):
         glEnableVertexAttribArray(1)
         glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 16, ctypes.c_void_p(8))
 
+class InstanceBuffer:
+    """
+        The model transforms of every entity of one object type, read
+        by the vertex shader as a mat4 attribute which advances once
+        per instance rather than once per vertex.
+    """
+
+
+    def __init__(self):
+
+        #bytes allocated, grown as the number of entities does
+        self.capacity = 0
+        self.vbo = gpu_resources.track("buffer", glGenBuffers(1), self)
+    
+    def update(self, transforms: np.ndarray) -> None:
+        """ Upload this frame's (N,4,4) model transforms, one per instance. """
+
+        transforms = np.ascontiguousarray(transforms, dtype=np.float32)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        if transforms.nbytes > self.capacity:
+            #double, so a growing scene doesn't reallocate every frame
+            self.capacity = max(transforms.nbytes, 2 * self.capacity)
+            gpu_resources.resize("buffer", self.vbo, self.capacity)
+        #orphan last frame's transforms, rather than wait for the
+        #draws reading them to finish
+        glBufferData(GL_ARRAY_BUFFER, self.capacity, None, GL_STREAM_DRAW)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, transforms.nbytes, transforms)
+    
+    def attach(self) -> None:
+        """
+            Point the bound vertex array's instance attribute at this
+            buffer. Each row of a transform is a column to GL.
+        """
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        for column in range(4):
+            location = INSTANCE_ATTRIBUTE + column
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(
+                location, 4, GL_FLOAT, GL_FALSE, 64, ctypes.c_void_p(16 * column))
+            glVertexAttribDivisor(location, 1)
+    
+    def destroy(self) -> None:
+
+        glDeleteBuffers(1, (self.vbo,))
+        gpu_resources.untrack("buffer", self.vbo)
+
+class FrameUniforms:
+    """
+        The per frame data every pipeline reads: the camera's transforms
+        and basis, and the time. It's held in one std140 uniform block,
+        uploaded once per frame and bound to FRAME_UNIFORM_BINDING,
+        rather than set on each program which needs it.
+    """
+
+    #three mat4s, four vec4s, then a float padded out to a vec4
+    SIZE = 3 * 64 + 4 * 16 + 16
+
+
+    def __init__(self, projection: np.ndarray):
+
+        self.data = np.zeros(self.SIZE // 4, dtype=np.float32)
+        self.data[16:32] = np.ravel(projection)
+        self.projection = np.asarray(projection, dtype=np.float32)
+
+        self.ubo = gpu_resources.track("buffer", glGenBuffers(1), self, self.SIZE)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.SIZE, self.data, GL_DYNAMIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, FRAME_UNIFORM_BINDING, self.ubo)
+    
+    def attach(self, shader: int) -> None:
+        """ Have the shader's Frame block, if it has one, read this buffer. """
+
+        index = glGetUniformBlockIndex(shader, "Frame")
+        if index != GL_INVALID_INDEX:
+            glUniformBlockBinding(shader, index, FRAME_UNIFORM_BINDING)
+    
+    def update(self, camera: Player, t: float = 0.0) -> None:
+        """ Upload this frame's camera and time. """
+
+        view = camera.get_view_transform()
+        #each matrix is stored row by row, which GL reads as its columns,
+        #the same as glUniformMatrix4fv with GL_FALSE
+        self.data[0:16] = np.ravel(view)
+        self.data[32:48] = np.ravel(view @ self.projection)
+        self.data[48:51] = camera.position
+        self.data[52:55] = camera.forwards
+        self.data[56:59] = camera.right
+        self.data[60:63] = camera.up
+        self.data[64] = t
+
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.SIZE, self.data)
+    
+    def destroy(self) -> None:
+
+        glDeleteBuffers(1, (self.ubo,))
+        gpu_resources.untrack("buffer", self.ubo)
+
 class Material:
 
     def __init__(self, textureType: int, textureUnit: int):
-        self.texture = glGenTextures(1)
+        self.texture = gpu_resources.track("texture", glGenTextures(1), self)
         self.textureType = textureType
         self.textureUnit = textureUnit
         glBindTexture(textureType, self.texture)
@@ -896,11 +3140,30 @@ class Material:
     
     def destroy(self):
         glDeleteTextures(1, (self.texture,))
+        gpu_resources.untrack("texture", self.texture)
 
 class Material2D(Material):
 
     
-    def __init__(self, filepath):
+    def __init__(
+        self, filepath, image: np.ndarray = None, 
+        mipmaps: list[np.ndarray] = None,
+        staged: list[np.ndarray] = None, pixel_buffer: PixelBuffer = None):
+        """
+            Parameters:
+
+                filepath: the image file to load
+
+                image: the (height, width, channels) pixels if the file has
+                    already been read, eg. by read_image on a worker thread
+
+                mipmaps: the pixels of every mip level, largest first,
+                    eg. from load_cached_texture. Takes the place of image,
+                    and saves generating the mipmaps.
+
+                staged, pixel_buffer: copies of the levels and the buffer
+                    PixelUploader.stage put them in, if they were staged
+        """
         
         super().__init__(GL_TEXTURE_2D, 1)
         
@@ -908,12 +3171,21 @@ class Material2D(Material):
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST_MIPMAP_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        with Image.open(filepath, mode = "r") as image:
-            image_width,image_height = image.size
-            image = image.convert("RGBA")
-            img_data = bytes(image.tobytes())
-            glTexImage2D(GL_TEXTURE_2D,0,GL_RGBA,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-        glGenerateMipmap(GL_TEXTURE_2D)
+        if mipmaps is None:
+            if image is None:
+                image = read_image(filepath)
+            mipmaps = [image]
+        image_height,image_width,channels = mipmaps[0].shape
+        #a chain that was handed over, eg. an atlas's, may stop short
+        levels = len(mipmaps)
+        if len(mipmaps) == 1:
+            levels = max(image_width, image_height).bit_length()
+        gpu_resources.resize("texture", self.texture, allocate_texture(
+            GL_TEXTURE_2D, image_width, image_height, channels, levels))
+        for (level, pixels) in enumerate(staged or mipmaps):
+            upload_pixels(GL_TEXTURE_2D, pixels, level, pixel_buffer = pixel_buffer)
+        if len(mipmaps) == 1:
+            glGenerateMipmap(GL_TEXTURE_2D)
 
 class Framebuffer:
     """
@@ -931,7 +3203,7 @@ class Framebuffer:
                 h: the height of the screen
         """
         
-        self.fbo = glGenFramebuffers(1)
+        self.fbo = gpu_resources.track("framebuffer", glGenFramebuffers(1), self)
         glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
         
         self.make_color_buffer(w, h)
@@ -950,7 +3222,9 @@ class Framebuffer:
         """
 
         #create and bind the color buffer
-        self.colorBuffer = glGenTextures(1)
+        #GL_RGB is usually padded out to 4 bytes a pixel
+        self.colorBuffer = gpu_resources.track(
+            "texture", glGenTextures(1), self, 4 * w * h)
         glBindTexture(GL_TEXTURE_2D, self.colorBuffer)
         #preallocate space
         glTexImage2D(
@@ -978,7 +3252,8 @@ class Framebuffer:
 
         #create and bind, a render buffer is like a texture which can
         # be written to and read from, but not sampled (ie. not smooth)
-        self.depthStencilBuffer = glGenRenderbuffers(1)
+        self.depthStencilBuffer = gpu_resources.track(
+            "renderbuffer", glGenRenderbuffers(1), self, 4 * w * h)
         glBindRenderbuffer(GL_RENDERBUFFER, self.depthStencilBuffer)
         #preallocate space, we'll use 24 bits for depth and 8 for stencil
         glRenderbufferStorage(
@@ -995,13 +3270,28 @@ class Framebuffer:
         glDeleteFramebuffers(1, (self.fbo,))
         glDeleteTextures(1, (self.colorBuffer,))
         glDeleteRenderbuffers(1, (self.depthStencilBuffer,))
+        gpu_resources.untrack("framebuffer", self.fbo)
+        gpu_resources.untrack("texture", self.colorBuffer)
+        gpu_resources.untrack("renderbuffer", self.depthStencilBuffer)
     
 class MaterialCubemap(Material):
 
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, faces: list[tuple] = None):
+        """
+            Parameters:
+
+                filepath: the images are loaded from filepath_left.png,
+                    filepath_right.png and so on
+
+                faces: (target, pixels) for every face if they have
+                    already been read, eg. by read_cubemap_faces on a
+                    worker thread. Pass an empty list to upload the
+                    faces later with upload_face.
+        """
 
         super().__init__(GL_TEXTURE_CUBE_MAP, 0)
+        self.allocated = False
 
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
@@ -1010,45 +3300,148 @@ class MaterialCubemap(Material):
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
 
         #load textures
-        with Image.open(f"{filepath}_left.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_Y,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-        
-        with Image.open(f"{filepath}_right.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = ImageOps.flip(img)
-            img = ImageOps.mirror(img)
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_Y,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-        
-        with Image.open(f"{filepath}_top.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.rotate(90)
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_Z,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-
-        with Image.open(f"{filepath}_bottom.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_Z,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+        if faces is None:
+            faces = read_cubemap_faces(filepath)
+        for face in faces:
+            self.upload_face(*face)
+    
+    def upload_face(
+        self, target: int, pixels: np.ndarray, 
+        pixel_buffer: PixelBuffer = None) -> None:
+        """
+            Upload the image of one face of the cubemap, the first face
+            uploaded sets the size and format of them all. Give the pixel
+            buffer the image was staged in, if it was.
+        """
+
+        glBindTexture(GL_TEXTURE_CUBE_MAP, self.texture)
+        if not self.allocated:
+            image_height,image_width,channels = pixels.shape
+            gpu_resources.resize("texture", self.texture, allocate_texture(
+                GL_TEXTURE_CUBE_MAP, image_width, image_height, channels, 1))
+            self.allocated = True
+        upload_pixels(target, pixels, pixel_buffer = pixel_buffer)
+
+class RenderQueue:
+    """
+        Collects a frame's draws, then makes them sorted by pass, shader,
+        material, mesh and depth, so that each is only bound when it
+        changes rather than once per draw.
+
+        Each pass can have a function setting it up (framebuffers, depth
+        testing), run as drawing enters it. Each shader can be given a
+        function setting its per frame uniforms, run the first time it's
+        bound. Either may bind textures of their own, so the queue only
+        trusts its record of bound materials within a pass.
+    """
+
+
+    def __init__(self):
+
+        self.pass_setups = {}
+        self.shader_setups = {}
+
+        #this frame's draws, and their sort keys
+        self.items = []
+        self.keys = []
+        self.depths = []
+
+        #binds made last frame, and how many fewer that was than
+        #binding everything for every draw
+        self.state_changes = 0
+        self.state_changes_saved = 0
+    
+    def set_pass(self, pass_index: int, setup) -> None:
+        """ Set the function run every frame as drawing enters the given pass. """
+
+        self.pass_setups[pass_index] = setup
+    
+    def set_shader_uniforms(self, shader: int, setup) -> None:
+        """ Set a function to run once, the next time the given shader is bound. """
+
+        self.shader_setups[shader] = setup
+    
+    def submit(
+        self, pass_index: int, shader: int, material, mesh, draw, 
+        depth: float = 0.0) -> None:
+        """
+            Queue a draw for this frame.
+
+            Parameters:
+
+                pass_index: the pass to draw in, passes are drawn in order
+
+                shader: the program to draw with
+
+                material: the material to bind, or None to leave textures alone
+
+                mesh: the mesh whose vertex array to bind
+
+                draw: function taking no arguments, making the draw calls
+                    once everything else is bound
+
+                depth: distance from the camera, nearer draws sharing the
+                    same state go first
+        """
+
+        self.items.append((pass_index, shader, material, mesh, draw))
+        self.keys.append((pass_index, shader, id(material), id(mesh)))
+        self.depths.append(depth)
+    
+    def flush(self) -> None:
+        """ Make every draw submitted this frame, in sorted order. """
+
+        keys = np.array(self.keys, dtype=np.int64).reshape(-1, 4)
+        order = np.lexsort(
+            (np.array(self.depths), keys[:, 3], keys[:, 2], keys[:, 1], keys[:, 0]))
+
+        #passes set up even when nothing is drawn in them
+        pending_passes = sorted(self.pass_setups)
+        bound_shader = None
+        bound_mesh = None
+        #material bound to each texture unit
+        bound_materials = {}
+        changes = 0
+        naive_changes = 0
+
+        for i in order:
+            pass_index, shader, material, mesh, draw = self.items[i]
+
+            if pending_passes and pending_passes[0] <= pass_index:
+                while pending_passes and pending_passes[0] <= pass_index:
+                    self.pass_setups[pending_passes.pop(0)]()
+                bound_materials.clear()
+
+            if shader != bound_shader:
+                glUseProgram(shader)
+                bound_shader = shader
+                changes += 1
+                setup = self.shader_setups.pop(shader, None)
+                if setup is not None:
+                    setup()
+            
+            if material is not None:
+                naive_changes += 1
+                if bound_materials.get(material.textureUnit) is not material:
+                    material.use()
+                    bound_materials[material.textureUnit] = material
+                    changes += 1
+            
+            if mesh is not bound_mesh:
+                glBindVertexArray(mesh.vao)
+                bound_mesh = mesh
+                changes += 1
+            
+            naive_changes += 2
+            draw()
         
-        with Image.open(f"{filepath}_back.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.rotate(-90)
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_X,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-
-        with Image.open(f"{filepath}_front.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.rotate(90)
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_X,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+        for pass_index in pending_passes:
+            self.pass_setups[pass_index]()
+
+        self.state_changes = changes
+        self.state_changes_saved = naive_changes - changes
+        self.items.clear()
+        self.keys.clear()
+        self.depths.clear()
 
 myApp = App(800,600)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from config import *
 import engine
+import resources
 import scene
 
 class App:
@@ -58,7 +59,6 @@ class App:
 
             #timing
             self.calculateFramerate()
-        self.quit()
     
     def calculateFramerate(self) -> None:
         """
@@ -77,7 +77,10 @@ class App:
 
     def quit(self) -> None:
         """
-            For some reason, the graphics engine's destructor throws weird errors.
+            Free everything, then close the window. Must only be
+            called once, after mainLoop has returned: once pygame
+            has quit there's no GL context left to free anything in.
         """
-        #self.graphicsEngine.destroy()
+        self.graphicsEngine.destroy()
+        resources.gpu_resources.report_leaks()
         pg.quit()
\ No newline at end of file
@@ -1,4 +1,5 @@
 from config import *
+import dynamic_buffer
 import sphere
 
 class Buffer:
@@ -9,15 +10,11 @@ class Buffer:
         self.binding = binding
 
         # (cx cy cz r) (r g b _)
-        self.hostMemory = np.zeros(8 * size, dtype=np.float32)
-
-        self.deviceMemory = glGenBuffers(1)
-        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.deviceMemory)
-        glBufferStorage(
-            GL_SHADER_STORAGE_BUFFER, self.hostMemory.nbytes, 
-            self.hostMemory, GL_DYNAMIC_STORAGE_BIT)
-        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, binding, self.deviceMemory)
-        self.elements_written = 0
+        self.deviceMemory = dynamic_buffer.DynamicBuffer(
+            GL_SHADER_STORAGE_BUFFER, 8 * 4 * size, 
+            alignment = int(glGetIntegerv(GL_SHADER_STORAGE_BUFFER_OFFSET_ALIGNMENT)))
+        #mapped when the first sphere of a frame is recorded
+        self.hostMemory = None
     
     def recordSphere(self, i: int, _sphere: sphere.Sphere) -> None:
         """
@@ -27,26 +24,36 @@ class Buffer:
 
         if i >= self.size:
             return
+        
+        if self.hostMemory is None:
+            self.hostMemory = self.deviceMemory.map()
 
         baseIndex = 8 * i
         self.hostMemory[baseIndex : baseIndex + 3] = _sphere.center[:]
         self.hostMemory[baseIndex + 3] = _sphere.radius
         self.hostMemory[baseIndex + 4 : baseIndex + 7] = _sphere.color[:]
-        self.elements_written += 1
     
     def readFrom(self) -> None:
         """
-            Upload the CPU data to the buffer, then arm it for reading.
+            Arm the spheres recorded this frame for reading. The memory
+            is mapped coherently, so there's nothing to upload.
         """
 
-        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.deviceMemory)
-        glBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, 8 * 4 * self.elements_written, self.hostMemory)
-        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, self.binding, self.deviceMemory)
-        self.elements_written = 0
+        self.deviceMemory.bindRange(self.binding)
+    
+    def fence(self) -> None:
+        """
+            Mark the end of this frame's reads, the next frame's spheres
+            are recorded into another segment while these are in use.
+        """
+
+        self.deviceMemory.fence()
+        self.hostMemory = None
     
     def destroy(self) -> None:
         """
             Free the memory.
         """
 
-        glDeleteBuffers(1, (self.deviceMemory,))
\ No newline at end of file
+        self.hostMemory = None
+        self.deviceMemory.destroy()
\ No newline at end of file
@@ -0,0 +1,102 @@
+from config import *
+import ctypes
+import resources
+
+class DynamicBuffer:
+    """
+        A buffer the CPU rewrites every frame, without waiting on the
+        GPU to finish with what it held the frame before.
+
+        The buffer's storage is mapped once, persistently and coherently,
+        and split into segments which are written in turn. The CPU writes
+        straight into a numpy view of the current segment while the GPU
+        may still be reading the others. A fence placed after the
+        segment's last use is waited on before it's written again.
+    """
+
+    def __init__(self, target: int, size: int, segments: int = 3, alignment: int = 1):
+        """
+            Allocate and map the buffer.
+
+                Parameters:
+                    target (int): the binding target, eg. GL_SHADER_STORAGE_BUFFER
+                    size (int): bytes written each frame
+                    segments (int): frames which may be in flight at once
+                    alignment (int): segments start on a multiple of this
+                        many bytes, eg. the target's offset alignment
+        """
+
+        self.target = target
+        self.size = size
+        self.segments = segments
+        self.segmentSize = -(-size // alignment) * alignment
+        totalSize = self.segments * self.segmentSize
+
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        self.deviceMemory = resources.gpu_resources.track(
+            "buffer", glGenBuffers(1), self, totalSize)
+        glBindBuffer(target, self.deviceMemory)
+        glBufferStorage(target, totalSize, None, flags)
+        address = glMapBufferRange(target, 0, totalSize, flags)
+        self.hostMemory = np.ctypeslib.as_array(
+            ctypes.cast(address, ctypes.POINTER(ctypes.c_ubyte)), shape = (totalSize,))
+
+        self.fences = [None] * segments
+        self.segment = 0
+    
+    def offset(self) -> int:
+        """
+            Returns the offset in bytes of the current segment.
+        """
+
+        return self.segment * self.segmentSize
+    
+    def map(self, dtype = np.float32) -> np.ndarray:
+        """
+            Wait until the GPU has finished with the current segment,
+            then return a view of it to write this frame's data into.
+        """
+
+        fence = self.fences[self.segment]
+        if fence is not None:
+            #flush the fence itself, so it can't wait on commands still held back
+            while glClientWaitSync(
+                fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000) == GL_TIMEOUT_EXPIRED:
+                pass
+            glDeleteSync(fence)
+            self.fences[self.segment] = None
+
+        offset = self.offset()
+        return self.hostMemory[offset : offset + self.size].view(dtype)
+    
+    def bindRange(self, binding: int) -> None:
+        """
+            Bind the current segment to the given indexed binding point.
+        """
+
+        glBindBufferRange(
+            self.target, binding, self.deviceMemory, self.offset(), self.size)
+    
+    def fence(self) -> None:
+        """
+            Mark the end of the commands reading the current segment,
+            and move on to the next.
+        """
+
+        self.fences[self.segment] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.segment = (self.segment + 1) % self.segments
+    
+    def destroy(self) -> None:
+        """
+            Free the memory.
+        """
+
+        for fence in self.fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        #views of the mapping must not outlive it
+        self.hostMemory = None
+        glBindBuffer(self.target, self.deviceMemory)
+        glUnmapBuffer(self.target)
+        glDeleteBuffers(1, (self.deviceMemory,))
+        resources.gpu_resources.untrack("buffer", self.deviceMemory)
\ No newline at end of file
@@ -95,6 +95,7 @@ class Engine:
         self.colorBuffer.writeTo()
         
         glDispatchCompute(int(self.screenWidth/8), int(self.screenHeight/8), 1)
+        self.sphereBuffer.fence()
   
         # make sure writing to image has finished before read
         glMemoryBarrier(GL_SHADER_IMAGE_ACCESS_BARRIER_BIT)
@@ -1,10 +1,13 @@
 from config import *
+import resources
 
 class Material:
         
     def __init__(self, width: int, height: int):
     
-        self.texture = glGenTextures(1)
+        #four 32 bit floats a pixel
+        self.texture = resources.gpu_resources.track(
+            "texture", glGenTextures(1), self, 16 * width * height)
         glActiveTexture(GL_TEXTURE0)
         glBindTexture(GL_TEXTURE_2D, self.texture)
 
@@ -28,4 +31,5 @@ class Material:
     
     def destroy(self) -> None:
 
-        glDeleteTextures(1, (self.texture,))
\ No newline at end of file
+        glDeleteTextures(1, (self.texture,))
+        resources.gpu_resources.untrack("texture", self.texture)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from config import *
+import resources
 
 class Mesh:
 
@@ -6,9 +7,10 @@ class Mesh:
 
         self.vertex_count = 0
 
-        self.vao = glGenVertexArrays(1)
+        self.vao = resources.gpu_resources.track(
+            "vertex array", glGenVertexArrays(1), self)
         glBindVertexArray(self.vao)
-        self.vbo = glGenBuffers(1)
+        self.vbo = resources.gpu_resources.track("buffer", glGenBuffers(1), self)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
     
     def draw(self) -> None:
@@ -21,4 +23,6 @@ class Mesh:
         """ Destroy the mesh. """
 
         glDeleteBuffers(1, (self.vbo,))
-        glDeleteVertexArrays(1, (self.vao,))
\ No newline at end of file
+        glDeleteVertexArrays(1, (self.vao,))
+        resources.gpu_resources.untrack("buffer", self.vbo)
+        resources.gpu_resources.untrack("vertex array", self.vao)
\ No newline at end of file
@@ -0,0 +1,147 @@
+from config import *
+import os
+import sys
+import traceback
+
+############################## Constants ######################################
+
+#bytes of GPU memory the program should stay within, a summary of
+#what's using it is printed if it goes over
+GPU_MEMORY_BUDGET = 256 * 1024 * 1024
+
+############################## Tracking #######################################
+
+class TrackedResource:
+
+
+    def __init__(self, kind: str, name: int, owner, site: str):
+
+        self.kind = kind
+        self.name = name
+        #resources are summed up by the class of their owner
+        self.category = type(owner).__name__
+        self.owner = f"{self.category} at {id(owner):#x}"
+        self.site = site
+        self.nbytes = 0
+
+class GPUResourceTracker:
+    """
+        Records every GL object made through track, along with the
+        bytes of GPU memory it holds, the object which owns it and the
+        line which made it, until it's deleted through untrack.
+
+        Anything still recorded once the program has freed everything
+        was leaked, report_leaks lists it. A summary is printed the
+        first time the objects together go over the budget.
+    """
+
+
+    def __init__(self, budget: int = GPU_MEMORY_BUDGET):
+
+        self.budget = budget
+        self.resources: dict[tuple, TrackedResource] = {}
+        self.total_bytes = 0
+        self.over_budget = False
+    
+    def track(self, kind: str, name: int, owner, nbytes: int = 0) -> int:
+        """
+            Record a GL object which has just been made and return its
+            name, so the call making it can be wrapped in place, eg.
+
+                self.vbo = gpu_resources.track("buffer", glGenBuffers(1), self)
+
+            Parameters:
+
+                kind: eg. "buffer", "texture" or "framebuffer",
+                    GL names are only unique within a kind
+
+                name: the name glGen* returned
+
+                owner: the object responsible for deleting it
+
+                nbytes: the GPU memory it holds, if already known
+        """
+
+        #the first caller outside the owner's base classes, eg. the
+        #subclass __init__ rather than the base __init__ it called
+        base_code = {
+            getattr(member, "__code__", None)
+            for base in type(owner).__mro__[1:]
+            for member in vars(base).values()
+        }
+        code, lineno = next(
+            (frame.f_code, lineno)
+            for (frame, lineno) in traceback.walk_stack(sys._getframe(1))
+            if frame.f_code not in base_code)
+        previous = self.resources.pop((kind, name), None)
+        if previous is not None:
+            #deleted without untrack, and its name has been reused
+            self.total_bytes -= previous.nbytes
+        self.resources[(kind, name)] = TrackedResource(
+            kind, name, owner,
+            f"{os.path.basename(code.co_filename)}:{lineno} in {code.co_name}")
+        self.resize(kind, name, nbytes)
+        return name
+    
+    def resize(self, kind: str, name: int, nbytes: int) -> None:
+        """ Record how much GPU memory an object holds, once it's allocated. """
+
+        resource = self.resources[(kind, name)]
+        self.total_bytes += nbytes - resource.nbytes
+        resource.nbytes = nbytes
+
+        if self.total_bytes > self.budget and not self.over_budget:
+            print(
+                f"GPU memory over budget, {self.total_bytes / 2**20:.1f} MB "
+                f"of {self.budget / 2**20:.1f} MB")
+            self.print_summary()
+        self.over_budget = self.total_bytes > self.budget
+    
+    def untrack(self, kind: str, name: int) -> None:
+        """ Forget a GL object which has just been deleted. """
+
+        resource = self.resources.pop((kind, name), None)
+        if resource is not None:
+            self.total_bytes -= resource.nbytes
+    
+    def get_summary(self) -> dict[str, tuple[int]]:
+        """ Return the (object count, bytes of GPU memory) of each category. """
+
+        summary = {}
+        for resource in self.resources.values():
+            count, size = summary.get(resource.category, (0, 0))
+            summary[resource.category] = (count + 1, size + resource.nbytes)
+        return summary
+    
+    def get_top_consumers(self, count: int = 5) -> list[TrackedResource]:
+        """ Return the objects holding the most GPU memory, largest first. """
+
+        return sorted(
+            self.resources.values(), 
+            key = lambda resource: resource.nbytes, reverse = True)[:count]
+    
+    def print_summary(self) -> None:
+
+        print(f"GPU memory: {self.total_bytes / 1024:.1f} KB in {len(self.resources)} objects")
+        for (category, (count, size)) in sorted(self.get_summary().items()):
+            print(f"{category}: {count} objects, {size / 1024:.1f} KB")
+        for resource in self.get_top_consumers():
+            print(
+                f"    {resource.nbytes / 1024:.1f} KB {resource.kind} {resource.name}, "
+                f"{resource.owner}, made at {resource.site}")
+    
+    def report_leaks(self) -> list[TrackedResource]:
+        """
+            Print and return every object which hasn't been deleted,
+            call once everything should have been freed.
+        """
+
+        leaks = list(self.resources.values())
+        for resource in leaks:
+            print(
+                f"Leaked {resource.kind} {resource.name} ({resource.nbytes / 1024:.1f} KB), "
+                f"{resource.owner}, made at {resource.site}")
+        return leaks
+
+#every GL object the program makes
+gpu_resources = GPUResourceTracker()
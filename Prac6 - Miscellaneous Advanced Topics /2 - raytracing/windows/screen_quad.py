@@ -1,5 +1,6 @@
 from config import *
 import mesh
+import resources
 
 class ScreenQuad(mesh.Mesh):
     
@@ -21,6 +22,7 @@ class ScreenQuad(mesh.Mesh):
         self.vertex_count = 6
 
         glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        resources.gpu_resources.resize("buffer", self.vbo, vertices.nbytes)
 
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 8, ctypes.c_void_p(0))
\ No newline at end of file